@@ -0,0 +1,205 @@
+import argparse
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+# DATABASE LAYER BENCHMARKS
+# Seeds read.bookclub with synthetic rows, times the src.database functions
+# and writes the results as JSON, so runs from different commits can be
+# compared with --compare. Seeding TRUNCATES read.bookclub: point the .env
+# at a throwaway database.
+#
+#   python -m benchmarks.bench_db --rows 10000 --seed --yes -o base.json
+#   python -m benchmarks.bench_db --rows 10000 -o new.json --compare base.json
+
+SIZES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+
+# rows per INSERT ... SELECT while seeding, keeps transactions reasonable
+SEED_CHUNK = 500_000
+
+SEED_QUERY = """
+    INSERT INTO read.bookclub(
+        username,
+        title,
+        description,
+        status,
+        pct_read,
+        start_read_date,
+        end_read_date
+    )
+    SELECT
+        'user' || (g %% %(users)s),
+        'Book ' || g || ' ' || md5(g::text),
+        'Synthetic description ' || md5((g * 7)::text),
+        s.status::read.state,
+        CASE s.status WHEN 'complete' THEN 100 WHEN 'reading' THEN 1 + g %% 99 ELSE 0 END,
+        CASE WHEN s.status <> 'pending' THEN DATE '2020-01-01' + g %% 1000 END,
+        CASE WHEN s.status = 'complete' THEN DATE '2020-01-01' + g %% 1000 + g %% 90 END
+    FROM generate_series(%(first)s, %(last)s) AS g,
+    LATERAL (SELECT (ARRAY['pending', 'reading', 'complete'])[1 + g %% 3] AS status) AS s;
+"""
+
+
+def seed(rows: int, users: int) -> None:
+    import psycopg as pg
+    from src.database import Database, _conninfo, truncate_table
+
+    truncate_table()
+    with Database().connection() as conn:
+        for first in range(1, rows + 1, SEED_CHUNK):
+            last = min(first + SEED_CHUNK - 1, rows)
+            conn.execute(SEED_QUERY, {"users": users, "first": first, "last": last})
+            conn.commit()
+            print(f"seeded {last}/{rows} rows", file=sys.stderr)
+    # fresh statistics, otherwise the planner still thinks the table is empty
+    with pg.connect(_conninfo(), autocommit=True) as conn:
+        conn.execute("VACUUM ANALYZE read.bookclub")
+
+
+def measure(fn: Callable[[int], object], iterations: int) -> Dict[str, float]:
+    samples: List[float] = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - start)
+    total = sum(samples)
+    ms = sorted(s * 1000 for s in samples)
+    if len(ms) > 1:
+        q = statistics.quantiles(ms, n=100, method="inclusive")
+        p50, p95, p99 = q[49], q[94], q[98]
+    else:
+        p50 = p95 = p99 = ms[0]
+    return {
+        "iterations": iterations,
+        "mean_ms": statistics.fmean(ms),
+        "p50_ms": p50,
+        "p95_ms": p95,
+        "p99_ms": p99,
+        "max_ms": ms[-1],
+        "ops_per_s": iterations / total if total else 0.0,
+    }
+
+
+def run(rows: int, iterations: int) -> Dict[str, Dict[str, float]]:
+    from src import database as db
+    from src.schema import StatusEnum
+
+    rng = random.Random(42)
+    ids = [rng.randint(1, rows) for _ in range(iterations)]
+    results: Dict[str, Dict[str, float]] = {}
+
+    def uncached(fn: Callable[[int], object]) -> Callable[[int], object]:
+        # every call must reach postgres, not the in-process caches
+        def call(i: int) -> object:
+            db.book_cache.clear()
+            db.aggregate_cache.clear()
+            return fn(i)
+        return call
+
+    inserted: List[int] = []
+    results["insert_data"] = measure(
+        lambda i: inserted.append(db.insert_data({
+            "username": "bench",
+            "title": f"Bench book {i}",
+            "description": None,
+            "status": StatusEnum.pending,
+            "pct_read": 0,
+            "start_read_date": None,
+            "end_read_date": None,
+        })),
+        iterations,
+    )
+    results["fetch_by_id"] = measure(uncached(lambda i: db.fetch_by_id(ids[i])), iterations)
+    results["fetch_by_id_cached"] = measure(lambda i: db.fetch_by_id(ids[0]), iterations)
+    results["update_data"] = measure(
+        lambda i: db.update_data(inserted[i], "title", f"Bench book {i} v2"), iterations
+    )
+    results["delete_row"] = measure(lambda i: db.delete_row(inserted[i]), iterations)
+    results["count_completed_books"] = measure(
+        uncached(lambda i: db.count_completed_books("2020-01-01", "2021-12-31")), iterations
+    )
+    results["count_pending_books"] = measure(
+        uncached(lambda i: db.count_pending_books()), iterations
+    )
+    results["search_books_by_title"] = measure(
+        lambda i: db.search_books_by_title(f"Book {ids[i]}"), iterations
+    )
+    # one full pass over the table, rows/s is the interesting figure
+    scanned = [0]
+
+    def scan(i: int) -> None:
+        scanned[0] = sum(1 for _ in db.iter_table())
+
+    results["view_table"] = measure(scan, 1)
+    results["view_table"]["rows_per_s"] = scanned[0] / (results["view_table"]["mean_ms"] / 1000)
+    return results
+
+
+def metadata(rows: int) -> Dict[str, object]:
+    from src.database import Database
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    with Database().cursor() as cursor:
+        cursor.execute("SHOW server_version")
+        server_version = cursor.fetchone()[0]
+    return {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "rows": rows,
+        "python": platform.python_version(),
+        "postgres": server_version,
+    }
+
+
+def compare(current: Dict, baseline: Dict) -> None:
+    # mean latency change per function, negative is faster
+    print(f"{'function':<24}{'baseline ms':>14}{'current ms':>14}{'change':>10}")
+    for name, result in current["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            continue
+        change = (result["mean_ms"] - old["mean_ms"]) / old["mean_ms"] * 100
+        print(f"{name:<24}{old['mean_ms']:>14.3f}{result['mean_ms']:>14.3f}{change:>+9.1f}%")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the database layer")
+    parser.add_argument("--rows", default="10k", help="10k, 1m, 10m or a number")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--seed", action="store_true", help="truncate and reseed first")
+    parser.add_argument("--yes", action="store_true", help="confirm --seed truncating the table")
+    parser.add_argument("--output", "-o", default="bench_results.json")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    rows = SIZES.get(args.rows.lower()) or int(args.rows)
+    if args.seed:
+        if not args.yes:
+            parser.error("--seed truncates read.bookclub, add --yes to confirm")
+        seed(rows, args.users)
+
+    report = {"meta": metadata(rows), "results": run(rows, args.iterations)}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {args.output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
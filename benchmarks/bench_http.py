@@ -0,0 +1,110 @@
+import argparse
+import http.client
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+# HTTP API THROUGHPUT
+# Keeps --clients keep-alive connections busy against a running
+# `python -m src.cli serve` for --duration seconds and reports requests per
+# second and latency percentiles per endpoint. Seed the table first with
+# benchmarks.bench_db --seed so the ids exist.
+#
+#   python -m benchmarks.bench_http --clients 32 --duration 10 --rows 10000
+
+# path templates, {id} is replaced with a random book id per request
+ENDPOINTS = {
+    "get_book": "/books/{id}",
+    "get_book_etag": "/books/{id}",
+    "count_pending": "/counts/pending",
+    "search": "/search?q=Book+{id}",
+}
+
+
+def client(host: str, port: int, path: str, rows: int, deadline: float,
+           etag: bool, samples: List[float], errors: List[int]) -> None:
+    rng = random.Random()
+    conn = http.client.HTTPConnection(host, port)
+    etags: Dict[str, str] = {}
+    while time.perf_counter() < deadline:
+        url = path.format(id=rng.randint(1, rows))
+        headers = {"If-None-Match": etags[url]} if etag and url in etags else {}
+        start = time.perf_counter()
+        try:
+            conn.request("GET", url, headers=headers)
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            errors.append(1)
+            conn.close()
+            conn = http.client.HTTPConnection(host, port)
+            continue
+        samples.append(time.perf_counter() - start)
+        if response.status >= 400 and response.status != 404:
+            errors.append(1)
+        if etag and response.getheader("ETag"):
+            etags[url] = response.getheader("ETag")
+    conn.close()
+
+
+def run(host: str, port: int, name: str, clients: int, duration: float, rows: int) -> dict:
+    samples: List[float] = []
+    errors: List[int] = []
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(
+            target=client,
+            args=(host, port, ENDPOINTS[name], rows, deadline,
+                  name.endswith("_etag"), samples, errors),
+        )
+        for _ in range(clients)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    ms = sorted(s * 1000 for s in samples) or [0.0]
+    q = statistics.quantiles(ms, n=100, method="inclusive") if len(ms) > 1 else [ms[0]] * 99
+    return {
+        "requests": len(samples),
+        "errors": len(errors),
+        "requests_per_s": len(samples) / duration,
+        "p50_ms": q[49],
+        "p95_ms": q[94],
+        "p99_ms": q[98],
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the HTTP API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per endpoint")
+    parser.add_argument("--rows", type=int, default=10_000, help="ids are drawn from 1..rows")
+    parser.add_argument("--endpoint", action="append", choices=list(ENDPOINTS))
+    parser.add_argument("--output", "-o", help="also write the results as JSON")
+    args = parser.parse_args(argv)
+
+    results = {}
+    print(f"{'endpoint':<16}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name in args.endpoint or list(ENDPOINTS):
+        result = run(args.host, args.port, name, args.clients, args.duration, args.rows)
+        results[name] = result
+        print(
+            f"{name:<16}{result['requests_per_s']:>10.0f}{result['p50_ms']:>10.2f}"
+            f"{result['p99_ms']:>10.2f}{result['errors']:>8}"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"results written to {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,12 @@
+-- Creates the read schema from scratch. Afterwards, and after every
+-- upgrade, apply db/migrations with: python -m src.cli migrate
+
 -- CREATE SCHEMA
 CREATE SCHEMA IF NOT EXISTS read;
 
+-- trigram matching for the title search (installed in public)
+CREATE EXTENSION IF NOT EXISTS pg_trgm WITH SCHEMA public;
+
 -- set default schema 
 SET SEARCH_PATH TO read;
 
@@ -21,6 +27,11 @@ CREATE TABLE bookclub (
     pct_read SMALLINT NOT NULL DEFAULT 0,
     start_read_date DATE,
     end_read_date DATE,
+    -- full-text document over title and description, maintained by postgres
+    search_vector TSVECTOR GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', title), 'A') ||
+        setweight(to_tsvector('english', COALESCE(description, '')), 'B')
+    ) STORED,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     modified_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 
@@ -35,3 +46,57 @@ CREATE TABLE bookclub (
         pct_read BETWEEN 0 AND 99 AND status <> 'complete'
     )
 );
+
+-- trigram index so title searches (ILIKE '%...%' and similarity ranking)
+-- do not need a sequential scan
+CREATE INDEX bookclub_title_trgm_idx ON bookclub USING GIN (title public.gin_trgm_ops);
+
+-- full-text index used by the description search (search_vector @@ query)
+CREATE INDEX bookclub_search_vector_idx ON bookclub USING GIN (search_vector);
+
+-- publish changes on the bookclub_changes channel so every app process can
+-- drop its cached rows and counts. One notification per statement:
+-- {"op": "UPDATE", "ids": [...]}, ids is null for TRUNCATE and when the
+-- statement touched more rows than fit in a payload
+CREATE FUNCTION notify_bookclub_change() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    ids INTEGER[];
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        PERFORM pg_notify('bookclub_changes', json_build_object('op', TG_OP, 'ids', NULL)::text);
+        RETURN NULL;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(id) INTO ids FROM (SELECT id FROM old_rows LIMIT 501) AS changed;
+    ELSE
+        SELECT array_agg(id) INTO ids FROM (SELECT id FROM new_rows LIMIT 501) AS changed;
+    END IF;
+
+    -- statement did not touch any row
+    IF ids IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    -- notification payloads are limited to 8000 bytes
+    IF array_length(ids, 1) > 500 THEN
+        ids := NULL;
+    END IF;
+    PERFORM pg_notify('bookclub_changes', json_build_object('op', TG_OP, 'ids', ids)::text);
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER bookclub_notify_insert AFTER INSERT ON bookclub
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_bookclub_change();
+
+CREATE TRIGGER bookclub_notify_update AFTER UPDATE ON bookclub
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_bookclub_change();
+
+CREATE TRIGGER bookclub_notify_delete AFTER DELETE ON bookclub
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_bookclub_change();
+
+CREATE TRIGGER bookclub_notify_truncate AFTER TRUNCATE ON bookclub
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_bookclub_change();
@@ -0,0 +1,8 @@
+-- migrate: no-transaction
+-- trigram index for the ranked title search (already in create.sql for new
+-- installs). Built CONCURRENTLY so writes continue while it builds. If the
+-- build fails it leaves an INVALID index: drop it before running again.
+CREATE EXTENSION IF NOT EXISTS pg_trgm WITH SCHEMA public;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS bookclub_title_trgm_idx
+    ON read.bookclub USING GIN (title public.gin_trgm_ops);
@@ -0,0 +1,8 @@
+-- full-text document over title and description (already in create.sql for
+-- new installs). Adding a stored generated column rewrites the table under
+-- an exclusive lock: run it in a quiet period on large tables.
+ALTER TABLE read.bookclub ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', title), 'A') ||
+        setweight(to_tsvector('english', COALESCE(description, '')), 'B')
+    ) STORED;
@@ -0,0 +1,3 @@
+-- migrate: no-transaction
+CREATE INDEX CONCURRENTLY IF NOT EXISTS bookclub_search_vector_idx
+    ON read.bookclub USING GIN (search_vector);
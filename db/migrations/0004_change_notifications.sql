@@ -0,0 +1,51 @@
+-- change notifications for cache invalidation (already in create.sql for
+-- new installs). Publishes changes on the bookclub_changes channel so every
+-- app process can drop its cached rows and counts. One notification per statement:
+-- {"op": "UPDATE", "ids": [...]}, ids is null for TRUNCATE and when the
+-- statement touched more rows than fit in a payload
+CREATE OR REPLACE FUNCTION read.notify_bookclub_change() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    ids INTEGER[];
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        PERFORM pg_notify('bookclub_changes', json_build_object('op', TG_OP, 'ids', NULL)::text);
+        RETURN NULL;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(id) INTO ids FROM (SELECT id FROM old_rows LIMIT 501) AS changed;
+    ELSE
+        SELECT array_agg(id) INTO ids FROM (SELECT id FROM new_rows LIMIT 501) AS changed;
+    END IF;
+
+    -- statement did not touch any row
+    IF ids IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    -- notification payloads are limited to 8000 bytes
+    IF array_length(ids, 1) > 500 THEN
+        ids := NULL;
+    END IF;
+    PERFORM pg_notify('bookclub_changes', json_build_object('op', TG_OP, 'ids', ids)::text);
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS bookclub_notify_insert ON read.bookclub;
+CREATE TRIGGER bookclub_notify_insert AFTER INSERT ON read.bookclub
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION read.notify_bookclub_change();
+
+DROP TRIGGER IF EXISTS bookclub_notify_update ON read.bookclub;
+CREATE TRIGGER bookclub_notify_update AFTER UPDATE ON read.bookclub
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION read.notify_bookclub_change();
+
+DROP TRIGGER IF EXISTS bookclub_notify_delete ON read.bookclub;
+CREATE TRIGGER bookclub_notify_delete AFTER DELETE ON read.bookclub
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION read.notify_bookclub_change();
+
+DROP TRIGGER IF EXISTS bookclub_notify_truncate ON read.bookclub;
+CREATE TRIGGER bookclub_notify_truncate AFTER TRUNCATE ON read.bookclub
+    FOR EACH STATEMENT EXECUTE FUNCTION read.notify_bookclub_change();
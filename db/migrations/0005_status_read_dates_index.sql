@@ -0,0 +1,5 @@
+-- migrate: no-transaction
+-- serves the status filters of the counts and listings, and the
+-- start/end read date range of count_completed_books
+CREATE INDEX CONCURRENTLY IF NOT EXISTS bookclub_status_read_dates_idx
+    ON read.bookclub (status, start_read_date, end_read_date);
@@ -0,0 +1,4 @@
+-- migrate: no-transaction
+-- per-user queries (reading_stats, per-user status counts)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS bookclub_username_status_idx
+    ON read.bookclub (username, status);
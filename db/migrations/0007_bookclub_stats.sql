@@ -0,0 +1,117 @@
+-- summary tables kept up to date by triggers, so status counts and
+-- month-aligned completion counts do not scan read.bookclub:
+--   bookclub_stats: books per user and status
+--   bookclub_completion_stats: completed books per user, start month and
+--   end month (summing over start_month gives completions per month)
+-- Creating the triggers blocks writes to bookclub until the backfill below
+-- commits, so the counts start out exact.
+
+CREATE TABLE IF NOT EXISTS read.bookclub_stats (
+    username VARCHAR(50) NOT NULL,
+    status read.state NOT NULL,
+    books BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (username, status)
+);
+
+CREATE TABLE IF NOT EXISTS read.bookclub_completion_stats (
+    username VARCHAR(50) NOT NULL,
+    start_month DATE NOT NULL,
+    end_month DATE NOT NULL,
+    books BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (username, start_month, end_month)
+);
+
+-- statement level, with transition tables: a COPY of a million rows
+-- updates each summary row once instead of a million times
+CREATE OR REPLACE FUNCTION read.bookclub_stats_apply() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        DELETE FROM read.bookclub_stats;
+        DELETE FROM read.bookclub_completion_stats;
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO read.bookclub_stats AS s (username, status, books)
+        SELECT username, status, -COUNT(*)
+        FROM old_rows
+        GROUP BY username, status
+        ON CONFLICT (username, status) DO UPDATE SET books = s.books + EXCLUDED.books;
+
+        INSERT INTO read.bookclub_completion_stats AS s (username, start_month, end_month, books)
+        SELECT
+            username,
+            date_trunc('month', start_read_date)::date,
+            date_trunc('month', end_read_date)::date,
+            -COUNT(*)
+        FROM old_rows
+        WHERE status = 'complete'
+        AND start_read_date IS NOT NULL
+        AND end_read_date IS NOT NULL
+        GROUP BY 1, 2, 3
+        ON CONFLICT (username, start_month, end_month) DO UPDATE SET books = s.books + EXCLUDED.books;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO read.bookclub_stats AS s (username, status, books)
+        SELECT username, status, COUNT(*)
+        FROM new_rows
+        GROUP BY username, status
+        ON CONFLICT (username, status) DO UPDATE SET books = s.books + EXCLUDED.books;
+
+        INSERT INTO read.bookclub_completion_stats AS s (username, start_month, end_month, books)
+        SELECT
+            username,
+            date_trunc('month', start_read_date)::date,
+            date_trunc('month', end_read_date)::date,
+            COUNT(*)
+        FROM new_rows
+        WHERE status = 'complete'
+        AND start_read_date IS NOT NULL
+        AND end_read_date IS NOT NULL
+        GROUP BY 1, 2, 3
+        ON CONFLICT (username, start_month, end_month) DO UPDATE SET books = s.books + EXCLUDED.books;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS bookclub_stats_insert ON read.bookclub;
+CREATE TRIGGER bookclub_stats_insert AFTER INSERT ON read.bookclub
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION read.bookclub_stats_apply();
+
+DROP TRIGGER IF EXISTS bookclub_stats_update ON read.bookclub;
+CREATE TRIGGER bookclub_stats_update AFTER UPDATE ON read.bookclub
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION read.bookclub_stats_apply();
+
+DROP TRIGGER IF EXISTS bookclub_stats_delete ON read.bookclub;
+CREATE TRIGGER bookclub_stats_delete AFTER DELETE ON read.bookclub
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION read.bookclub_stats_apply();
+
+DROP TRIGGER IF EXISTS bookclub_stats_truncate ON read.bookclub;
+CREATE TRIGGER bookclub_stats_truncate AFTER TRUNCATE ON read.bookclub
+    FOR EACH STATEMENT EXECUTE FUNCTION read.bookclub_stats_apply();
+
+-- backfill from the existing rows
+DELETE FROM read.bookclub_stats;
+INSERT INTO read.bookclub_stats (username, status, books)
+SELECT username, status, COUNT(*)
+FROM read.bookclub
+GROUP BY username, status;
+
+DELETE FROM read.bookclub_completion_stats;
+INSERT INTO read.bookclub_completion_stats (username, start_month, end_month, books)
+SELECT
+    username,
+    date_trunc('month', start_read_date)::date,
+    date_trunc('month', end_read_date)::date,
+    COUNT(*)
+FROM read.bookclub
+WHERE status = 'complete'
+AND start_read_date IS NOT NULL
+AND end_read_date IS NOT NULL
+GROUP BY 1, 2, 3;
@@ -0,0 +1,115 @@
+-- hash-partition read.bookclub on username, so queries scoped to one user
+-- only touch that user's partition (and its indexes). The table is rebuilt:
+-- every row is copied under an exclusive lock, so run it in a quiet period
+-- on large tables. Ids keep coming from the same sequence.
+-- A partitioned table's unique keys must contain the partition key, so the
+-- primary key becomes (id, username); ids stay unique through the sequence.
+
+LOCK TABLE read.bookclub IN ACCESS EXCLUSIVE MODE;
+
+CREATE TABLE read.bookclub_partitioned (
+    id INTEGER NOT NULL DEFAULT nextval('read.bookclub_id_seq'),
+    username VARCHAR(50) NOT NULL,
+    title VARCHAR(300) NOT NULL,
+    description TEXT,
+    status read.state NOT NULL DEFAULT 'pending',
+    pct_read SMALLINT NOT NULL DEFAULT 0,
+    start_read_date DATE,
+    end_read_date DATE,
+    search_vector TSVECTOR GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', title), 'A') ||
+        setweight(to_tsvector('english', COALESCE(description, '')), 'B')
+    ) STORED,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    modified_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CHECK(
+        pct_read = 100 AND status = 'complete'
+        OR
+        pct_read BETWEEN 0 AND 99 AND status <> 'complete'
+    )
+) PARTITION BY HASH (username);
+
+-- 16 partitions: bookclub_p00 .. bookclub_p15
+DO $$
+BEGIN
+    FOR i IN 0..15 LOOP
+        EXECUTE format(
+            'CREATE TABLE read.bookclub_p%s PARTITION OF read.bookclub_partitioned '
+            'FOR VALUES WITH (MODULUS 16, REMAINDER %s)',
+            lpad(i::text, 2, '0'), i
+        );
+    END LOOP;
+END;
+$$;
+
+-- no triggers on the new table yet: the summary tables already count these rows
+INSERT INTO read.bookclub_partitioned (
+    id,
+    username,
+    title,
+    description,
+    status,
+    pct_read,
+    start_read_date,
+    end_read_date,
+    created_at,
+    modified_at
+)
+SELECT
+    id,
+    username,
+    title,
+    description,
+    status,
+    pct_read,
+    start_read_date,
+    end_read_date,
+    created_at,
+    modified_at
+FROM read.bookclub;
+
+ALTER SEQUENCE read.bookclub_id_seq OWNED BY read.bookclub_partitioned.id;
+DROP TABLE read.bookclub;
+ALTER TABLE read.bookclub_partitioned RENAME TO bookclub;
+
+-- indexes on the parent are created on every partition
+ALTER TABLE read.bookclub ADD CONSTRAINT bookclub_pkey PRIMARY KEY (id, username);
+CREATE INDEX bookclub_title_trgm_idx ON read.bookclub USING GIN (title public.gin_trgm_ops);
+CREATE INDEX bookclub_search_vector_idx ON read.bookclub USING GIN (search_vector);
+CREATE INDEX bookclub_status_read_dates_idx
+    ON read.bookclub (status, start_read_date, end_read_date);
+CREATE INDEX bookclub_username_status_idx ON read.bookclub (username, status);
+
+-- statement triggers with transition tables on the parent see the rows of
+-- every partition (functions from 0004 and 0007)
+CREATE TRIGGER bookclub_notify_insert AFTER INSERT ON read.bookclub
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION read.notify_bookclub_change();
+
+CREATE TRIGGER bookclub_notify_update AFTER UPDATE ON read.bookclub
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION read.notify_bookclub_change();
+
+CREATE TRIGGER bookclub_notify_delete AFTER DELETE ON read.bookclub
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION read.notify_bookclub_change();
+
+CREATE TRIGGER bookclub_notify_truncate AFTER TRUNCATE ON read.bookclub
+    FOR EACH STATEMENT EXECUTE FUNCTION read.notify_bookclub_change();
+
+CREATE TRIGGER bookclub_stats_insert AFTER INSERT ON read.bookclub
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION read.bookclub_stats_apply();
+
+CREATE TRIGGER bookclub_stats_update AFTER UPDATE ON read.bookclub
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION read.bookclub_stats_apply();
+
+CREATE TRIGGER bookclub_stats_delete AFTER DELETE ON read.bookclub
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION read.bookclub_stats_apply();
+
+CREATE TRIGGER bookclub_stats_truncate AFTER TRUNCATE ON read.bookclub
+    FOR EACH STATEMENT EXECUTE FUNCTION read.bookclub_stats_apply();
+
+ANALYZE read.bookclub;
@@ -0,0 +1,63 @@
+-- completed books that finished reading long ago are moved here by the
+-- archive job (src/archive.py), so read.bookclub only holds the working set.
+-- Same columns, so the live and archived books can be queried as one.
+-- Archived rows keep counting in the summary tables of 0007: the archive
+-- has the same stats triggers, moving a book is a -1 there and a +1 here.
+-- It has no TRUNCATE trigger, truncate it only together with read.bookclub.
+
+CREATE TABLE IF NOT EXISTS read.bookclub_archive (
+    id INTEGER NOT NULL,
+    username VARCHAR(50) NOT NULL,
+    title VARCHAR(300) NOT NULL,
+    description TEXT,
+    status read.state NOT NULL,
+    pct_read SMALLINT NOT NULL,
+    start_read_date DATE,
+    end_read_date DATE,
+    search_vector TSVECTOR GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', title), 'A') ||
+        setweight(to_tsvector('english', COALESCE(description, '')), 'B')
+    ) STORED,
+    created_at TIMESTAMP,
+    modified_at TIMESTAMP,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, username)
+);
+
+CREATE INDEX IF NOT EXISTS bookclub_archive_title_trgm_idx
+    ON read.bookclub_archive USING GIN (title public.gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS bookclub_archive_search_vector_idx
+    ON read.bookclub_archive USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS bookclub_archive_status_read_dates_idx
+    ON read.bookclub_archive (status, start_read_date, end_read_date);
+CREATE INDEX IF NOT EXISTS bookclub_archive_username_status_idx
+    ON read.bookclub_archive (username, status);
+-- max(end_read_date): how far back the live table reaches
+CREATE INDEX IF NOT EXISTS bookclub_archive_end_read_date_idx
+    ON read.bookclub_archive (end_read_date);
+
+DROP TRIGGER IF EXISTS bookclub_archive_stats_insert ON read.bookclub_archive;
+CREATE TRIGGER bookclub_archive_stats_insert AFTER INSERT ON read.bookclub_archive
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION read.bookclub_stats_apply();
+
+DROP TRIGGER IF EXISTS bookclub_archive_stats_update ON read.bookclub_archive;
+CREATE TRIGGER bookclub_archive_stats_update AFTER UPDATE ON read.bookclub_archive
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION read.bookclub_stats_apply();
+
+DROP TRIGGER IF EXISTS bookclub_archive_stats_delete ON read.bookclub_archive;
+CREATE TRIGGER bookclub_archive_stats_delete AFTER DELETE ON read.bookclub_archive
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION read.bookclub_stats_apply();
+
+-- archived books are cached like live ones, deleting them must reach
+-- the other processes too (inserts are announced by the live delete)
+DROP TRIGGER IF EXISTS bookclub_archive_notify_delete ON read.bookclub_archive;
+CREATE TRIGGER bookclub_archive_notify_delete AFTER DELETE ON read.bookclub_archive
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION read.notify_bookclub_change();
+
+DROP TRIGGER IF EXISTS bookclub_archive_notify_truncate ON read.bookclub_archive;
+CREATE TRIGGER bookclub_archive_notify_truncate AFTER TRUNCATE ON read.bookclub_archive
+    FOR EACH STATEMENT EXECUTE FUNCTION read.notify_bookclub_change();
@@ -0,0 +1,143 @@
+-- migrate: no-transaction
+-- (username, title) becomes the natural key of a book, so imports can
+-- upsert instead of piling up duplicates (see sync_many in src/database.py).
+--
+-- Duplicates already in the table are moved to read.bookclub_duplicates
+-- first, the most recently modified copy (then the highest id) of each
+-- book stays. The migration reports how many were moved; review them
+-- there and drop the table once done.
+--
+-- A unique index on a partitioned table cannot be built CONCURRENTLY, so it
+-- is created on the parent only (invalid, and instant), then built without
+-- blocking writes on each partition of 0008 and attached; the parent index
+-- turns valid once all 16 are attached. Should a concurrent build fail,
+-- drop the invalid index it leaves behind and run the migration again.
+
+CREATE TABLE IF NOT EXISTS read.bookclub_duplicates (
+    id INTEGER NOT NULL,
+    username VARCHAR(50) NOT NULL,
+    title VARCHAR(300) NOT NULL,
+    description TEXT,
+    status read.state NOT NULL,
+    pct_read SMALLINT NOT NULL,
+    start_read_date DATE,
+    end_read_date DATE,
+    created_at TIMESTAMP,
+    modified_at TIMESTAMP,
+    removed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, username)
+);
+
+DO $$
+DECLARE
+    moved BIGINT;
+BEGIN
+    WITH removed AS (
+        DELETE FROM read.bookclub AS b
+        USING (
+            SELECT id, username, row_number() OVER (
+                PARTITION BY username, title ORDER BY modified_at DESC NULLS LAST, id DESC
+            ) AS copy
+            FROM read.bookclub
+        ) AS d
+        WHERE b.id = d.id AND b.username = d.username AND d.copy > 1
+        RETURNING b.id, b.username, b.title, b.description, b.status, b.pct_read,
+            b.start_read_date, b.end_read_date, b.created_at, b.modified_at
+    )
+    INSERT INTO read.bookclub_duplicates (
+        id, username, title, description, status, pct_read,
+        start_read_date, end_read_date, created_at, modified_at
+    )
+    SELECT * FROM removed;
+    GET DIAGNOSTICS moved = ROW_COUNT;
+    IF moved > 0 THEN
+        RAISE NOTICE '% duplicate book(s) moved to read.bookclub_duplicates', moved;
+    END IF;
+END $$;
+
+CREATE UNIQUE INDEX IF NOT EXISTS bookclub_username_title_key
+    ON ONLY read.bookclub (username, title);
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS bookclub_p00_username_title_key
+    ON read.bookclub_p00 (username, title);
+ALTER INDEX read.bookclub_username_title_key
+    ATTACH PARTITION read.bookclub_p00_username_title_key;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS bookclub_p01_username_title_key
+    ON read.bookclub_p01 (username, title);
+ALTER INDEX read.bookclub_username_title_key
+    ATTACH PARTITION read.bookclub_p01_username_title_key;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS bookclub_p02_username_title_key
+    ON read.bookclub_p02 (username, title);
+ALTER INDEX read.bookclub_username_title_key
+    ATTACH PARTITION read.bookclub_p02_username_title_key;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS bookclub_p03_username_title_key
+    ON read.bookclub_p03 (username, title);
+ALTER INDEX read.bookclub_username_title_key
+    ATTACH PARTITION read.bookclub_p03_username_title_key;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS bookclub_p04_username_title_key
+    ON read.bookclub_p04 (username, title);
+ALTER INDEX read.bookclub_username_title_key
+    ATTACH PARTITION read.bookclub_p04_username_title_key;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS bookclub_p05_username_title_key
+    ON read.bookclub_p05 (username, title);
+ALTER INDEX read.bookclub_username_title_key
+    ATTACH PARTITION read.bookclub_p05_username_title_key;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS bookclub_p06_username_title_key
+    ON read.bookclub_p06 (username, title);
+ALTER INDEX read.bookclub_username_title_key
+    ATTACH PARTITION read.bookclub_p06_username_title_key;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS bookclub_p07_username_title_key
+    ON read.bookclub_p07 (username, title);
+ALTER INDEX read.bookclub_username_title_key
+    ATTACH PARTITION read.bookclub_p07_username_title_key;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS bookclub_p08_username_title_key
+    ON read.bookclub_p08 (username, title);
+ALTER INDEX read.bookclub_username_title_key
+    ATTACH PARTITION read.bookclub_p08_username_title_key;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS bookclub_p09_username_title_key
+    ON read.bookclub_p09 (username, title);
+ALTER INDEX read.bookclub_username_title_key
+    ATTACH PARTITION read.bookclub_p09_username_title_key;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS bookclub_p10_username_title_key
+    ON read.bookclub_p10 (username, title);
+ALTER INDEX read.bookclub_username_title_key
+    ATTACH PARTITION read.bookclub_p10_username_title_key;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS bookclub_p11_username_title_key
+    ON read.bookclub_p11 (username, title);
+ALTER INDEX read.bookclub_username_title_key
+    ATTACH PARTITION read.bookclub_p11_username_title_key;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS bookclub_p12_username_title_key
+    ON read.bookclub_p12 (username, title);
+ALTER INDEX read.bookclub_username_title_key
+    ATTACH PARTITION read.bookclub_p12_username_title_key;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS bookclub_p13_username_title_key
+    ON read.bookclub_p13 (username, title);
+ALTER INDEX read.bookclub_username_title_key
+    ATTACH PARTITION read.bookclub_p13_username_title_key;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS bookclub_p14_username_title_key
+    ON read.bookclub_p14 (username, title);
+ALTER INDEX read.bookclub_username_title_key
+    ATTACH PARTITION read.bookclub_p14_username_title_key;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS bookclub_p15_username_title_key
+    ON read.bookclub_p15 (username, title);
+ALTER INDEX read.bookclub_username_title_key
+    ATTACH PARTITION read.bookclub_p15_username_title_key;
+
+-- the upsert leaves books that were archived (0009) alone
+CREATE INDEX CONCURRENTLY IF NOT EXISTS bookclub_archive_username_title_idx
+    ON read.bookclub_archive (username, title);
@@ -0,0 +1,347 @@
+import csv
+import json
+from datetime import date
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+import numpy as np
+from src.schema import StatusEnum
+
+# READING ANALYTICS
+# books are loaded once into NumPy column arrays (from a COPY stream or an
+# export file) and every metric is computed over whole columns, so the cost
+# per book is a few machine instructions rather than a Python loop
+
+# status codes index into this list
+STATUSES = [status.value for status in StatusEnum]
+COMPLETE = STATUSES.index(StatusEnum.complete.value)
+READING = STATUSES.index(StatusEnum.reading.value)
+
+# upper bounds (in days) of the time-to-complete histogram buckets
+DURATION_BUCKETS = [7, 14, 30, 60, 90, 180, 365]
+
+# average month length, to turn a span of days into months
+DAYS_PER_MONTH = 30.4375
+
+
+class BookColumns(NamedTuple):
+    usernames: np.ndarray  # distinct usernames, user codes index into it
+    user: np.ndarray  # int32 user code per book
+    status: np.ndarray  # int8 index into STATUSES
+    pct_read: np.ndarray  # int16
+    start: np.ndarray  # datetime64[D], NaT when unknown
+    end: np.ndarray  # datetime64[D], NaT when unknown
+
+    def __len__(self) -> int:
+        return len(self.user)
+
+
+class _ColumnBuilder:
+    # collects rows of (username, status, pct_read, start, end) and turns
+    # them into arrays every chunk_size rows, so the Python objects of at
+    # most one chunk are alive at a time
+
+    def __init__(self, chunk_size: int = 100_000):
+        self.chunk_size = chunk_size
+        self.user_codes: Dict[str, int] = {}
+        self.status_codes = {status: code for code, status in enumerate(STATUSES)}
+        self.chunks: List[Tuple[np.ndarray, ...]] = []
+        self.rows: List[list] = [[], [], [], [], []]
+
+    def add(self, username, status, pct_read, start, end) -> None:
+        user, statuses, pcts, starts, ends = self.rows
+        code = self.status_codes.get(status)
+        if code is None:
+            raise ValueError(f"unknown status {status!r}")
+        user.append(self.user_codes.setdefault(username, len(self.user_codes)))
+        statuses.append(code)
+        pcts.append(pct_read)
+        # '' (CSV) and None both mean no date
+        starts.append(start or None)
+        ends.append(end or None)
+        if len(user) >= self.chunk_size:
+            self.flush()
+
+    def flush(self) -> None:
+        user, statuses, pcts, starts, ends = self.rows
+        if not user:
+            return
+        self.chunks.append((
+            np.array(user, dtype=np.int32),
+            np.array(statuses, dtype=np.int8),
+            np.array(pcts, dtype=np.int16),
+            np.array(starts, dtype="datetime64[D]"),
+            np.array(ends, dtype="datetime64[D]"),
+        ))
+        self.rows = [[], [], [], [], []]
+
+    def build(self) -> BookColumns:
+        self.flush()
+        usernames = np.array(list(self.user_codes), dtype=object)
+        if not self.chunks:
+            return BookColumns(
+                usernames,
+                np.empty(0, np.int32),
+                np.empty(0, np.int8),
+                np.empty(0, np.int16),
+                np.empty(0, "datetime64[D]"),
+                np.empty(0, "datetime64[D]"),
+            )
+        return BookColumns(usernames, *(np.concatenate(c) for c in zip(*self.chunks)))
+
+
+def from_rows(rows: Iterable[tuple], chunk_size: int = 100_000) -> BookColumns:
+    # rows of (username, status, pct_read, start_read_date, end_read_date)
+    builder = _ColumnBuilder(chunk_size)
+    for row in rows:
+        builder.add(*row)
+    return builder.build()
+
+
+def load_books(
+    username: Optional[str] = None,
+    start_date=None,
+    end_date=None,
+    chunk_size: int = 100_000,
+) -> BookColumns:
+    # straight from a binary COPY of only the columns the metrics need
+    from src.database import _archived, read_pool
+    from src.queries import ANALYTICS_COLUMNS, ANALYTICS_COPY_TYPES, COPY_BINARY_QUERY, export_select
+
+    select, params = export_select(
+        username,
+        start_date=start_date,
+        end_date=end_date,
+        columns=ANALYTICS_COLUMNS,
+        ordered=False,
+        archived=_archived(start_date),
+    )
+    with read_pool().cursor() as cursor:
+        with cursor.copy(COPY_BINARY_QUERY.format(select=select), params) as copy:
+            copy.set_types(ANALYTICS_COPY_TYPES)
+            return from_rows(copy.rows(), chunk_size)
+
+
+# the columns analytics reads from an export file
+FILE_COLUMNS = ("username", "status", "pct_read", "start_read_date", "end_read_date")
+
+
+def _load_parquet(path: Union[str, Path]) -> BookColumns:
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(path, columns=list(FILE_COLUMNS))
+    usernames, user = np.unique(
+        table.column("username").to_numpy(zero_copy_only=False), return_inverse=True
+    )
+    status = table.column("status").to_numpy(zero_copy_only=False)
+    status_codes = np.full(len(status), -1, dtype=np.int8)
+    for code, value in enumerate(STATUSES):
+        status_codes[status == value] = code
+    unknown = np.flatnonzero(status_codes == -1)
+    if len(unknown):
+        raise ValueError(f"row {unknown[0] + 1}: unknown status {status[unknown[0]]!r}")
+    return BookColumns(
+        usernames.astype(object),
+        user.astype(np.int32),
+        status_codes,
+        table.column("pct_read").to_numpy(zero_copy_only=False).astype(np.int16),
+        table.column("start_read_date").to_numpy(zero_copy_only=False).astype("datetime64[D]"),
+        table.column("end_read_date").to_numpy(zero_copy_only=False).astype("datetime64[D]"),
+    )
+
+
+def load_file(path: Union[str, Path], chunk_size: int = 100_000) -> BookColumns:
+    # a file written by `export`: CSV, JSONL or Parquet
+    from src.export import export_format
+
+    fmt = export_format(path, default="")
+    if fmt == "parquet":
+        return _load_parquet(path)
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            reader = csv.DictReader(f)
+            records = ((reader.line_num, record) for record in reader)
+        elif fmt == "jsonl":
+            records = _jsonl_records(f)
+        else:
+            raise ValueError(f"Unsupported analytics file type: {Path(path).suffix or path}")
+        builder = _ColumnBuilder(chunk_size)
+        for line, record in records:
+            try:
+                builder.add(*_file_row(record))
+            except ValueError as e:
+                # as in src.ingest, errors name the line
+                raise ValueError(f"line {line}: {e}") from None
+        return builder.build()
+
+
+def _jsonl_records(f) -> Iterable[Tuple[int, dict]]:
+    for line, text in enumerate(f, start=1):
+        if not text.strip():
+            continue
+        try:
+            yield line, json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"line {line}: invalid JSON: {e.msg}") from None
+
+
+def _file_row(record) -> tuple:
+    if not isinstance(record, dict):
+        raise ValueError("record is not an object")
+    missing = [column for column in FILE_COLUMNS if column not in record]
+    if missing:
+        raise ValueError(f"{', '.join(missing)} missing")
+    return tuple(record[column] for column in FILE_COLUMNS)
+
+
+def for_user(books: BookColumns, username: str) -> BookColumns:
+    # the books of one user, e.g. out of an export of everyone's
+    codes = np.flatnonzero(books.usernames == username)
+    mask = books.user == (codes[0] if len(codes) else -1)
+    return BookColumns(
+        books.usernames[codes],
+        np.zeros(int(mask.sum()), dtype=np.int32),
+        books.status[mask],
+        books.pct_read[mask],
+        books.start[mask],
+        books.end[mask],
+    )
+
+
+def _per_user(ufunc, user: np.ndarray, values: np.ndarray, n: int, initial) -> np.ndarray:
+    # ufunc.reduceat over the books of each user; users without any get initial
+    out = np.full(n, initial, dtype=values.dtype)
+    if len(user):
+        order = np.argsort(user, kind="stable")
+        user, values = user[order], values[order]
+        starts = np.flatnonzero(np.r_[True, user[1:] != user[:-1]])
+        out[user[starts]] = ufunc.reduceat(values, starts)
+    return out
+
+
+def _days(dates: np.ndarray) -> np.ndarray:
+    return dates.astype("datetime64[D]").astype(np.int64)
+
+
+def _months(dates: np.ndarray) -> np.ndarray:
+    return dates.astype("datetime64[M]").astype(np.int64)
+
+
+def _month_label(month: int) -> str:
+    return str(np.datetime64(int(month), "M"))
+
+
+def _completed(books: BookColumns) -> np.ndarray:
+    return (books.status == COMPLETE) & ~np.isnat(books.end)
+
+
+def time_to_complete(books: BookColumns) -> dict:
+    # days from start to end of reading, for completed books with both dates
+    mask = _completed(books) & ~np.isnat(books.start)
+    days = (books.end[mask] - books.start[mask]).astype(np.int64)
+    days = days[days >= 0]
+    edges = [0] + DURATION_BUCKETS + [np.iinfo(np.int64).max]
+    counts, _ = np.histogram(days, bins=edges)
+    labels = [f"<{upper}d" for upper in DURATION_BUCKETS] + [f">={DURATION_BUCKETS[-1]}d"]
+    result = {"books": int(len(days)), "distribution": list(zip(labels, counts.tolist()))}
+    if len(days):
+        p50, p90, p99 = np.percentile(days, [50, 90, 99])
+        result.update(
+            mean_days=float(days.mean()),
+            median_days=float(p50),
+            p90_days=float(p90),
+            p99_days=float(p99),
+            max_days=int(days.max()),
+        )
+    return result
+
+
+def reading_velocity(books: BookColumns) -> List[Tuple[str, int, float]]:
+    # (username, completed books, books per month) fastest readers first;
+    # the months run from the first start (or end) to the last end
+    mask = _completed(books)
+    user = books.user[mask]
+    end = _days(books.end[mask])
+    start = np.where(np.isnat(books.start[mask]), end, _days(books.start[mask]))
+    n = len(books.usernames)
+    completed = np.bincount(user, minlength=n)
+    first = _per_user(np.minimum, user, start, n, np.iinfo(np.int64).max)
+    last = _per_user(np.maximum, user, end, n, np.iinfo(np.int64).min)
+    active = completed > 0
+    months = np.maximum(last[active] - first[active], 1) / DAYS_PER_MONTH
+    # a user who read everything within days did not read 30 books a month
+    velocity = completed[active] / np.maximum(months, 1.0)
+    order = np.argsort(-velocity, kind="stable")
+    return [
+        (str(name), int(count), round(float(v), 2))
+        for name, count, v in zip(
+            books.usernames[active][order], completed[active][order], velocity[order]
+        )
+    ]
+
+
+def streaks(books: BookColumns, today: Optional[date] = None) -> List[Tuple[str, int, int]]:
+    # (username, longest, current) runs of consecutive months with at least
+    # one completed book; a current streak ends this month or last month
+    today = today or date.today()
+    mask = _completed(books)
+    months = _months(books.end[mask])
+    if not len(months):
+        return []
+    offset = months.min()
+    span = int(months.max() - offset) + 1
+    # one key per (user, month), sorted by user then month
+    keys = np.unique(books.user[mask].astype(np.int64) * span + (months - offset))
+    user, month = keys // span, keys % span + offset
+    new_run = np.r_[True, (user[1:] != user[:-1]) | (np.diff(month) != 1)]
+    starts = np.flatnonzero(new_run)
+    lengths = np.diff(np.r_[starts, len(keys)])
+    run_user = user[starts]
+    run_last = month[np.r_[starts[1:], len(keys)] - 1]
+    this_month = _months(np.array([today], dtype="datetime64[D]"))[0]
+    current = np.where(run_last >= this_month - 1, lengths, 0)
+    n = len(books.usernames)
+    longest = _per_user(np.maximum, run_user, lengths, n, 0)
+    current = _per_user(np.maximum, run_user, current, n, 0)
+    readers = np.flatnonzero(longest)
+    order = readers[np.lexsort((-current[readers], -longest[readers]))]
+    return [(str(books.usernames[i]), int(longest[i]), int(current[i])) for i in order]
+
+
+def completion_forecast(
+    books: BookColumns, today: Optional[date] = None, horizon_days: int = 90
+) -> List[Tuple[str, int]]:
+    # ("YYYY-MM", books) expected to be finished within the horizon, keeping
+    # the pace each book in progress has had since its start
+    today_day = _days(np.array([today or date.today()], dtype="datetime64[D]"))[0]
+    mask = (
+        (books.status == READING)
+        & ~np.isnat(books.start)
+        & (books.pct_read > 0)
+        & (books.pct_read < 100)
+    )
+    elapsed = np.maximum(today_day - _days(books.start[mask]), 1)
+    pct = books.pct_read[mask].astype(np.float64)
+    remaining = np.ceil(elapsed * (100.0 - pct) / pct).astype(np.int64)
+    finish = today_day + remaining
+    finish = finish[finish <= today_day + horizon_days]
+    months, counts = np.unique(_months(finish.astype("datetime64[D]")), return_counts=True)
+    return [(_month_label(m), int(c)) for m, c in zip(months, counts)]
+
+
+def completions_per_month(books: BookColumns) -> List[Tuple[str, int]]:
+    months, counts = np.unique(_months(books.end[_completed(books)]), return_counts=True)
+    return [(_month_label(m), int(c)) for m, c in zip(months, counts)]
+
+
+def summary(books: BookColumns, today: Optional[date] = None, horizon_days: int = 90) -> dict:
+    status_counts = np.bincount(books.status[books.status >= 0], minlength=len(STATUSES))
+    return {
+        "books": len(books),
+        "users": len(books.usernames),
+        "status_counts": dict(zip(STATUSES, status_counts.tolist())),
+        "completions_per_month": completions_per_month(books),
+        "time_to_complete": time_to_complete(books),
+        "velocity": reading_velocity(books),
+        "streaks": streaks(books, today),
+        "forecast": completion_forecast(books, today, horizon_days),
+    }
@@ -1,11 +1,10 @@
+import os
 import sys
 import time
 from datetime import date
 from typing import Optional
-from tabulate import tabulate
 from collections import namedtuple
-from tqdm import tqdm
-from src.schema import StatusEnum, CreateDataType, FetchByIdDataType
+from src.schema import Book, StatusEnum, CreateDataType, DuplicateBookError, ReadingStats
 from src.database import (
     insert_data,
     fetch_by_id,
@@ -16,7 +15,25 @@ from src.database import (
     count_completed_books,
     count_pending_books,
     search_books_by_title,
+    reading_stats,
+    search_books,
 )
+from src.ingest import import_file, sync_file
+from src.settings import search_limit
+
+
+# progress bar shown on menu navigation; off for scripted use
+# (READAPP_ANIMATIONS=0 or `python -m src.cli menu --no-animations`)
+ANIMATIONS = os.environ.get("READAPP_ANIMATIONS", "1") != "0"
+
+
+def loading(desc: Optional[str] = None, delay: float = 0.01):
+    if not ANIMATIONS:
+        return
+    from tqdm import tqdm
+
+    for i in tqdm(range(0, 100), total=100, ncols=100, desc=desc):
+        time.sleep(delay)
 
 
 class MenuDisplay:
@@ -27,6 +44,9 @@ class MenuDisplay:
         1. how many books were completely read in a specific amount of time
         2. how many books are pending
         3. search books by title
+        4. reading statistics
+        5. full-text search over titles and descriptions
+        6. reading analytics (velocity, durations, streaks, forecast)
         77. Back to Menu
         99. Exit
     2. DATA MANIPULATION
@@ -34,9 +54,14 @@ class MenuDisplay:
         2. UPDATE DATA
         3. DELETE DATA
         4. TRUNCATE
+        5. VIEW TABLE
+        6. IMPORT DATA (CSV/JSONL)
         77. Go back to menu
         99. Exit
     99. Exit
+
+    The menu asks for a username at start (READAPP_USER skips it) and only
+    shows and changes that user's books.
     """
 
     @staticmethod
@@ -64,6 +89,7 @@ class MenuDisplay:
             3. DELETE DATA
             4. TRUNCATE
             5. VIEW TABLE
+            6. IMPORT DATA (CSV/JSONL)
             77. Back to Menu
             99. Quit\033[0m                         
             """
@@ -78,6 +104,9 @@ class MenuDisplay:
             1. How many books were completely read during a specific amount of time?
             2. How many books do we have pending?
             3. Search books by title
+            4. Reading statistics
+            5. Full-text search (titles and descriptions)
+            6. Reading analytics
             77. Back to Menu
             99. Quit\033[0m
             """
@@ -85,10 +114,12 @@ class MenuDisplay:
 
 
 class InputOption:
+    # the logged-in user (see login()), every query is scoped to their books
+    username: Optional[str] = None
+
     @staticmethod
     def input_option_dm_insert() -> CreateDataType:
-        # FIXME: Add login feature and extract the username from there.
-        username = "Sophie"
+        username = InputOption.username
         print("\033[1;37mPlease provide the following details: ")
         title: str = input("Book title: ")
         description: str = input("(Optional) Book description: ")
@@ -122,7 +153,7 @@ class InputOption:
         global field_option
         while True:
             id_to_update = int(input("\033[1;37mInput book id to update: \033[0m"))
-            book: Optional[FetchByIdDataType] = fetch_by_id(id_to_update)
+            book: Optional[Book] = fetch_by_id(id_to_update, InputOption.username)
             if book is None:
                 print("\033[1;31m\nBook does not exist in DB. Please try again\033[0m")
                 continue
@@ -196,20 +227,13 @@ class InputOption:
                     # GO BACK TO DM MENU
                     print("")
                     print("\033[1;32mLoading Data Manipulation Menu...\033[0m")
-                    for i in tqdm(range(0, 100), total=100, ncols=100):
-                        time.sleep(0.01)
+                    loading()
                     break
 
                 elif field_option == 99:
                     # EXIT THE PROGRAM
                     print("")
-                    for i in tqdm(
-                        range(0, 100),
-                        total=100,
-                        ncols=100,
-                        desc="\033[1;31mEXITING THE PROGRAM...\033[0m",
-                    ):
-                        time.sleep(0.01)
+                    loading(desc="\033[1;31mEXITING THE PROGRAM...\033[0m")
                     sys.exit()
 
     @staticmethod
@@ -217,7 +241,7 @@ class InputOption:
         global d_option
         while True:
             id_to_delete = int(input("\033[1;37mInput book id to delete: \033[0m"))
-            book: Optional[FetchByIdDataType] = fetch_by_id(id_to_delete)
+            book: Optional[Book] = fetch_by_id(id_to_delete, InputOption.username)
             if book is None:
                 print("\033[1;31mBook does not exist in DB. Please try again\033[0m")
                 continue
@@ -242,20 +266,13 @@ class InputOption:
                     # GO BACK TO DM MENU
                     print("")
                     print("\033[1;32mLoading Data Manipulation Menu...\033[0m")
-                    for i in tqdm(range(0, 100), total=100, ncols=100):
-                        time.sleep(0.01)
+                    loading()
                     break
 
                 elif d_option == 99:
                     # EXIT THE PROGRAM
                     print("")
-                    for i in tqdm(
-                        range(0, 100),
-                        total=100,
-                        ncols=100,
-                        desc="\033[1;31mEXITING THE PROGRAM...\033[0m",
-                    ):
-                        time.sleep(0.01)
+                    loading(desc="\033[1;31mEXITING THE PROGRAM...\033[0m")
                     sys.exit()
 
     @staticmethod
@@ -268,7 +285,7 @@ class InputOption:
                 """\033[1;37m
                   Truncate Options:
                   -----------------
-                  1. Truncate Table (clear all rows)
+                  1. Truncate Table (clear all your rows)
                   77. Go back to Menu
                   99. Quit
                   
@@ -277,10 +294,10 @@ class InputOption:
             t_option = int(input("Choose an option to continue: \033[0m"))
             if t_option == 1:
                 option = input(
-                    "\033[1;31mAre you sure? (This will delete all rows)(yes/no): \033[0m"
+                    "\033[1;31mAre you sure? (This will delete all your rows)(yes/no): \033[0m"
                 )
                 if option == "yes":
-                    truncate_table()
+                    truncate_table(InputOption.username)
                     print("\033[1;32mTable successfully truncated.\033[0m")
                     break
                 elif option == "no":
@@ -290,20 +307,13 @@ class InputOption:
                 # GO BACK TO DM MENU
                 print("")
                 print("\033[1;32mLoading Data Manipulation Menu...\033[0m")
-                for i in tqdm(range(0, 100), total=100, ncols=100):
-                    time.sleep(0.01)
+                loading()
                 break
 
             elif t_option == 99:
                 # EXIT THE PROGRAM
                 print("")
-                for i in tqdm(
-                    range(0, 100),
-                    total=100,
-                    ncols=100,
-                    desc="\033[1;31mEXITING THE PROGRAM...\033[0m",
-                ):
-                    time.sleep(0.01)
+                loading(desc="\033[1;31mEXITING THE PROGRAM...\033[0m")
                 sys.exit()
 
             else:
@@ -311,26 +321,157 @@ class InputOption:
                 continue
 
     @staticmethod
-    def generate_table(data):
-        table = [
-            [
-                "Title",
-                "Description",
-                "Status",
-                "Percentage read",
-                "Start Date",
-                "End Date",
-            ],
-            data,
-        ]
-        print(tabulate(table, headers="firstrow", tablefmt="fancy_grid"))
+    def generate_table(book: Book):
+        from tabulate import tabulate
+
+        table = [[
+            book.title,
+            book.description,
+            book.status,
+            book.pct_read,
+            book.start_read_date,
+            book.end_read_date,
+        ]]
+        headers = ["Title", "Description", "Status", "Percentage read", "Start Date", "End Date"]
+        print(tabulate(table, headers=headers, tablefmt="fancy_grid"))
+
+    @staticmethod
+    def generate_stats_table(stats: ReadingStats):
+        from tabulate import tabulate
+
+        print("\033[1;35m\nBooks per status:\033[0m\033[1;37m")
+        print(
+            tabulate(
+                stats["status_counts"].items(),
+                headers=["Status", "Books"],
+                tablefmt="fancy_grid",
+            )
+        )
+        print("\033[1;35mCompleted books per month:\033[0m\033[1;37m")
+        print(
+            tabulate(
+                stats["completions_per_month"],
+                headers=["Month", "Completed"],
+                tablefmt="fancy_grid",
+            )
+        )
+        avg = stats["avg_pct_read"]
+        print(
+            f"\033[1;35mAverage percentage read: {avg:.1f}\033[0m"
+            if avg is not None
+            else "\033[1;35mNo books in this range.\033[0m"
+        )
+
+    @staticmethod
+    def generate_analytics_tables(result: dict):
+        from tabulate import tabulate
+
+        durations = result["time_to_complete"]
+        print(
+            f"\033[1;35m\n{result['books']} book(s) of {result['users']} reader(s)\033[0m"
+        )
+        print("\033[1;35mDays to complete a book:\033[0m\033[1;37m")
+        print(
+            tabulate(
+                [(k, v) for k, v in durations.items() if k != "distribution"]
+                + durations["distribution"],
+                headers=["", "Days / Books"],
+                tablefmt="fancy_grid",
+            )
+        )
+        print("\033[1;35mReading velocity:\033[0m\033[1;37m")
+        print(
+            tabulate(
+                result["velocity"],
+                headers=["User", "Completed", "Books per month"],
+                tablefmt="fancy_grid",
+            )
+        )
+        print("\033[1;35mMonthly streaks:\033[0m\033[1;37m")
+        print(
+            tabulate(
+                result["streaks"],
+                headers=["User", "Longest", "Current"],
+                tablefmt="fancy_grid",
+            )
+        )
+        print("\033[1;35mExpected completions:\033[0m\033[1;37m")
+        print(
+            tabulate(
+                result["forecast"],
+                headers=["Month", "Books"],
+                tablefmt="fancy_grid",
+            )
+        )
+
+    @staticmethod
+    def generate_search_table(title: str):
+        from tabulate import tabulate
+
+        # best matches first, one page at a time
+        after = None
+        while True:
+            page = search_books_by_title(title, after=after, username=InputOption.username)
+            print(tabulate(page.rows, headers=page.column_names, tablefmt="fancy_grid"))
+            if page.next_key is None or not InputOption.more_rows():
+                break
+            after = page.next_key
+
+    @staticmethod
+    def generate_fts_table(query: str):
+        from tabulate import tabulate
+
+        offset = 0
+        while True:
+            hits = search_books(query, offset=offset, username=InputOption.username)
+            rows = [
+                [
+                    hit.id,
+                    hit.title,
+                    hit.status,
+                    # highlight the matched words in the terminal
+                    hit.snippet.replace("<b>", "\033[1;33m").replace(
+                        "</b>", "\033[0m\033[1;37m"
+                    ),
+                ]
+                for hit in hits
+            ]
+            print(
+                tabulate(
+                    rows,
+                    headers=["Id", "Title", "Status", "Snippet"],
+                    tablefmt="fancy_grid",
+                )
+            )
+            if len(hits) < search_limit() or not InputOption.more_rows():
+                break
+            offset += len(hits)
+
+    @staticmethod
+    def show_rows() -> bool:
+        answer = input("\033[1;37mList the matching books too? (yes/no): \033[0m")
+        return answer.strip().lower() == "yes"
+
+    @staticmethod
+    def more_rows() -> bool:
+        answer = input("\033[1;37mPress Enter for more rows, q to stop: \033[0m")
+        return answer.strip().lower() != "q"
 
     @staticmethod
     def generate_full_table():
-        view_table()
+        view_table(pager=InputOption.more_rows, username=InputOption.username)
+
+
+def login() -> str:
+    # READAPP_USER skips the prompt
+    username = os.environ.get("READAPP_USER", "").strip()
+    while not username:
+        username = input("\033[1;37mUsername: \033[0m").strip()
+    return username
 
 
 def main():
+    InputOption.username = login()
     while True:
         MenuDisplay.display_menu()
         option: int = int(input("\033[1;37mChoose an option to continue: \033[0m"))
@@ -338,8 +479,7 @@ def main():
             # OPERATION FOR QUERY
             print("")
             print("\033[1;32mLoading Data Query Menu...\033[0m")
-            for i in tqdm(range(0, 100), total=100, ncols=100):
-                time.sleep(0.02)
+            loading(delay=0.02)
             while True:
                 MenuDisplay.display_dq_menu()
                 choice = int(input("\033[1;37mChoose an option to continue: \033[0m"))
@@ -351,13 +491,23 @@ def main():
                     end_date = input(
                         "\033[1;37mEnter the end date (YYYY-MM-DD): \033[0m"
                     )
-                    count = count_completed_books(start_date, end_date)
+                    count = count_completed_books(
+                        start_date,
+                        end_date,
+                        show_rows=InputOption.show_rows(),
+                        pager=InputOption.more_rows,
+                        username=InputOption.username,
+                    )
                     print(
                         f"\033[1;35m\nNumber of completely read books between {start_date} and {end_date}: {count}\033[0m"
                     )
 
                 elif choice == 2:
-                    count = count_pending_books()
+                    count = count_pending_books(
+                        show_rows=InputOption.show_rows(),
+                        pager=InputOption.more_rows,
+                        username=InputOption.username,
+                    )
                     print(
                         f"\033[1;35m\nWe currently have: {count} pending book(s).\033[0m"
                     )
@@ -367,25 +517,46 @@ def main():
                     print(
                         f"\033[1;35m\nHere is the requested information based on keyword: {title}\033[0m\033[1;37m\n"
                     )
-                    search_books_by_title(title)
+                    InputOption.generate_search_table(title)
+
+                elif choice == 4:
+                    start_date = input(
+                        "\033[1;37m\n(Optional) Start date (YYYY-MM-DD): \033[0m"
+                    )
+                    end_date = input(
+                        "\033[1;37m(Optional) End date (YYYY-MM-DD): \033[0m"
+                    )
+                    stats = reading_stats(
+                        InputOption.username,
+                        date.fromisoformat(start_date) if start_date else None,
+                        date.fromisoformat(end_date) if end_date else None,
+                    )
+                    InputOption.generate_stats_table(stats)
+
+                elif choice == 5:
+                    query = input("\033[1;37m\nEnter the search terms: \033[0m")
+                    InputOption.generate_fts_table(query)
+
+                elif choice == 6:
+                    try:
+                        from src import analytics
+
+                        books = analytics.load_books(InputOption.username)
+                    except ImportError as e:
+                        print(f"\033[1;31mAnalytics unavailable: {e}\033[0m")
+                        continue
+                    InputOption.generate_analytics_tables(analytics.summary(books))
 
                 elif choice == 77:
                     # GO BACK TO MAIN MENU
                     print("")
                     print("\033[1;32mLoading Main Menu...\033[0m")
-                    for i in tqdm(range(0, 100), total=100, ncols=100):
-                        time.sleep(0.01)
+                    loading()
                     break
                 elif choice == 99:
                     # EXIT THE PROGRAM
                     print("")
-                    for i in tqdm(
-                        range(0, 100),
-                        total=100,
-                        ncols=100,
-                        desc="\033[1;31mEXITING THE PROGRAM...\033[0m",
-                    ):
-                        time.sleep(0.01)
+                    loading(desc="\033[1;31mEXITING THE PROGRAM...\033[0m")
                     sys.exit()
                 else:
                     print("\033[1;31m\nInvalid choice. Please try again.\033[0m")
@@ -394,8 +565,7 @@ def main():
             # OPERATION FOR MANIPULATION
             print("")
             print("\033[1;32mLoading Data Manipulation Menu...\033[0m")
-            for i in tqdm(range(0, 100), total=100, ncols=100):
-                time.sleep(0.02)
+            loading(delay=0.02)
             while True:
                 MenuDisplay.display_dm_menu()
                 option: int = int(
@@ -405,7 +575,10 @@ def main():
                 if option == 1:
                     data: CreateDataType = InputOption.input_option_dm_insert()
                     # insert data to the database
-                    id = insert_data(data)
+                    try:
+                        insert_data(data)
+                    except DuplicateBookError as e:
+                        print(f"\033[1;31mInsert failed, {e}.\033[0m")
 
                 # UPDATE
                 elif option == 2:
@@ -415,7 +588,10 @@ def main():
                         continue
                     # if option is not 77, keep going with updating data
                     updated_id = update_data(
-                        updated_data.book_id, updated_data.column, updated_data.value
+                        updated_data.book_id,
+                        updated_data.column,
+                        updated_data.value,
+                        InputOption.username,
                     )
                     if updated_id is not None:
                         print(
@@ -430,7 +606,7 @@ def main():
                     # to return back to DM menu
                     if d_option == 77:
                         continue
-                    deleted_id = delete_row(deleted_data)
+                    deleted_id = delete_row(deleted_data, InputOption.username)
                     if deleted_id is not None:
                         print(
                             f"\033[1;32m\nRecord with id {deleted_id} deleted successfully.\033[0m"
@@ -445,36 +621,50 @@ def main():
                 elif option == 5:
                     InputOption.generate_full_table()
 
+                # IMPORT
+                elif option == 6:
+                    path = input("\033[1;37mPath to the CSV or JSONL file: \033[0m")
+                    sync = input(
+                        "\033[1;37mUpdate books that already exist (same title)? (yes/no): \033[0m"
+                    ) == "yes"
+                    try:
+                        load = sync_file if sync else import_file
+                        report = load(path, username=InputOption.username)
+                    except (OSError, ValueError) as e:
+                        print(f"\033[1;31mImport failed: {e}\033[0m")
+                        continue
+                    if sync:
+                        print(
+                            f"\033[1;32m{len(report.inserted_ids)} inserted, "
+                            f"{len(report.updated_ids)} updated, "
+                            f"{report.unchanged} unchanged, "
+                            f"{report.duplicates} duplicate(s) and "
+                            f"{report.archived} archived book(s) skipped.\033[0m"
+                        )
+                    else:
+                        print(
+                            f"\033[1;32m{len(report.inserted_ids)} record(s) imported.\033[0m"
+                        )
+                    for error in report.errors:
+                        print(f"\033[1;31mRow {error.row}: {error.error}\033[0m")
+
                 elif option == 77:
                     # GO BACK TO MEIN MENU
                     print("")
                     print("\033[1;32mLoading Main Menu...\033[0m")
-                    for i in tqdm(range(0, 100), total=100, ncols=100):
-                        time.sleep(0.01)
+                    loading()
                     break
 
                 elif option == 99:
                     # EXIT THE PROGRAM
                     print("")
-                    for i in tqdm(
-                        range(0, 100),
-                        total=100,
-                        ncols=100,
-                        desc="\033[1;31mEXITING THE PROGRAM...\033[0m",
-                    ):
-                        time.sleep(0.01)
+                    loading(desc="\033[1;31mEXITING THE PROGRAM...\033[0m")
                     sys.exit()
 
         elif option == 99:
             # EXIT THE PROGRAM
             print("")
-            for i in tqdm(
-                range(0, 100),
-                total=100,
-                ncols=100,
-                desc="\033[1;31mEXITING THE PROGRAM...\033[0m",
-            ):
-                time.sleep(0.01)
+            loading(desc="\033[1;31mEXITING THE PROGRAM...\033[0m")
             sys.exit()
 
         else:
@@ -0,0 +1,90 @@
+import logging
+import time
+from datetime import date, timedelta
+from typing import Callable, Optional
+from src.database import Database, _has_archive, _wrote
+from src.queries import ARCHIVE_BATCH_QUERY, ARCHIVE_LOCK_TIMEOUT_QUERY, scoped
+from src.settings import env
+
+# ARCHIVAL JOB
+# Completed books that finished reading more than older_than_days ago move
+# from read.bookclub to read.bookclub_archive (migration 0009), batch_size
+# rows per transaction. Each batch only locks its own rows and skips rows
+# locked by someone else, so the job can run next to normal traffic; a
+# pause between batches leaves room for replicas and autovacuum.
+# Counts, searches and exports keep finding archived books.
+
+logger = logging.getLogger(__name__)
+
+# attempts at a batch that keeps running into the lock timeout, before the
+# job stops (the next run goes on where it stopped)
+LOCK_ATTEMPTS = 3
+
+
+def archive_cutoff(older_than_days: Optional[int] = None, today: Optional[date] = None) -> date:
+    # books that ended reading before this date are archived
+    if older_than_days is None:
+        older_than_days = env().int('db_archive_after_days', default=365)
+    if older_than_days < 0:
+        raise ValueError("older_than_days cannot be negative")
+    return (today or date.today()) - timedelta(days=older_than_days)
+
+
+def archive_books(
+    older_than_days: Optional[int] = None,
+    batch_size: int = 1000,
+    pause: float = 0.0,
+    username: Optional[str] = None,
+    progress: Optional[Callable[[int], None]] = None,
+) -> int:
+    # returns how many books were archived; progress gets the running
+    # count after every batch
+    import psycopg as pg
+
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    params = {
+        "cutoff": archive_cutoff(older_than_days),
+        "batch_size": batch_size,
+        "username": username,
+    }
+    query = scoped(ARCHIVE_BATCH_QUERY, username, named=True)
+    archived = 0
+    with Database().connection() as conn:
+        with conn.cursor() as cursor:
+            if not _has_archive(cursor):
+                raise ValueError("read.bookclub_archive is missing, run `migrate` first")
+        conn.commit()
+        attempts = 0
+        while True:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(ARCHIVE_LOCK_TIMEOUT_QUERY)
+                    cursor.execute(query, params)
+                    ids = [r[0] for r in cursor.fetchall()]
+                conn.commit()
+            except pg.errors.LockNotAvailable:
+                # the batch waited too long for a lock and was rolled back
+                conn.rollback()
+                attempts += 1
+                if attempts >= LOCK_ATTEMPTS:
+                    logger.warning(
+                        "archiving stopped after %d books: lock timeout %d times in a row",
+                        archived,
+                        attempts,
+                    )
+                    break
+                time.sleep(pause)
+                continue
+            attempts = 0
+            _wrote(ids)
+            archived += len(ids)
+            if progress is not None:
+                progress(archived)
+            # a short batch means nothing is left (but rows that were
+            # locked, the next run takes those)
+            if len(ids) < batch_size:
+                break
+            if pause:
+                time.sleep(pause)
+    return archived
@@ -0,0 +1,463 @@
+import asyncio
+from typing import Any, AsyncIterator, Iterable, List, Mapping, Optional, Tuple, Union
+from functools import partial
+from datetime import date
+from src.schema import (
+    Book,
+    CreateDataType,
+    DuplicateBookError,
+    ReadingStats,
+    SearchHit,
+    StatusEnum,
+    TitleSearchPage,
+    book_row,
+)
+from src.queries import (
+    COMPLETED_BOOKS_QUERY,
+    COUNT_COMPLETED_QUERY,
+    COUNT_COMPLETED_SUMMARY_QUERY,
+    COUNT_PENDING_QUERY,
+    COUNT_PENDING_SUMMARY_QUERY,
+    DELETE_QUERY,
+    FETCH_BY_ID_QUERY,
+    FULL_TEXT_SEARCH_QUERY,
+    INSERT_QUERY,
+    PENDING_BOOKS_QUERY,
+    READING_STATS_QUERY,
+    TITLE_SEARCH_QUERY,
+    TRUNCATE_QUERY,
+    DELETE_MANY_QUERY,
+    DELETE_USER_ARCHIVE_QUERY,
+    DELETE_USER_BOOKS_QUERY,
+    TRUNCATE_WITH_ARCHIVE_QUERY,
+    VIEW_TABLE_QUERY,
+    insert_params,
+    like_pattern,
+    month_buckets,
+    reaches_archive,
+    update_many_statements,
+    update_query,
+    reading_stats_result,
+    scoped,
+    scoped_params,
+    title_search,
+    title_search_page,
+    with_archive,
+)
+from src import database, instrument
+from src.cache import MISSING
+from src.database import (
+    _ARCHIVE_HORIZON_KEY,
+    _archive_check,
+    _cacheable,
+    _configure_caches,
+    _conninfo,
+    _horizon_check,
+    _instrumented,
+    _replica_conninfos,
+    _replica_safe,
+    _summary_check,
+    _wrote,
+    aggregate_cache,
+    book_cache,
+)
+from src.settings import env, fetch_size as default_fetch_size, search_limit
+
+# ASYNCIO VERSION OF src.database
+# Same SQL, same return types and the same caches as the sync functions,
+# so both APIs can be mixed in one process.
+
+
+# replica pools of a replaced AsyncDatabase being closed; the loop only
+# keeps a weak reference to a task, so it is held here until it is done
+_closing: set = set()
+
+
+def _close_replicas(replicas) -> None:
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # AsyncDatabase() outside a coroutine: nothing else runs, close now
+        asyncio.run(replicas.close())
+        return
+    task = loop.create_task(replicas.close())
+    _closing.add(task)
+    task.add_done_callback(_closing.discard)
+
+
+# SINGLETON CLASS
+class AsyncDatabase(object):
+    _instance = None
+
+    def __new__(cls):
+        if AsyncDatabase._instance is None or AsyncDatabase._instance._pool.closed:
+            if AsyncDatabase._instance is not None and AsyncDatabase._instance._replicas is not None:
+                _close_replicas(AsyncDatabase._instance._replicas)
+            # only shared once it was built without error
+            instance = super().__new__(cls)
+            instance.__init__()
+            AsyncDatabase._instance = instance
+
+        return AsyncDatabase._instance._pool
+
+    def __init__(self) -> None:
+        from src.pool import AsyncPool, AsyncReplicaPool
+
+        configure = partial(_configure_connection, instrumented=_instrumented())
+        self._pool = AsyncPool(
+            _conninfo(),
+            min_size=env().int('db_pool_min_size', default=1),
+            max_size=env().int('db_pool_max_size', default=10),
+            max_idle=env().float('db_pool_max_idle', default=600.0),
+            timeout=env().float('db_pool_timeout', default=30.0),
+            configure=configure,
+        )
+        replicas = [
+            AsyncPool(
+                conninfo,
+                min_size=env().int('db_pool_min_size', default=1),
+                max_size=env().int('db_pool_max_size', default=10),
+                max_idle=env().float('db_pool_max_idle', default=600.0),
+                timeout=env().float('db_replica_timeout', default=2.0),
+                configure=configure,
+            )
+            for conninfo in _replica_conninfos()
+        ]
+        self._replicas = AsyncReplicaPool(
+            replicas,
+            self._pool,
+            retry_interval=env().float('db_replica_retry_interval', default=30.0),
+        ) if replicas else None
+        _configure_caches()
+
+    @classmethod
+    def replicas(cls):
+        cls()
+        return cls._instance._replicas
+
+
+def read_pool():
+    # see src.database.read_pool
+    primary = AsyncDatabase()
+    replicas = AsyncDatabase.replicas()
+    if replicas is None or not _replica_safe():
+        return primary
+    return replicas
+
+
+# type info of the read.state enum, fetched with the first connection
+_status_info = None
+
+
+async def _configure_connection(conn, instrumented: bool) -> None:
+    # pool `configure` hook, see src.database._configure_connection
+    from psycopg.types.enum import EnumInfo, register_enum
+    global _status_info
+
+    if _status_info is None:
+        _status_info = await EnumInfo.fetch(conn, "read.state")
+        await conn.commit()
+    if _status_info is not None:
+        register_enum(_status_info, conn, StatusEnum)
+    if instrumented:
+        await instrument.configure_async(conn)
+
+
+async def _check(cursor, check):
+    # runs a schema check of src.database, see src.database._check
+    try:
+        query = next(check)
+        while True:
+            await cursor.execute(query)
+            query = check.send(await cursor.fetchone())
+    except StopIteration as done:
+        return done.value
+
+
+async def _has_summary(cursor) -> bool:
+    return await _check(cursor, _summary_check())
+
+
+async def _has_archive(cursor) -> bool:
+    return await _check(cursor, _archive_check())
+
+
+async def _archived(start_date=None) -> bool:
+    # see src.database._archived
+    if database._archive is False:
+        return False
+    horizon = aggregate_cache.get(_ARCHIVE_HORIZON_KEY)
+    if horizon is MISSING:
+        token = aggregate_cache.token()
+        pool = read_pool()
+        async with pool.cursor() as cursor:
+            horizon = await _check(cursor, _horizon_check())
+        if _cacheable(pool, AsyncDatabase()):
+            aggregate_cache.set(_ARCHIVE_HORIZON_KEY, horizon, token)
+    return reaches_archive(horizon, start_date)
+
+
+async def insert_data(data: CreateDataType) -> int:
+    import psycopg as pg
+
+    async with AsyncDatabase().connection() as conn:
+        async with conn.cursor() as cursor:
+            try:
+                await cursor.execute(INSERT_QUERY, insert_params(data))
+            except pg.errors.UniqueViolation:
+                await conn.rollback()
+                raise DuplicateBookError(data["username"], data["title"]) from None
+            inserted_id = (await cursor.fetchone())[0]
+            await conn.commit()
+    _wrote(())
+    return inserted_id
+
+
+async def fetch_by_id(book_id: int, username: Optional[str] = None) -> Optional[Book]:
+    book = book_cache.get(book_id)
+    if book is not MISSING:
+        return book if username is None or book.username == username else None
+    token = book_cache.token()
+    # live books only, see src.database.fetch_by_id
+    pool = read_pool()
+    async with pool.cursor(row_factory=book_row) as cursor:
+        await cursor.execute(
+            scoped(FETCH_BY_ID_QUERY, username), scoped_params((book_id,), username)
+        )
+        book = await cursor.fetchone()
+    if book is not None and _cacheable(pool, AsyncDatabase()):
+        book_cache.set(book_id, book, token)
+    return book
+
+
+async def update_data(
+    book_id: int, column: str, data: Union[str, date, int], username: Optional[str] = None
+) -> Optional[int]:
+    async with AsyncDatabase().connection() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(
+                update_query(column, username), scoped_params([data, book_id], username)
+            )
+            row = await cursor.fetchone()
+            await conn.commit()
+    _wrote((book_id,))
+    return row[0] if row is not None else None
+
+
+async def delete_row(book_id: int, username: Optional[str] = None) -> Optional[int]:
+    async with AsyncDatabase().connection() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(
+                scoped(DELETE_QUERY, username), scoped_params((book_id,), username)
+            )
+            row = await cursor.fetchone()
+            await conn.commit()
+    _wrote((book_id,))
+    return row[0] if row is not None else None
+
+
+async def truncate_table(username: Optional[str] = None) -> None:
+    async with AsyncDatabase().connection() as conn:
+        async with conn.cursor() as cursor:
+            archive = await _has_archive(cursor)
+            if username is None:
+                await cursor.execute(TRUNCATE_WITH_ARCHIVE_QUERY if archive else TRUNCATE_QUERY)
+            else:
+                await cursor.execute(DELETE_USER_BOOKS_QUERY, (username,))
+                if archive:
+                    await cursor.execute(DELETE_USER_ARCHIVE_QUERY, (username,))
+            await conn.commit()
+    _wrote()
+
+
+async def update_many(
+    updates: Iterable[Mapping[str, Any]], username: Optional[str] = None
+) -> List[int]:
+    statements = update_many_statements(updates, username)
+    updated_ids: List[int] = []
+    async with AsyncDatabase().connection() as conn:
+        async with conn.cursor() as cursor:
+            for query, params in statements:
+                await cursor.execute(query, params)
+                updated_ids.extend(r[0] for r in await cursor.fetchall())
+        await conn.commit()
+    _wrote(updated_ids)
+    return updated_ids
+
+
+async def delete_many(book_ids: Iterable[int], username: Optional[str] = None) -> List[int]:
+    async with AsyncDatabase().connection() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(
+                scoped(DELETE_MANY_QUERY, username),
+                scoped_params((list(book_ids),), username),
+            )
+            deleted_ids = [r[0] for r in await cursor.fetchall()]
+        await conn.commit()
+    _wrote(deleted_ids)
+    return deleted_ids
+
+
+def _stream_rows(
+    query: str,
+    params=None,
+    fetch_size: Optional[int] = None,
+    archive: bool = False,
+    start_date=None,
+) -> AsyncIterator[Book]:
+    # see src.database._stream_pages
+    return instrument.attributed_async(
+        instrument.caller(), _rows(query, params, fetch_size, archive, start_date)
+    )
+
+
+async def _rows(
+    query: str,
+    params=None,
+    fetch_size: Optional[int] = None,
+    archive: bool = False,
+    start_date=None,
+) -> AsyncIterator[Book]:
+    # server-side cursor, see src.database._pages; with archive the
+    # archived books from start_date on are listed too
+    fetch_size = fetch_size or default_fetch_size()
+    if archive:
+        query = with_archive(query, await _archived(start_date))
+    async with read_pool().connection() as conn:
+        async with conn.cursor(name="bookclub_stream", row_factory=book_row) as cursor:
+            cursor.itersize = fetch_size
+            await cursor.execute(query, params)
+            while True:
+                rows = await cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+
+
+def iter_table(
+    fetch_size: Optional[int] = None, username: Optional[str] = None
+) -> AsyncIterator[Book]:
+    return _stream_rows(
+        scoped(VIEW_TABLE_QUERY, username), scoped_params((), username), fetch_size
+    )
+
+
+def iter_completed_books(
+    start_date, end_date, fetch_size: Optional[int] = None, username: Optional[str] = None
+) -> AsyncIterator[Book]:
+    return _stream_rows(
+        scoped(COMPLETED_BOOKS_QUERY, username),
+        scoped_params((start_date, end_date), username),
+        fetch_size,
+        archive=True,
+        start_date=start_date,
+    )
+
+
+def iter_pending_books(
+    fetch_size: Optional[int] = None, username: Optional[str] = None
+) -> AsyncIterator[Book]:
+    return _stream_rows(
+        scoped(PENDING_BOOKS_QUERY, username), scoped_params((), username), fetch_size
+    )
+
+
+def iter_books_by_title(
+    title: str, fetch_size: Optional[int] = None, username: Optional[str] = None
+) -> AsyncIterator[Book]:
+    return _stream_rows(
+        scoped(TITLE_SEARCH_QUERY, username),
+        scoped_params((like_pattern(title),), username),
+        fetch_size,
+        archive=True,
+    )
+
+
+async def count_completed_books(start_date, end_date, username: Optional[str] = None) -> int:
+    key = ('completed', str(start_date), str(end_date), username)
+    count = aggregate_cache.get(key)
+    if count is not MISSING:
+        return count
+    token = aggregate_cache.token()
+    months = month_buckets(start_date, end_date)
+    pool = read_pool()
+    async with pool.cursor() as cursor:
+        if months is not None and await _has_summary(cursor):
+            await cursor.execute(
+                scoped(COUNT_COMPLETED_SUMMARY_QUERY, username), scoped_params(months, username)
+            )
+        else:
+            query = with_archive(COUNT_COMPLETED_QUERY, await _archived(start_date))
+            await cursor.execute(
+                scoped(query, username),
+                scoped_params((start_date, end_date), username),
+            )
+        count = (await cursor.fetchone())[0]
+    if _cacheable(pool, AsyncDatabase()):
+        aggregate_cache.set(key, count, token)
+    return count
+
+
+async def count_pending_books(username: Optional[str] = None) -> int:
+    key = ('pending', username)
+    count = aggregate_cache.get(key)
+    if count is not MISSING:
+        return count
+    token = aggregate_cache.token()
+    params = scoped_params((), username)
+    pool = read_pool()
+    async with pool.cursor() as cursor:
+        if await _has_summary(cursor):
+            await cursor.execute(scoped(COUNT_PENDING_SUMMARY_QUERY, username), params)
+        else:
+            await cursor.execute(scoped(COUNT_PENDING_QUERY, username), params)
+        count = (await cursor.fetchone())[0]
+    if _cacheable(pool, AsyncDatabase()):
+        aggregate_cache.set(key, count, token)
+    return count
+
+
+async def reading_stats(
+    username: str, start_date: Optional[date] = None, end_date: Optional[date] = None
+) -> ReadingStats:
+    key = ('stats', username, start_date, end_date)
+    stats = aggregate_cache.get(key)
+    if stats is not MISSING:
+        return stats
+    token = aggregate_cache.token()
+    params = {"username": username, "start_date": start_date, "end_date": end_date}
+    query = with_archive(READING_STATS_QUERY, await _archived(start_date))
+    pool = read_pool()
+    async with pool.cursor() as cursor:
+        await cursor.execute(query, params)
+        stats = reading_stats_result(await cursor.fetchone())
+    if _cacheable(pool, AsyncDatabase()):
+        aggregate_cache.set(key, stats, token)
+    return stats
+
+
+async def search_books_by_title(
+    title: str,
+    limit: Optional[int] = None,
+    after: Optional[Tuple[float, int]] = None,
+    username: Optional[str] = None,
+) -> TitleSearchPage:
+    limit = limit or search_limit()
+    query, params = title_search(title, limit, after, username, await _archived())
+    async with read_pool().cursor() as cursor:
+        await cursor.execute(query, params)
+        rows = await cursor.fetchall()
+        column_names = [desc[0] for desc in cursor.description]
+    return title_search_page(column_names, rows, limit)
+
+
+async def search_books(
+    query: str, limit: Optional[int] = None, offset: int = 0, username: Optional[str] = None
+) -> List[SearchHit]:
+    limit = limit or search_limit()
+    params = {"query": query, "limit": limit, "offset": offset, "username": username}
+    sql = with_archive(FULL_TEXT_SEARCH_QUERY, await _archived())
+    async with read_pool().cursor() as cursor:
+        await cursor.execute(scoped(sql, username, named=True), params)
+        return [SearchHit(*row) for row in await cursor.fetchall()]
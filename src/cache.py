@@ -0,0 +1,72 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+# marker for "not in the cache", so None can still be a cached value
+MISSING = object()
+
+
+# IN-PROCESS LRU CACHE
+class LRUCache(object):
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = 60.0) -> None:
+        self.maxsize = maxsize
+        # seconds an entry stays valid, None keeps it until evicted
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        # bumped by every invalidation, see token()/set()
+        self._generation = 0
+
+    def token(self) -> int:
+        # take a token before loading a value from the database and pass it
+        # to set(): if anything was invalidated in between, the loaded value
+        # may already be stale and is not stored
+        return self._generation
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return MISSING
+
+    def set(self, key: Hashable, value: Any, token: Optional[int] = None) -> None:
+        with self._lock:
+            if token is not None and token != self._generation:
+                return
+            expires = time.monotonic() + self.ttl if self.ttl is not None else None
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._generation += 1
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+            }
+
+    def __len__(self) -> int:
+        return len(self._data)
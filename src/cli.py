@@ -0,0 +1,399 @@
+import argparse
+import csv
+import json
+import os
+import sys
+from datetime import date
+from enum import Enum
+from typing import Iterable, List, Optional, Sequence
+from src.schema import json_default
+
+# SCRIPTABLE COMMAND LINE
+# python -m src.cli <command> ...; every command calls src.database
+# directly, no prompts and no animations. `menu` starts the interactive app.
+
+FORMATS = ["table", "json", "jsonl", "csv"]
+
+
+def emit(rows: Iterable[Sequence], columns: List[str], fmt: str, out=None) -> None:
+    # rows may be a generator: jsonl and csv are written as they come
+    out = out or sys.stdout
+    if fmt == "table":
+        from tabulate import tabulate
+
+        print(tabulate(list(rows), headers=columns, tablefmt="fancy_grid"), file=out)
+    elif fmt == "json":
+        records = [dict(zip(columns, row)) for row in rows]
+        json.dump(records, out, default=json_default, indent=2)
+        out.write("\n")
+    elif fmt == "jsonl":
+        for row in rows:
+            out.write(json.dumps(dict(zip(columns, row)), default=json_default) + "\n")
+    elif fmt == "csv":
+        writer = csv.writer(out)
+        writer.writerow(columns)
+        writer.writerows(
+            [json_default(v) if isinstance(v, (date, Enum)) else v for v in row]
+            for row in rows
+        )
+
+
+def _value(text: str):
+    # --set values: numbers become ints, empty means NULL
+    if text == "":
+        return None
+    try:
+        return int(text)
+    except ValueError:
+        return text
+
+
+def _username(args) -> Optional[str]:
+    # --username picks a user, but never another one than --user
+    if args.user and args.username and args.username != args.user:
+        raise ValueError(f"--username {args.username} is not --user {args.user}")
+    return args.username or args.user
+
+
+def cmd_insert(args) -> int:
+    from src.database import insert_data
+    from src.schema import validate_record
+
+    data = validate_record({
+        "username": _username(args),
+        "title": args.title,
+        "description": args.description,
+        "status": args.status,
+        "pct_read": args.pct_read,
+        "start_read_date": args.start,
+        "end_read_date": args.end,
+    })
+    emit([(insert_data(data),)], ["id"], args.format)
+    return 0
+
+
+def cmd_update(args) -> int:
+    from src.database import update_many
+
+    update = {"id": args.id}
+    for assignment in args.set:
+        column, _, value = assignment.partition("=")
+        update[column] = _value(value)
+    updated_ids = update_many([update], username=args.user)
+    emit([(i,) for i in updated_ids], ["id"], args.format)
+    return 0 if updated_ids else 1
+
+
+def cmd_delete(args) -> int:
+    from src.database import delete_many
+
+    deleted_ids = delete_many(args.ids, username=args.user)
+    emit([(i,) for i in deleted_ids], ["id"], args.format)
+    return 0 if len(deleted_ids) == len(set(args.ids)) else 1
+
+
+def cmd_view(args) -> int:
+    from src.database import iter_table
+    from src.queries import BOOK_COLUMN_NAMES
+
+    emit(iter_table(args.fetch_size, username=args.user), BOOK_COLUMN_NAMES, args.format)
+    return 0
+
+
+def cmd_search(args) -> int:
+    from src.database import search_books, search_books_by_title
+
+    if args.full_text:
+        if args.after is not None:
+            raise ValueError("--after only pages title searches, use --offset with --full-text")
+        hits = search_books(
+            args.query, limit=args.limit, offset=args.offset, username=args.user
+        )
+        emit(hits, ["id", "title", "status", "rank", "snippet"], args.format)
+    else:
+        page = search_books_by_title(
+            args.query, limit=args.limit, after=args.after, username=args.user
+        )
+        emit(page.rows, page.column_names, args.format)
+        if page.next_key is not None:
+            score, book_id = page.next_key
+            print(f"next page: --after {score!r},{book_id}", file=sys.stderr)
+    return 0
+
+
+def _search_key(text: str):
+    # --after SCORE,ID: the last row of the previous page
+    score, _, book_id = text.partition(",")
+    try:
+        return float(score), int(book_id)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected SCORE,ID, not {text!r}") from None
+
+
+def cmd_stats(args) -> int:
+    from src.database import reading_stats
+
+    username = _username(args)
+    if not username:
+        raise ValueError("stats needs a username (or --user)")
+    stats = reading_stats(username, args.start, args.end)
+    if args.format == "json":
+        json.dump(stats, sys.stdout, default=json_default, indent=2)
+        sys.stdout.write("\n")
+    else:
+        rows = [("status", k, v) for k, v in stats["status_counts"].items()]
+        rows += [("completed", month, n) for month, n in stats["completions_per_month"]]
+        rows.append(("avg_pct_read", "", stats["avg_pct_read"]))
+        emit(rows, ["metric", "key", "value"], args.format)
+    return 0
+
+
+def cmd_import(args) -> int:
+    from src.ingest import import_file, sync_file
+
+    if args.sync:
+        report = sync_file(args.path, batch_size=args.batch_size, username=args.user)
+        print(
+            f"{len(report.inserted_ids)} inserted, {len(report.updated_ids)} updated, "
+            f"{report.unchanged} unchanged, {report.duplicates} duplicate(s) skipped, "
+            f"{report.archived} archived book(s) skipped",
+            file=sys.stderr,
+        )
+    else:
+        report = import_file(args.path, batch_size=args.batch_size, username=args.user)
+        print(f"{len(report.inserted_ids)} record(s) imported", file=sys.stderr)
+    emit(report.errors, ["row", "error"], args.format)
+    return 0 if not report.errors else 1
+
+
+def _analytics_rows(result: dict) -> List[tuple]:
+    rows = [("status", k, v) for k, v in result["status_counts"].items()]
+    rows += [("completed", month, n) for month, n in result["completions_per_month"]]
+    durations = result["time_to_complete"]
+    rows += [("days_to_complete", k, v) for k, v in durations.items() if k != "distribution"]
+    rows += [("days_to_complete", bucket, n) for bucket, n in durations["distribution"]]
+    rows += [("books_per_month", user, v) for user, _, v in result["velocity"]]
+    rows += [("longest_streak", user, longest) for user, longest, _ in result["streaks"]]
+    rows += [("current_streak", user, current) for user, _, current in result["streaks"] if current]
+    rows += [("forecast", month, n) for month, n in result["forecast"]]
+    return rows
+
+
+def cmd_analytics(args) -> int:
+    from src import analytics
+
+    username = _username(args)
+    if args.file:
+        if args.start or args.end:
+            raise ValueError("date filters only apply to the database, not to --file")
+        books = analytics.load_file(args.file)
+        if username:
+            books = analytics.for_user(books, username)
+    else:
+        books = analytics.load_books(username, args.start, args.end)
+    result = analytics.summary(books, horizon_days=args.horizon)
+    if args.format == "json":
+        json.dump(result, sys.stdout, default=json_default, indent=2)
+        sys.stdout.write("\n")
+    else:
+        emit(_analytics_rows(result), ["metric", "key", "value"], args.format)
+    return 0
+
+
+def _report_progress(rows: int) -> None:
+    print(f"\r{rows} row(s) exported", end="", file=sys.stderr, flush=True)
+
+
+def cmd_export(args) -> int:
+    from src.export import export_books, export_format
+
+    # --type wins, then the file suffix, then a matching --format
+    default = args.format if args.format in ("csv", "jsonl") else "csv"
+    fmt = args.type or export_format(args.output, default)
+    progress = _report_progress if args.progress else None
+
+    filters = dict(
+        username=_username(args),
+        status=args.status,
+        start_date=args.start,
+        end_date=args.end,
+        chunk_size=args.chunk_size,
+        progress=progress,
+    )
+    if args.output == "-":
+        if fmt == "parquet":
+            raise ValueError("Parquet export needs an output file")
+        sys.stdout.flush()
+        export_books(sys.stdout.buffer, fmt, **filters)
+        sys.stdout.buffer.flush()
+    else:
+        export_books(args.output, fmt, **filters)
+    if progress is not None:
+        print(file=sys.stderr)
+    return 0
+
+
+def _report_archived(rows: int) -> None:
+    print(f"\r{rows} book(s) archived", end="", file=sys.stderr, flush=True)
+
+
+def cmd_archive(args) -> int:
+    from src.archive import archive_books, archive_cutoff
+
+    cutoff = archive_cutoff(args.older_than)
+    progress = _report_archived if args.progress else None
+    archived = archive_books(
+        args.older_than, args.batch_size, args.pause, username=args.user, progress=progress
+    )
+    if progress is not None:
+        print(file=sys.stderr)
+    emit([(archived, cutoff)], ["archived", "ended_before"], args.format)
+    return 0
+
+
+def cmd_migrate(args) -> int:
+    from src import migrate
+
+    if args.status:
+        pending = migrate.status()
+    else:
+        pending = migrate.migrate(args.target)
+    emit([(m.version, m.name) for m in pending], ["version", "name"], args.format)
+    return 0
+
+
+def cmd_serve(args) -> int:
+    from src.server import serve
+
+    serve(args.host, args.port, verbose=args.verbose)
+    return 0
+
+
+def cmd_menu(args) -> int:
+    from src import app
+
+    if args.no_animations:
+        app.ANIMATIONS = False
+    app.main()
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m src.cli", description="My read app")
+    parser.add_argument("--format", "-f", choices=FORMATS, default="table")
+    # every command only sees this user's books (READAPP_USER by default)
+    parser.add_argument("--user", "-u", default=os.environ.get("READAPP_USER") or None)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("insert", help="add a book")
+    p.add_argument("--username", help="defaults to --user")
+    p.add_argument("--title", required=True)
+    p.add_argument("--description")
+    p.add_argument("--status")
+    p.add_argument("--pct-read", type=int)
+    p.add_argument("--start", help="start reading date (YYYY-MM-DD)")
+    p.add_argument("--end", help="end reading date (YYYY-MM-DD)")
+    p.set_defaults(func=cmd_insert)
+
+    p = commands.add_parser("update", help="change columns of a book")
+    p.add_argument("id", type=int)
+    p.add_argument("--set", action="append", required=True, metavar="COLUMN=VALUE")
+    p.set_defaults(func=cmd_update)
+
+    p = commands.add_parser("delete", help="delete books by id")
+    p.add_argument("ids", type=int, nargs="+")
+    p.set_defaults(func=cmd_delete)
+
+    p = commands.add_parser("view", help="list every book")
+    p.add_argument("--fetch-size", type=int)
+    p.set_defaults(func=cmd_view)
+
+    p = commands.add_parser("search", help="search books by title")
+    p.add_argument("query")
+    p.add_argument("--full-text", action="store_true", help="search descriptions too")
+    p.add_argument("--limit", type=int, default=20)
+    p.add_argument("--offset", type=int, default=0, help="only with --full-text")
+    p.add_argument("--after", type=_search_key, metavar="SCORE,ID",
+                   help="title search page after this row, as printed after the last page")
+    p.set_defaults(func=cmd_search)
+
+    p = commands.add_parser("stats", help="reading statistics of a user")
+    p.add_argument("username", nargs="?", help="defaults to --user")
+    p.add_argument("--start", type=date.fromisoformat)
+    p.add_argument("--end", type=date.fromisoformat)
+    p.set_defaults(func=cmd_stats)
+
+    p = commands.add_parser("analytics", help="velocity, durations, streaks and forecasts")
+    p.add_argument("--file", help="read an export file instead of the database")
+    p.add_argument("--username")
+    p.add_argument("--start", type=date.fromisoformat, help="started on or after")
+    p.add_argument("--end", type=date.fromisoformat, help="finished on or before")
+    p.add_argument("--horizon", type=int, default=90, help="forecast days ahead")
+    p.set_defaults(func=cmd_analytics)
+
+    p = commands.add_parser("import", help="bulk insert from a CSV or JSONL file")
+    p.add_argument("path")
+    p.add_argument("--batch-size", type=int, default=5000)
+    p.add_argument("--sync", action="store_true",
+                   help="update books already there (same username and title) instead of failing")
+    p.set_defaults(func=cmd_import)
+
+    p = commands.add_parser("export", help="stream books to CSV, JSONL or Parquet")
+    p.add_argument("output", nargs="?", default="-", help="file, - for stdout")
+    p.add_argument("--type", choices=["csv", "jsonl", "parquet"],
+                   help="defaults to the file suffix")
+    p.add_argument("--username")
+    p.add_argument("--status")
+    p.add_argument("--start", type=date.fromisoformat, help="started on or after")
+    p.add_argument("--end", type=date.fromisoformat, help="finished on or before")
+    p.add_argument("--chunk-size", type=int)
+    p.add_argument("--progress", action="store_true", help="report rows on stderr")
+    p.set_defaults(func=cmd_export)
+
+    p = commands.add_parser("archive", help="move long completed books to the archive")
+    p.add_argument("--older-than", type=int, metavar="DAYS",
+                   help="finished more than DAYS ago (default db_archive_after_days, 365)")
+    p.add_argument("--batch-size", type=int, default=1000, help="books per transaction")
+    p.add_argument("--pause", type=float, default=0.0, help="seconds between batches")
+    p.add_argument("--progress", action="store_true", help="report books on stderr")
+    p.set_defaults(func=cmd_archive)
+
+    p = commands.add_parser("migrate", help="apply the schema migrations")
+    p.add_argument("--status", action="store_true", help="only list pending migrations")
+    p.add_argument("--target", type=int, help="stop after this version")
+    p.set_defaults(func=cmd_migrate)
+
+    p = commands.add_parser("serve", help="run the HTTP/JSON API")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8000)
+    p.add_argument("--verbose", action="store_true", help="log every request")
+    p.set_defaults(func=cmd_serve)
+
+    p = commands.add_parser("menu", help="start the interactive menu")
+    p.add_argument("--no-animations", action="store_true")
+    p.set_defaults(func=cmd_menu)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from src.migrate import MigrationError
+
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except (ImportError, OSError, ValueError, MigrationError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    except Exception as e:
+        # psycopg is only imported by the commands that query, so it is
+        # looked up rather than imported here
+        pg = sys.modules.get("psycopg")
+        if pg is None or not isinstance(e, pg.Error):
+            raise
+        print(f"error: {str(e).strip()}", file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,192 +1,856 @@
-import psycopg as pg
-import environ
-from typing import Optional, Union
+import json
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+import threading
+from typing import Any, Optional, Union, Iterable, Iterator, List, Mapping, Tuple, Callable
 from datetime import date
-from tabulate import tabulate
-from src.schema import CreateDataType, FetchByIdDataType
-from src.util import ROOT_DIR
+from src.schema import (
+    CreateDataType,
+    Book,
+    DuplicateBookError,
+    ImportReport,
+    ReadingStats,
+    RowError,
+    SearchHit,
+    StatusEnum,
+    SyncReport,
+    TitleSearchPage,
+    book_row,
+    validate_record,
+)
+from src.queries import (
+    ARCHIVE_HORIZON_QUERY,
+    ARCHIVE_TABLE_QUERY,
+    COMPLETED_BOOKS_QUERY,
+    COPY_BOOKS_QUERY,
+    COUNT_COMPLETED_QUERY,
+    COUNT_COMPLETED_SUMMARY_QUERY,
+    COUNT_PENDING_QUERY,
+    COUNT_PENDING_SUMMARY_QUERY,
+    DELETE_QUERY,
+    FETCH_BY_ID_QUERY,
+    FULL_TEXT_SEARCH_QUERY,
+    INSERT_QUERY,
+    INSERT_WITH_ID_QUERY,
+    PENDING_BOOKS_QUERY,
+    READING_STATS_QUERY,
+    SUMMARY_TABLES_QUERY,
+    RESERVE_IDS_QUERY,
+    TITLE_SEARCH_QUERY,
+    TRUNCATE_QUERY,
+    UPSERT_MANY_QUERY,
+    DELETE_MANY_QUERY,
+    DELETE_USER_ARCHIVE_QUERY,
+    DELETE_USER_BOOKS_QUERY,
+    TRUNCATE_WITH_ARCHIVE_QUERY,
+    VIEW_TABLE_QUERY,
+    copy_row,
+    insert_params,
+    like_pattern,
+    month_buckets,
+    reaches_archive,
+    update_many_statements,
+    update_query,
+    upsert_params,
+    reading_stats_result,
+    scoped,
+    scoped_params,
+    title_search,
+    title_search_page,
+    with_archive,
+)
+from src import instrument
+from src.cache import LRUCache, MISSING
+from src.settings import env, fetch_size as default_fetch_size, search_limit
 
-# CREATE A CONNECTION
+# psycopg, the pool and the .env settings are only loaded once the first
+# query needs a connection (see Database.__init__)
 
-env = environ.Env()
-# /home/..../myreadapp/.env
-# Set .env from the root dir to be read
-environ.Env.read_env(str(ROOT_DIR / '.env'))
+# read-through cache in front of fetch_by_id, local writes invalidate it
+book_cache = LRUCache(maxsize=1024, ttl=60.0)
+# results of the count/stats queries, dropped on any change to the table
+aggregate_cache = LRUCache(maxsize=256, ttl=60.0)
 
+# channel the bookclub triggers publish changes on (see db/create.sql)
+CHANGE_CHANNEL = 'bookclub_changes'
+
+
+def _conninfo() -> str:
+    from psycopg.conninfo import make_conninfo
+
+    settings = env()
+    # db_dsn (e.g. postgresql://user:pw@primary:5432/db) wins over the
+    # separate settings
+    dsn = settings.str('db_dsn', default='')
+    if dsn:
+        return make_conninfo(dsn)
+    return make_conninfo(
+        host=settings.str('db_host'),
+        dbname=settings.str('db_name'),
+        user=settings.str('db_user'),
+        password=settings.str('db_password'),
+        port=settings.int('db_port'),
+    )
+
+
+def _replica_conninfos() -> List[str]:
+    # db_replicas: comma separated DSNs of streaming replicas of the primary;
+    # what they leave out (user, password, dbname) is taken from the primary
+    from psycopg.conninfo import conninfo_to_dict, make_conninfo
+
+    primary = _conninfo()
+    return [
+        make_conninfo(primary, **conninfo_to_dict(dsn.strip()))
+        for dsn in env().list('db_replicas', default=[])
+        if dsn.strip()
+    ]
 
 
 # SINGLETON CLASS
 class Database(object):
     _instance = None
-    
+    _lock = threading.Lock()
+
     def __new__(cls):
-        if Database._instance is None:
-            Database._instance = super().__new__(cls)
-            Database._instance.__init__()
-            
-        return Database._instance._conn
+        # a closed pool (e.g. after Database().close()) is replaced on next use
+        instance = Database._instance
+        if instance is None or instance._pool.closed:
+            # one thread builds the pool, the others wait for it; the
+            # instance is only shared once it was built without error
+            with Database._lock:
+                instance = Database._instance
+                if instance is None or instance._pool.closed:
+                    if instance is not None and instance._replicas is not None:
+                        instance._replicas.close()
+                    instance = super().__new__(cls)
+                    instance.__init__()
+                    Database._instance = instance
+
+        return instance._pool
     
     def __init__(self) -> None:
-        # connects to postgres server
+        from src.pool import Pool, ReplicaPool
+
+        # connects to postgres server through a pool of connections
         # it is bad practice to reveal sensitive information in your code
-        self._conn = pg.connect(
-            host=env.str('db_host'),
-            dbname=env.str('db_name'),
-            user=env.str('db_user'),
-            password=env.str('db_password'),
-            port=env.int('db_port')
+        configure = partial(_configure_connection, instrumented=_instrumented())
+        self._pool = Pool(
+            _conninfo(),
+            min_size=env().int('db_pool_min_size', default=1),
+            max_size=env().int('db_pool_max_size', default=10),
+            max_idle=env().float('db_pool_max_idle', default=600.0),
+            timeout=env().float('db_pool_timeout', default=30.0),
+            configure=configure,
         )
+        # a pool per replica; reads wait less for one, so a dead replica
+        # costs a short delay before the next one (or the primary) is used
+        replicas = [
+            Pool(
+                conninfo,
+                min_size=env().int('db_pool_min_size', default=1),
+                max_size=env().int('db_pool_max_size', default=10),
+                max_idle=env().float('db_pool_max_idle', default=600.0),
+                timeout=env().float('db_replica_timeout', default=2.0),
+                configure=configure,
+            )
+            for conninfo in _replica_conninfos()
+        ]
+        self._replicas = ReplicaPool(
+            replicas,
+            self._pool,
+            retry_interval=env().float('db_replica_retry_interval', default=30.0),
+        ) if replicas else None
+        _configure_caches()
 
+    @classmethod
+    def replicas(cls):
+        # the ReplicaPool, None without db_replicas
+        cls()
+        return cls._instance._replicas
 
-def insert_data(data: CreateDataType) -> None:
-    # get the connection
-    conn = Database()
-    # define the query
-    query = """
-            INSERT INTO read.bookclub(
-                username,
-                title,
-                description,
-                status,
-                pct_read,
-                start_read_date,
-                end_read_date               
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id;           
-    """
-    # create the cursor session
-    with conn.cursor() as cursor:
-        # use the cursor session to execute the query
-        cursor.execute(query, tuple(data.values()))
-        inserted_id = cursor.fetchone()[0]
+
+# READ/WRITE SPLITTING
+# Writes always go to the primary. Reads of the functions below go to a
+# replica, except in a context (thread or asyncio task) that wrote less than
+# db_read_your_writes seconds ago, which keeps reading the primary so it
+# sees its own writes despite the replication lag.
+
+# time.monotonic() of the last write in this context, and in the process
+_last_write: ContextVar[float] = ContextVar('last_write', default=float('-inf'))
+_last_process_write = float('-inf')
+# set by primary_reads()
+_primary_only: ContextVar[bool] = ContextVar('primary_only', default=False)
+
+
+def _read_your_writes_window() -> float:
+    return env().float('db_read_your_writes', default=2.0)
+
+
+def _wrote(book_ids: Optional[Iterable[int]] = None) -> None:
+    # called after every local commit, see _books_changed for book_ids
+    global _last_process_write
+    now = time.monotonic()
+    _last_write.set(now)
+    _last_process_write = now
+    _books_changed(book_ids)
+
+
+def _replica_safe() -> bool:
+    return (
+        not _primary_only.get()
+        and time.monotonic() - _last_write.get() >= _read_your_writes_window()
+    )
+
+
+def _cacheable(pool, primary=None) -> bool:
+    # a replica may still return rows a recent local write changed, which
+    # must not end up in the caches the write just invalidated
+    return pool is (primary or Database()) or (
+        time.monotonic() - _last_process_write >= _read_your_writes_window()
+    )
+
+
+def read_pool():
+    # the pool read-only functions use: a replica when there are any and
+    # this context may read from one, the primary otherwise
+    primary = Database()
+    replicas = Database.replicas()
+    if replicas is None or not _replica_safe():
+        return primary
+    return replicas
+
+
+@contextmanager
+def primary_reads() -> Iterator[None]:
+    # every read in the block goes to the primary
+    token = _primary_only.set(True)
+    try:
+        yield
+    finally:
+        _primary_only.reset(token)
+
+
+def _instrumented() -> bool:
+    # per-function query timings (see src/instrument.py), on by default
+    instrument.set_slow_query_threshold(env().float('db_slow_query_ms', default=500.0))
+    return env().bool('db_instrument', default=True)
+
+
+# type info of the read.state enum, fetched with the first connection
+_status_info = None
+
+
+def _configure_connection(conn, instrumented: bool) -> None:
+    # pool `configure` hook: status columns load as StatusEnum (and
+    # StatusEnum parameters dump as read.state) on every connection
+    from psycopg.types.enum import EnumInfo, register_enum
+    global _status_info
+
+    if _status_info is None:
+        _status_info = EnumInfo.fetch(conn, "read.state")
+        # the pool only takes connections back idle
         conn.commit()
-        return inserted_id
+    if _status_info is not None:
+        register_enum(_status_info, conn, StatusEnum)
+    if instrumented:
+        instrument.configure(conn)
+
+
+# SCHEMA CHECKS
+# Shared with src.async_database: each check is a generator that yields
+# the queries it needs and is sent back their first row, so the sync and
+# the async functions only differ in how they run them (_check and
+# src.async_database._check).
+
+# whether the summary tables of migration 0007 exist, checked once
+_summary: Optional[bool] = None
+
+
+def _summary_check():
+    global _summary
+    if _summary is None:
+        row = yield SUMMARY_TABLES_QUERY
+        _summary = row[0] and env().bool('db_use_summary', default=True)
+    return _summary
+
+
+# whether the archive of migration 0009 exists, checked once
+_archive: Optional[bool] = None
+
+
+def _archive_check():
+    global _archive
+    if _archive is None:
+        row = yield ARCHIVE_TABLE_QUERY
+        _archive = row[0]
+    return _archive
+
+
+_ARCHIVE_HORIZON_KEY = ('archive_horizon',)
+
+
+def _horizon_check():
+    # the newest archived end date (aggregate_cache[_ARCHIVE_HORIZON_KEY]),
+    # None without an archive or while it is empty
+    if not (yield from _archive_check()):
+        return None
+    row = yield ARCHIVE_HORIZON_QUERY
+    return row[0]
+
+
+def _check(cursor, check):
+    try:
+        query = next(check)
+        while True:
+            cursor.execute(query)
+            query = check.send(cursor.fetchone())
+    except StopIteration as done:
+        return done.value
+
+
+def _has_summary(cursor) -> bool:
+    return _check(cursor, _summary_check())
+
+
+def _has_archive(cursor) -> bool:
+    return _check(cursor, _archive_check())
+
+
+def _archived(start_date=None) -> bool:
+    # whether a query over books that started reading on or after
+    # start_date (any date when None) has to include the archive
+    if _archive is False:
+        return False
+    horizon = aggregate_cache.get(_ARCHIVE_HORIZON_KEY)
+    if horizon is MISSING:
+        token = aggregate_cache.token()
+        pool = read_pool()
+        with pool.cursor() as cursor:
+            horizon = _check(cursor, _horizon_check())
+        if _cacheable(pool):
+            aggregate_cache.set(_ARCHIVE_HORIZON_KEY, horizon, token)
+    return reaches_archive(horizon, start_date)
+
+
+def _configure_caches() -> None:
+    book_cache.maxsize = env().int('db_cache_size', default=1024)
+    book_cache.ttl = env().float('db_cache_ttl', default=60.0)
+    aggregate_cache.maxsize = env().int('db_aggregate_cache_size', default=256)
+    aggregate_cache.ttl = env().float('db_cache_ttl', default=60.0)
+
+
+def _books_changed(book_ids: Optional[Iterable[int]] = None) -> None:
+    # called after every local write and for every change notification:
+    # aggregates are always dropped, cached rows only for the given ids
+    # (all of them when ids is None)
+    aggregate_cache.clear()
+    if book_ids is None:
+        book_cache.clear()
+    else:
+        for book_id in book_ids:
+            book_cache.invalidate(book_id)
+
+
+# BACKGROUND LISTENER FOR CHANGES MADE BY OTHER PROCESSES
+class ChangeListener(threading.Thread):
+    def __init__(self, channel: str = CHANGE_CHANNEL, poll_interval: float = 1.0) -> None:
+        super().__init__(name='bookclub-change-listener', daemon=True)
+        self.channel = channel
+        # how often the stop flag is checked while no notification arrives
+        self.poll_interval = poll_interval
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        import psycopg as pg
+
+        while not self._stopped.is_set():
+            try:
+                # dedicated connection: LISTEN needs autocommit and must not
+                # be handed back to the pool
+                with pg.connect(_conninfo(), autocommit=True) as conn:
+                    conn.execute(f'LISTEN {self.channel}')
+                    # notifications sent while we were not listening are lost
+                    _books_changed()
+                    while not self._stopped.is_set():
+                        for notify in conn.notifies(timeout=self.poll_interval):
+                            self.handle(notify.payload)
+            except pg.OperationalError:
+                # connection lost: retry, caches are dropped on reconnect
+                self._stopped.wait(self.poll_interval)
+
+    @staticmethod
+    def handle(payload: str) -> None:
+        # payload: {"op": "UPDATE", "ids": [1, 2]}; ids is null for
+        # TRUNCATE and for statements touching too many rows to list
+        try:
+            change = json.loads(payload)
+        except ValueError:
+            _books_changed()
+            return
+        if change.get('op') == 'INSERT':
+            # new ids are never cached, only the aggregates change
+            _books_changed(())
+        else:
+            _books_changed(change.get('ids'))
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+
+_listener: Optional[ChangeListener] = None
+
+
+def start_listener() -> ChangeListener:
+    # one listener per process is enough, later calls return the running one
+    global _listener
+    if _listener is None or not _listener.is_alive():
+        _listener = ChangeListener()
+        _listener.start()
+    return _listener
+
+
+def stop_listener() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener.join()
+        _listener = None
+
+
+def insert_data(data: CreateDataType) -> int:
+    import psycopg as pg
+
+    # borrow a connection from the pool and create the cursor session
+    with Database().connection() as conn:
+        with conn.cursor() as cursor:
+            # use the cursor session to execute the query
+            try:
+                cursor.execute(INSERT_QUERY, insert_params(data))
+            except pg.errors.UniqueViolation:
+                conn.rollback()
+                raise DuplicateBookError(data["username"], data["title"]) from None
+            inserted_id = cursor.fetchone()[0]
+            conn.commit()
+            _wrote(())
+            return inserted_id
    
-    
-def fetch_by_id(book_id: int) -> Optional[FetchByIdDataType]:
-    conn = Database()
-    query = """
-            SELECT
-                title,
-                description,
-                status,
-                pct_read,
-                start_read_date,
-                end_read_date
-            FROM read.bookclub
-            WHERE id=%s;
-    """
+
+
+def insert_many(records: Iterable, batch_size: int = 5000) -> ImportReport:
+    # records are validated one by one and sent in batches with COPY,
+    # so only one batch is ever held in memory
+    inserted_ids: List[int] = []
+    errors: List[RowError] = []
+    batch: List[Tuple[int, CreateDataType]] = []
+
+    with Database().connection() as conn:
+        for row, raw in enumerate(records, start=1):
+            try:
+                batch.append((row, validate_record(raw)))
+            except ValueError as e:
+                errors.append(RowError(row, str(e)))
+                continue
+            if len(batch) >= batch_size:
+                _copy_batch(conn, batch, inserted_ids, errors)
+                batch = []
+        if batch:
+            _copy_batch(conn, batch, inserted_ids, errors)
+
+    _wrote(())
+    return ImportReport(inserted_ids, errors)
+
+
+def _copy_batch(conn, batch, inserted_ids, errors) -> None:
+    import psycopg as pg
+
     with conn.cursor() as cursor:
-        cursor.execute(query, (book_id,))
+        cursor.execute(RESERVE_IDS_QUERY, (len(batch),))
+        ids = [r[0] for r in cursor.fetchall()]
+        conn.commit()
+
+    rows = [copy_row(book_id, data) for book_id, (_, data) in zip(ids, batch)]
+    try:
+        with conn.cursor() as cursor:
+            with cursor.copy(COPY_BOOKS_QUERY) as copy:
+                for r in rows:
+                    copy.write_row(r)
+        conn.commit()
+        inserted_ids.extend(ids)
+        return
+    except pg.Error:
+        conn.rollback()
+
+    # the batch was rejected as a whole: retry row by row to find the culprits
+    for (row, _), r in zip(batch, rows):
+        try:
+            with conn.transaction():
+                with conn.cursor() as cursor:
+                    cursor.execute(INSERT_WITH_ID_QUERY, r)
+            inserted_ids.append(r[0])
+        except pg.Error as e:
+            errors.append(RowError(row, str(e).strip()))
+
+
+def sync_many(records: Iterable, batch_size: int = 5000) -> SyncReport:
+    # like insert_many, but a book that exists already (same username and
+    # title) is updated instead of duplicated, and only if it changed; so a
+    # resync of the same list writes nothing. One statement per batch.
+    report = SyncReport([], [], 0, 0, 0, [])
+    batch: List[Tuple[int, CreateDataType]] = []
+
+    with Database().connection() as conn:
+        for row, raw in enumerate(records, start=1):
+            try:
+                batch.append((row, validate_record(raw)))
+            except ValueError as e:
+                report.errors.append(RowError(row, str(e)))
+                continue
+            if len(batch) >= batch_size:
+                report = _upsert_batch(conn, batch, report)
+                batch = []
+        if batch:
+            report = _upsert_batch(conn, batch, report)
+
+    _wrote(report.inserted_ids + report.updated_ids)
+    return report
+
+
+def _upsert_batch(conn, batch, report: SyncReport) -> SyncReport:
+    import psycopg as pg
+
+    failed = 0
+    # upsert_params keeps the last record of each book
+    duplicates = len(batch) - len({(data["username"], data["title"]) for _, data in batch})
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(UPSERT_MANY_QUERY, upsert_params(data for _, data in batch))
+            changed = cursor.fetchall()
+        conn.commit()
+    except pg.Error:
+        conn.rollback()
+        # the batch was rejected as a whole: retry row by row to find the
+        # culprits; a later record of the same book then updates the earlier
+        duplicates = 0
+        changed = []
+        for row, data in batch:
+            try:
+                with conn.transaction():
+                    with conn.cursor() as cursor:
+                        cursor.execute(UPSERT_MANY_QUERY, upsert_params([data]))
+                        changed.extend(cursor.fetchall())
+            except pg.Error as e:
+                report.errors.append(RowError(row, str(e).strip()))
+                failed += 1
+
+    archived = 0
+    for book_id, inserted in changed:
+        if book_id is None:
+            archived += 1
+        else:
+            (report.inserted_ids if inserted else report.updated_ids).append(book_id)
+    return report._replace(
+        unchanged=report.unchanged + len(batch) - failed - duplicates - len(changed),
+        duplicates=report.duplicates + duplicates,
+        archived=report.archived + archived,
+    )
+
+
+def fetch_by_id(book_id: int, username: Optional[str] = None) -> Optional[Book]:
+    # with a username, books of other users are not found
+    book = book_cache.get(book_id)
+    if book is not MISSING:
+        return book if username is None or book.username == username else None
+    token = book_cache.token()
+    # live books only: archived ones cannot be updated or deleted, and
+    # callers fetch a book to change it
+    pool = read_pool()
+    with pool.cursor(row_factory=book_row) as cursor:
+        cursor.execute(scoped(FETCH_BY_ID_QUERY, username), scoped_params((book_id,), username))
         book = cursor.fetchone()
-        return book
+    # missing ids are not cached, a later insert may create them
+    if book is not None and _cacheable(pool):
+        book_cache.set(book_id, book, token)
+    return book
 
 def update_data(
-    book_id: int, column: str, data: Union[str, date, int]
+    book_id: int, column: str, data: Union[str, date, int], username: Optional[str] = None
 ) -> Optional[int]:
-    conn = Database()
-    query = """
-        UPDATE read.bookclub
-        SET """+ column +"""=%s
-        WHERE id=%s RETURNING id;
-    """
-    with conn.cursor() as cursor:
-        cursor.execute(query, [data, book_id])
-        updated_book_id = cursor.fetchone()[0]
-        conn.commit()
-        return updated_book_id
+    with Database().connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                update_query(column, username), scoped_params([data, book_id], username)
+            )
+            row = cursor.fetchone()
+            conn.commit()
+            _wrote((book_id,))
+            # None when no book matched
+            return row[0] if row is not None else None
     
-def delete_row(book_id: int) -> Optional[int]:
-    conn = Database()
-    query = """
-        DELETE FROM read.bookclub
-        WHERE id=%s
-        RETURNING id; 
-    """
-    with conn.cursor() as cursor:
-        cursor.execute(query, (book_id,))
-        deleted_book_id = cursor.fetchone()[0]
-        conn.commit()
-        return deleted_book_id
+def delete_row(book_id: int, username: Optional[str] = None) -> Optional[int]:
+    with Database().connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(scoped(DELETE_QUERY, username), scoped_params((book_id,), username))
+            row = cursor.fetchone()
+            conn.commit()
+            _wrote((book_id,))
+            return row[0] if row is not None else None
         
-def truncate_table():
-    conn = Database()
-    query = """
-        TRUNCATE TABLE read.bookclub RESTART IDENTITY;   
-    """
-    with conn.cursor() as cursor:
-        cursor.execute(query)
+def truncate_table(username: Optional[str] = None):
+    # with a username only that user's books go, archived ones included
+    with Database().connection() as conn:
+        with conn.cursor() as cursor:
+            archive = _has_archive(cursor)
+            if username is None:
+                cursor.execute(TRUNCATE_WITH_ARCHIVE_QUERY if archive else TRUNCATE_QUERY)
+            else:
+                cursor.execute(DELETE_USER_BOOKS_QUERY, (username,))
+                if archive:
+                    cursor.execute(DELETE_USER_ARCHIVE_QUERY, (username,))
+            conn.commit()
+            _wrote()
+
+
+def update_many(
+    updates: Iterable[Mapping[str, Any]], username: Optional[str] = None
+) -> List[int]:
+    # updates: [{"id": 1, "status": "complete", "pct_read": 100}, ...]
+    # one statement per set of updated columns, all in one transaction
+    statements = update_many_statements(updates, username)
+    updated_ids: List[int] = []
+    with Database().connection() as conn:
+        with conn.cursor() as cursor:
+            for query, params in statements:
+                cursor.execute(query, params)
+                updated_ids.extend(r[0] for r in cursor.fetchall())
         conn.commit()
+    _wrote(updated_ids)
+    return updated_ids
+
+
+def delete_many(book_ids: Iterable[int], username: Optional[str] = None) -> List[int]:
+    with Database().connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                scoped(DELETE_MANY_QUERY, username),
+                scoped_params((list(book_ids),), username),
+            )
+            deleted_ids = [r[0] for r in cursor.fetchall()]
+        conn.commit()
+    _wrote(deleted_ids)
+    return deleted_ids
+
+
+def _stream_pages(
+    query: str, params=None, fetch_size: Optional[int] = None
+) -> Iterator[Tuple[List[str], List[tuple]]]:
+    # the statements count for the public function listing (e.g. iter_table)
+    return instrument.attributed(instrument.caller(), _pages(query, params, fetch_size))
+
+
+def _pages(
+    query: str, params=None, fetch_size: Optional[int] = None
+) -> Iterator[Tuple[List[str], List[tuple]]]:
+    # named (server-side) cursor: postgres keeps the result set and we pull
+    # it over in pages, so memory is bounded by fetch_size, not the table
+    fetch_size = fetch_size or default_fetch_size()
+    with read_pool().connection() as conn:
+        with conn.cursor(name="bookclub_stream", row_factory=book_row) as cursor:
+            cursor.itersize = fetch_size
+            cursor.execute(query, params)
+            column_names = [desc[0] for desc in cursor.description]
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                yield column_names, rows
+
+
+def _stream_rows(query: str, params=None, fetch_size: Optional[int] = None) -> Iterator[Book]:
+    return _rows(_stream_pages(query, params, fetch_size))
+
+
+def _rows(pages: Iterator[Tuple[List[str], List[tuple]]]) -> Iterator[Book]:
+    for _, rows in pages:
+        yield from rows
+
+
+def _print_pages(
+    pages: Iterator[Tuple[List[str], List[tuple]]],
+    pager: Optional[Callable[[], bool]] = None,
+) -> None:
+    # render one page at a time; the pager is asked before fetching the next
+    # one and can stop the listing by returning False
+    from tabulate import tabulate
+
+    page_size = None
+    for column_names, rows in pages:
+        print(tabulate(rows, headers=column_names, tablefmt='fancy_grid'))
+        page_size = page_size or len(rows)
+        # a short page is the last one, nothing left to ask about
+        if len(rows) < page_size:
+            break
+        if pager is not None and not pager():
+            pages.close()
+            break
+
+
+def iter_table(
+    fetch_size: Optional[int] = None, username: Optional[str] = None
+) -> Iterator[Book]:
+    return _stream_rows(
+        scoped(VIEW_TABLE_QUERY, username), scoped_params((), username), fetch_size
+    )
+
+
+def iter_completed_books(
+    start_date, end_date, fetch_size: Optional[int] = None, username: Optional[str] = None
+) -> Iterator[Book]:
+    query = with_archive(COMPLETED_BOOKS_QUERY, _archived(start_date))
+    return _stream_rows(
+        scoped(query, username), scoped_params((start_date, end_date), username), fetch_size
+    )
+
+
+def iter_pending_books(
+    fetch_size: Optional[int] = None, username: Optional[str] = None
+) -> Iterator[Book]:
+    return _stream_rows(
+        scoped(PENDING_BOOKS_QUERY, username), scoped_params((), username), fetch_size
+    )
+
+
+def iter_books_by_title(
+    title: str, fetch_size: Optional[int] = None, username: Optional[str] = None
+) -> Iterator[Book]:
+    return _stream_rows(
+        scoped(with_archive(TITLE_SEARCH_QUERY, _archived()), username),
+        scoped_params((like_pattern(title),), username),
+        fetch_size,
+    )
+
+
+def view_table(
+    fetch_size: Optional[int] = None,
+    pager: Optional[Callable[[], bool]] = None,
+    username: Optional[str] = None,
+):
+    _print_pages(
+        _stream_pages(
+            scoped(VIEW_TABLE_QUERY, username), scoped_params((), username), fetch_size
+        ),
+        pager,
+    )
         
-def view_table():
-    conn = Database()
-    query = """
-        SELECT * FROM read.bookclub
-    """
-    with conn.cursor() as cursor:
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        column_names = [desc[0] for desc in cursor.description]
-        table = tabulate(rows, headers=column_names, tablefmt='fancy_grid')
-        print(table)
-        
-def count_completed_books(start_date, end_date):
-    conn = Database()
-    query1 = """
-        SELECT * FROM read.bookclub
-        WHERE status = 'complete';
-        """
-    query2 = f"""
-        SELECT COUNT(*)
-        FROM read.bookclub 
-        WHERE status = 'complete' 
-        AND start_read_date >= '{start_date}' 
-        AND end_read_date <= '{end_date};'
-        """
-    with conn.cursor() as cursor:
-        cursor.execute(query1)
-        rows = cursor.fetchall()
-        column_names = [desc[0] for desc in cursor.description]
-        table = tabulate(rows, headers=column_names, tablefmt='fancy_grid')
-        print(table)
+def count_completed_books(
+    start_date,
+    end_date,
+    show_rows: bool = False,
+    pager: Optional[Callable[[], bool]] = None,
+    username: Optional[str] = None,
+) -> int:
+    # the listing is opt-in, the count alone is a single aggregate query
+    if show_rows:
+        _print_pages(
+            _stream_pages(
+                scoped(with_archive(COMPLETED_BOOKS_QUERY, _archived(start_date)), username),
+                scoped_params((start_date, end_date), username),
+            ),
+            pager,
+        )
     
-    with conn.cursor() as cursor:
-        cursor.execute(query2)
-        count = cursor.fetchone()[0]
+    key = ('completed', str(start_date), str(end_date), username)
+    count = aggregate_cache.get(key)
+    if count is not MISSING:
         return count
+    token = aggregate_cache.token()
+    months = month_buckets(start_date, end_date)
+    pool = read_pool()
+    with pool.cursor() as cursor:
+        # the summary counts archived books too
+        if months is not None and _has_summary(cursor):
+            cursor.execute(
+                scoped(COUNT_COMPLETED_SUMMARY_QUERY, username), scoped_params(months, username)
+            )
+        else:
+            query = with_archive(COUNT_COMPLETED_QUERY, _archived(start_date))
+            cursor.execute(
+                scoped(query, username),
+                scoped_params((start_date, end_date), username),
+            )
+        count = cursor.fetchone()[0]
+    if _cacheable(pool):
+        aggregate_cache.set(key, count, token)
+    return count
  
    
-def count_pending_books():
-    conn = Database()
-    query1 = """
-        SELECT * FROM read.bookclub
-        WHERE status = 'pending';
-        """
-    query2 = """
-        SELECT COUNT(*) FROM read.bookclub 
-        WHERE status = 'pending';
-        """
-    with conn.cursor() as cursor:
-        cursor.execute(query1)
-        rows = cursor.fetchall()
-        column_names = [desc[0] for desc in cursor.description]
-        table = tabulate(rows, headers=column_names, tablefmt='fancy_grid')
-        print(table)
+def count_pending_books(
+    show_rows: bool = False,
+    pager: Optional[Callable[[], bool]] = None,
+    username: Optional[str] = None,
+) -> int:
+    params = scoped_params((), username)
+    if show_rows:
+        _print_pages(_stream_pages(scoped(PENDING_BOOKS_QUERY, username), params), pager)
         
-    with conn.cursor() as cursor:       
-        cursor.execute(query2)
-        count = cursor.fetchone()[0]
+    key = ('pending', username)
+    count = aggregate_cache.get(key)
+    if count is not MISSING:
         return count
+    token = aggregate_cache.token()
+    pool = read_pool()
+    with pool.cursor() as cursor:
+        if _has_summary(cursor):
+            cursor.execute(scoped(COUNT_PENDING_SUMMARY_QUERY, username), params)
+        else:
+            cursor.execute(scoped(COUNT_PENDING_QUERY, username), params)
+        count = cursor.fetchone()[0]
+    if _cacheable(pool):
+        aggregate_cache.set(key, count, token)
+    return count
+
+
+def reading_stats(
+    username: str, start_date: Optional[date] = None, end_date: Optional[date] = None
+) -> ReadingStats:
+    key = ('stats', username, start_date, end_date)
+    stats = aggregate_cache.get(key)
+    if stats is not MISSING:
+        return stats
+    token = aggregate_cache.token()
+    params = {"username": username, "start_date": start_date, "end_date": end_date}
+    query = with_archive(READING_STATS_QUERY, _archived(start_date))
+    pool = read_pool()
+    with pool.cursor() as cursor:
+        cursor.execute(query, params)
+        stats = reading_stats_result(cursor.fetchone())
+    if _cacheable(pool):
+        aggregate_cache.set(key, stats, token)
+    return stats
+
  
-def search_books_by_title(title):
-    conn = Database()
-    query = f"""
-    SELECT * FROM read.bookclub
-    WHERE title ILIKE '%{title}%';
-    """
-    with conn.cursor() as cursor:    
-        cursor.execute(query)
+def search_books_by_title(
+    title: str,
+    limit: Optional[int] = None,
+    after: Optional[Tuple[float, int]] = None,
+    username: Optional[str] = None,
+) -> TitleSearchPage:
+    limit = limit or search_limit()
+    query, params = title_search(title, limit, after, username, _archived())
+    with read_pool().cursor() as cursor:
+        cursor.execute(query, params)
         rows = cursor.fetchall()
         column_names = [desc[0] for desc in cursor.description]
-        table = tabulate(rows, headers=column_names, tablefmt='fancy_grid')
-        print(table)
-    
\ No newline at end of file
+    return title_search_page(column_names, rows, limit)
+
+
+def search_books(
+    query: str, limit: Optional[int] = None, offset: int = 0, username: Optional[str] = None
+) -> List[SearchHit]:
+    limit = limit or search_limit()
+    params = {"query": query, "limit": limit, "offset": offset, "username": username}
+    sql = with_archive(FULL_TEXT_SEARCH_QUERY, _archived())
+    with read_pool().cursor() as cursor:
+        cursor.execute(scoped(sql, username, named=True), params)
+        return [SearchHit(*row) for row in cursor.fetchall()]
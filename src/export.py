@@ -0,0 +1,126 @@
+from pathlib import Path
+from typing import BinaryIO, Callable, Optional, Union
+from src.database import _archived, read_pool
+from src.queries import (
+    COPY_BINARY_QUERY,
+    COPY_CSV_QUERY,
+    COPY_JSONL_QUERY,
+    EXPORT_COPY_TYPES,
+    export_select,
+)
+from src.settings import fetch_size as default_chunk_size
+
+# STREAMING EXPORT
+# read.bookclub leaves postgres through COPY ... TO STDOUT and goes to the
+# file as it arrives: CSV and JSONL are produced by the server and written
+# verbatim, Parquet is assembled one row group per chunk. Memory stays
+# bounded by the chunk size whatever the size of the table.
+
+FORMATS = ["csv", "jsonl", "parquet"]
+
+SUFFIXES = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl", ".parquet": "parquet"}
+
+
+def export_format(path: Union[str, Path], default: str = "csv") -> str:
+    # the file suffix decides, stdout and unknown suffixes use the default
+    return SUFFIXES.get(Path(str(path)).suffix.lower(), default)
+
+
+def _arrow_schema():
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError("Parquet export needs pyarrow: pip install pyarrow") from None
+
+    return pa.schema([
+        ("id", pa.int32()),
+        ("username", pa.string()),
+        ("title", pa.string()),
+        ("description", pa.string()),
+        ("status", pa.string()),
+        ("pct_read", pa.int16()),
+        ("start_read_date", pa.date32()),
+        ("end_read_date", pa.date32()),
+        ("created_at", pa.timestamp("us")),
+        ("modified_at", pa.timestamp("us")),
+    ])
+
+
+def _copy_text(copy, out: BinaryIO, chunk_size: int, progress, header: bool) -> int:
+    # postgres sends one CopyData message per row (and one for a header),
+    # so counting the messages counts the rows without parsing them
+    rows = -1 if header else 0
+    for data in copy:
+        out.write(data)
+        rows += 1
+        if progress is not None and rows and rows % chunk_size == 0:
+            progress(rows)
+    return max(rows, 0)
+
+
+def _copy_parquet(copy, out: BinaryIO, chunk_size: int, progress) -> int:
+    schema = _arrow_schema()
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    copy.set_types(EXPORT_COPY_TYPES)
+    rows = 0
+    columns = [[] for _ in schema.names]
+    with pq.ParquetWriter(out, schema) as writer:
+        for row in copy.rows():
+            for column, value in zip(columns, row):
+                column.append(value)
+            rows += 1
+            if rows % chunk_size == 0:
+                writer.write_batch(pa.record_batch(columns, schema=schema))
+                columns = [[] for _ in schema.names]
+                if progress is not None:
+                    progress(rows)
+        # the schema is written even when nothing is left (or nothing matched)
+        if columns[0] or not rows:
+            writer.write_batch(pa.record_batch(columns, schema=schema))
+    return rows
+
+
+def export_books(
+    out: Union[str, Path, BinaryIO],
+    fmt: str = "csv",
+    username: Optional[str] = None,
+    status: Optional[str] = None,
+    start_date=None,
+    end_date=None,
+    chunk_size: Optional[int] = None,
+    progress: Optional[Callable[[int], None]] = None,
+) -> int:
+    # writes the matching books to a path or a binary file object and
+    # returns how many there were; progress gets the running row count
+    # after every chunk_size rows
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    if fmt == "parquet":
+        # fail before the query rather than halfway through it
+        _arrow_schema()
+    chunk_size = chunk_size or default_chunk_size()
+    # only completed books are ever archived
+    archived = status in (None, "complete") and _archived(start_date)
+    select, params = export_select(username, status, start_date, end_date, archived=archived)
+
+    if isinstance(out, (str, Path)):
+        with open(out, "wb", buffering=1 << 20) as f:
+            return export_books(
+                f, fmt, username, status, start_date, end_date, chunk_size, progress
+            )
+
+    with read_pool().cursor() as cursor:
+        if fmt == "csv":
+            with cursor.copy(COPY_CSV_QUERY.format(select=select), params) as copy:
+                rows = _copy_text(copy, out, chunk_size, progress, header=True)
+        elif fmt == "jsonl":
+            with cursor.copy(COPY_JSONL_QUERY.format(select=select), params) as copy:
+                rows = _copy_text(copy, out, chunk_size, progress, header=False)
+        else:
+            with cursor.copy(COPY_BINARY_QUERY.format(select=select), params) as copy:
+                rows = _copy_parquet(copy, out, chunk_size, progress)
+    if progress is not None:
+        progress(rows)
+    return rows
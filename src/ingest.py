@@ -0,0 +1,72 @@
+import csv
+import json
+from pathlib import Path
+from collections.abc import Mapping
+from typing import Iterable, Iterator, Optional, Union
+from src.schema import ImportReport, SyncReport
+from src.database import insert_many, sync_many
+
+
+# helpers to stream records out of import files one at a time, so that
+# the size of the file never matters for memory
+
+
+def read_csv(path: Union[str, Path]) -> Iterator[dict]:
+    # first row is the header with the bookclub column names
+    with open(path, newline="", encoding="utf-8") as f:
+        for record in csv.DictReader(f):
+            yield record
+
+
+def read_jsonl(path: Union[str, Path]) -> Iterator[Union[dict, ValueError]]:
+    # one JSON object per line, blank lines are ignored
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                # hand the error on so the row shows up in the import report
+                yield ValueError(f"invalid JSON: {e.msg}")
+
+
+def read_records(path: Union[str, Path]) -> Iterator[Union[dict, ValueError]]:
+    suffix = Path(path).suffix.lower()
+    if suffix == ".csv":
+        return read_csv(path)
+    if suffix in (".jsonl", ".ndjson"):
+        return read_jsonl(path)
+    raise ValueError(f"Unsupported import file type: {suffix or path}")
+
+
+def for_user(records: Iterable, username: str) -> Iterator[Union[dict, ValueError]]:
+    # records without a username are this user's; another user's records
+    # become row errors instead of being written to their books
+    for raw in records:
+        if isinstance(raw, Mapping):
+            owner = raw.get("username")
+            if not owner:
+                raw = {**raw, "username": username}
+            elif owner != username:
+                raw = ValueError(f"record belongs to {owner}, not to {username}")
+        yield raw
+
+
+def import_file(
+    path: Union[str, Path], batch_size: int = 5000, username: Optional[str] = None
+) -> ImportReport:
+    records = read_records(path)
+    if username:
+        records = for_user(records, username)
+    return insert_many(records, batch_size=batch_size)
+
+
+def sync_file(
+    path: Union[str, Path], batch_size: int = 5000, username: Optional[str] = None
+) -> SyncReport:
+    # re-importable: existing books are updated where they changed
+    records = read_records(path)
+    if username:
+        records = for_user(records, username)
+    return sync_many(records, batch_size=batch_size)
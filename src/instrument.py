@@ -0,0 +1,402 @@
+import json
+import logging
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import AsyncIterator, Dict, Iterator, Optional
+
+# QUERY INSTRUMENTATION
+# Every statement run through a pooled connection is timed and attributed
+# to the function that issued it (e.g. src.database.fetch_by_id). Slow
+# statements are logged with their EXPLAIN plan.
+
+logger = logging.getLogger(__name__)
+
+# statements slower than this are logged, see set_slow_query_threshold()
+_slow_query_ms = 500.0
+
+# frames from these modules are plumbing, not the caller we want
+_SKIP_MODULES = ("psycopg", "psycopg_pool", "contextlib", __name__, "src.pool")
+# and the private helpers of these run statements for a public function
+_HELPER_MODULES = ("src.database", "src.async_database")
+
+# the function a lazy listing runs its statements for, see attributed()
+_attributed: ContextVar[Optional[str]] = ContextVar("attributed", default=None)
+
+# only these can be prefixed with EXPLAIN
+_EXPLAINABLE = ("select", "insert", "update", "delete", "with", "values")
+
+# bucket bounds of the Prometheus histograms, in seconds
+PROMETHEUS_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+class Histogram(object):
+    # HdrHistogram-style log-linear buckets over microseconds: exact up to
+    # 64us, then every power of two is split in 32 equal steps, so any
+    # recorded value is off by at most ~3% and memory stays bounded
+    SUB_BUCKET_BITS = 5
+
+    def __init__(self) -> None:
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        us = max(int(seconds * 1_000_000), 0)
+        shift = max(us.bit_length() - 1 - self.SUB_BUCKET_BITS, 0)
+        bucket = (us >> shift) << shift
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    @classmethod
+    def _upper(cls, bucket: int) -> int:
+        shift = max(bucket.bit_length() - 1 - cls.SUB_BUCKET_BITS, 0)
+        return bucket + (1 << shift) - 1
+
+    def percentile(self, q: float) -> float:
+        # upper bound of the bucket holding the q-th percentile, in seconds
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return min(self._upper(bucket) / 1_000_000, self.max)
+        return self.max
+
+    def cumulative(self, bound: float) -> int:
+        # number of values <= bound seconds, for Prometheus buckets
+        limit = bound * 1_000_000
+        return sum(n for b, n in self.counts.items() if self._upper(b) <= limit)
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.percentile(50) * 1000,
+            "p90_ms": self.percentile(90) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "max_ms": self.max * 1000,
+        }
+
+
+class FunctionStats(object):
+    def __init__(self) -> None:
+        self.latency = Histogram()
+        self.pool_wait = Histogram()
+        self.rows = 0
+
+
+_stats: Dict[str, FunctionStats] = {}
+_lock = threading.Lock()
+
+
+def set_slow_query_threshold(ms: float) -> None:
+    global _slow_query_ms
+    _slow_query_ms = ms
+
+
+def caller() -> str:
+    # first frame outside psycopg, the pool and this module that is not a
+    # private helper of src.database (e.g. insert_many, not _copy_batch)
+    function = _attributed.get()
+    if function is not None:
+        return function
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        name = frame.f_code.co_name
+        if not module.startswith(_SKIP_MODULES) and not (
+            module in _HELPER_MODULES and name.startswith("_")
+        ):
+            return f"{module}.{name}"
+        frame = frame.f_back
+    return "unknown"
+
+
+def attributed(function: str, iterator: Iterator) -> Iterator:
+    # a listing only runs once it is consumed, far from the function that
+    # returned it: each step is attributed to that function instead
+    try:
+        while True:
+            token = _attributed.set(function)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                _attributed.reset(token)
+            yield item
+    finally:
+        iterator.close()
+
+
+async def attributed_async(function: str, iterator: AsyncIterator) -> AsyncIterator:
+    try:
+        while True:
+            token = _attributed.set(function)
+            try:
+                item = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                _attributed.reset(token)
+            yield item
+    finally:
+        await iterator.aclose()
+
+
+def _function_stats(function: str) -> FunctionStats:
+    stats = _stats.get(function)
+    if stats is None:
+        stats = _stats.setdefault(function, FunctionStats())
+    return stats
+
+
+def record_query(function: str, seconds: float, rows: int) -> None:
+    with _lock:
+        stats = _function_stats(function)
+        stats.latency.record(seconds)
+        stats.rows += max(rows, 0)
+
+
+def record_rows(function: str, rows: int) -> None:
+    with _lock:
+        _function_stats(function).rows += rows
+
+
+def record_pool_wait(seconds: float) -> None:
+    function = caller()
+    with _lock:
+        _function_stats(function).pool_wait.record(seconds)
+
+
+def _is_slow(seconds: float) -> bool:
+    return seconds * 1000 >= _slow_query_ms
+
+
+def _explainable(query) -> Optional[str]:
+    if isinstance(query, str) and query.split(None, 1)[0].lower() in _EXPLAINABLE:
+        return query
+    return None
+
+
+def _log_slow(function: str, seconds: float, query, plan: Optional[str]) -> None:
+    logger.warning(
+        "slow query in %s (%.1f ms):\n%s\n%s",
+        function,
+        seconds * 1000,
+        query if isinstance(query, str) else repr(query),
+        plan or "(no plan available)",
+    )
+
+
+def explain(conn, query, params) -> Optional[str]:
+    import psycopg as pg
+
+    text = _explainable(query)
+    # pipeline mode cannot run an extra statement in between
+    if text is None or getattr(conn, "_pipeline", None) is not None:
+        return None
+    try:
+        # savepoint: a failing EXPLAIN must not abort the caller's transaction
+        with conn.transaction():
+            with pg.Cursor(conn) as cursor:
+                cursor.execute("EXPLAIN " + text, params)
+                return "\n".join(r[0] for r in cursor.fetchall())
+    except pg.Error:
+        return None
+
+
+async def explain_async(conn, query, params) -> Optional[str]:
+    import psycopg as pg
+
+    text = _explainable(query)
+    if text is None or getattr(conn, "_pipeline", None) is not None:
+        return None
+    try:
+        async with conn.transaction():
+            async with pg.AsyncCursor(conn) as cursor:
+                await cursor.execute("EXPLAIN " + text, params)
+                return "\n".join(r[0] for r in await cursor.fetchall())
+    except pg.Error:
+        return None
+
+
+@lru_cache(maxsize=None)
+def cursor_classes():
+    # psycopg cursor classes that time execute(); built on first use so
+    # psycopg is only imported once a connection exists
+    import psycopg as pg
+
+    class InstrumentedCursor(pg.Cursor):
+        def execute(self, query, params=None, **kwargs):
+            function = caller()
+            start = time.perf_counter()
+            try:
+                return super().execute(query, params, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                record_query(function, elapsed, self.rowcount)
+                if _is_slow(elapsed):
+                    _log_slow(function, elapsed, query, explain(self.connection, query, params))
+
+    class InstrumentedServerCursor(pg.ServerCursor):
+        # the DECLARE is timed, rows are only known as they are fetched
+        function = "unknown"
+
+        def execute(self, query, params=None, **kwargs):
+            self.function = function = caller()
+            start = time.perf_counter()
+            try:
+                return super().execute(query, params, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                record_query(function, elapsed, 0)
+                if _is_slow(elapsed):
+                    _log_slow(function, elapsed, query, None)
+
+        def fetchone(self):
+            row = super().fetchone()
+            if row is not None:
+                record_rows(self.function, 1)
+            return row
+
+        def fetchmany(self, size=0):
+            rows = super().fetchmany(size)
+            record_rows(self.function, len(rows))
+            return rows
+
+        def fetchall(self):
+            rows = super().fetchall()
+            record_rows(self.function, len(rows))
+            return rows
+
+    class InstrumentedAsyncCursor(pg.AsyncCursor):
+        async def execute(self, query, params=None, **kwargs):
+            function = caller()
+            start = time.perf_counter()
+            try:
+                return await super().execute(query, params, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                record_query(function, elapsed, self.rowcount)
+                if _is_slow(elapsed):
+                    plan = await explain_async(self.connection, query, params)
+                    _log_slow(function, elapsed, query, plan)
+
+    class InstrumentedAsyncServerCursor(pg.AsyncServerCursor):
+        function = "unknown"
+
+        async def execute(self, query, params=None, **kwargs):
+            self.function = function = caller()
+            start = time.perf_counter()
+            try:
+                return await super().execute(query, params, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                record_query(function, elapsed, 0)
+                if _is_slow(elapsed):
+                    _log_slow(function, elapsed, query, None)
+
+        async def fetchone(self):
+            row = await super().fetchone()
+            if row is not None:
+                record_rows(self.function, 1)
+            return row
+
+        async def fetchmany(self, size=0):
+            rows = await super().fetchmany(size)
+            record_rows(self.function, len(rows))
+            return rows
+
+        async def fetchall(self):
+            rows = await super().fetchall()
+            record_rows(self.function, len(rows))
+            return rows
+
+    return (
+        InstrumentedCursor,
+        InstrumentedServerCursor,
+        InstrumentedAsyncCursor,
+        InstrumentedAsyncServerCursor,
+    )
+
+
+def configure(conn) -> None:
+    # pool `configure` hook: new connections create instrumented cursors
+    cursor, server_cursor, _, _ = cursor_classes()
+    conn.cursor_factory = cursor
+    conn.server_cursor_factory = server_cursor
+
+
+async def configure_async(conn) -> None:
+    _, _, async_cursor, async_server_cursor = cursor_classes()
+    conn.cursor_factory = async_cursor
+    conn.server_cursor_factory = async_server_cursor
+
+
+def reset() -> None:
+    with _lock:
+        _stats.clear()
+
+
+def snapshot() -> dict:
+    with _lock:
+        return {
+            function: {
+                "latency": stats.latency.summary(),
+                "pool_wait": stats.pool_wait.summary(),
+                "rows": stats.rows,
+            }
+            for function, stats in sorted(_stats.items())
+        }
+
+
+def snapshot_json() -> str:
+    return json.dumps(snapshot(), indent=2)
+
+
+def _histogram_lines(name: str, function: str, histogram: Histogram) -> list:
+    label = f'function="{function}"'
+    lines = [
+        f'{name}_bucket{{{label},le="{bound}"}} {histogram.cumulative(bound)}'
+        for bound in PROMETHEUS_BUCKETS
+    ]
+    lines.append(f'{name}_bucket{{{label},le="+Inf"}} {histogram.count}')
+    lines.append(f"{name}_sum{{{label}}} {histogram.total}")
+    lines.append(f"{name}_count{{{label}}} {histogram.count}")
+    return lines
+
+
+def prometheus_text() -> str:
+    # Prometheus text exposition format (version 0.0.4)
+    with _lock:
+        items = sorted(_stats.items())
+        lines = [
+            "# HELP readapp_query_duration_seconds Time spent executing statements.",
+            "# TYPE readapp_query_duration_seconds histogram",
+        ]
+        for function, stats in items:
+            lines += _histogram_lines("readapp_query_duration_seconds", function, stats.latency)
+        lines += [
+            "# HELP readapp_pool_wait_seconds Time spent waiting for a pooled connection.",
+            "# TYPE readapp_pool_wait_seconds histogram",
+        ]
+        for function, stats in items:
+            lines += _histogram_lines("readapp_pool_wait_seconds", function, stats.pool_wait)
+        lines += [
+            "# HELP readapp_query_rows_total Rows returned or affected by statements.",
+            "# TYPE readapp_query_rows_total counter",
+        ]
+        for function, stats in items:
+            lines.append(f'readapp_query_rows_total{{function="{function}"}} {stats.rows}')
+    return "\n".join(lines) + "\n"
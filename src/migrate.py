@@ -0,0 +1,175 @@
+import hashlib
+import re
+import sys
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+from src.util import ROOT_DIR
+
+# SCHEMA MIGRATIONS
+# db/create.sql creates the schema, db/migrations/NNNN_name.sql evolve it.
+# Migrations run in version order and are recorded with a checksum in
+# read.schema_migrations; editing one after it was applied is an error.
+# A file starting with `-- migrate: no-transaction` runs statement by
+# statement in autocommit (needed for CREATE INDEX CONCURRENTLY), every
+# other file runs in a single transaction.
+
+MIGRATIONS_DIR = ROOT_DIR / 'db' / 'migrations'
+
+NO_TRANSACTION = '-- migrate: no-transaction'
+
+# any constant works, it only has to be the same for every migrator
+LOCK_ID = 7_301_962
+
+VERSION_TABLE_QUERY = """
+    CREATE SCHEMA IF NOT EXISTS read;
+    CREATE TABLE IF NOT EXISTS read.schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name VARCHAR(200) NOT NULL,
+        checksum CHAR(64) NOT NULL,
+        applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+"""
+
+_FILE_NAME = re.compile(r'^(\d+)_(\w+)\.sql$')
+
+
+class MigrationError(Exception):
+    pass
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    sql: str
+    checksum: str
+    transactional: bool
+
+
+def load_migrations(directory: Path = MIGRATIONS_DIR) -> List[Migration]:
+    migrations = {}
+    for path in sorted(Path(directory).glob('*.sql')):
+        match = _FILE_NAME.match(path.name)
+        if match is None:
+            raise MigrationError(f'Bad migration file name: {path.name}')
+        version = int(match.group(1))
+        if version in migrations:
+            raise MigrationError(f'Duplicate migration version {version}: {path.name}')
+        sql = path.read_text(encoding='utf-8')
+        migrations[version] = Migration(
+            version,
+            match.group(2),
+            sql,
+            hashlib.sha256(sql.encode('utf-8')).hexdigest(),
+            not sql.lstrip().startswith(NO_TRANSACTION),
+        )
+    return [migrations[v] for v in sorted(migrations)]
+
+
+def split_statements(sql: str) -> List[str]:
+    # split on ; outside of quotes, comments and $$ bodies
+    statements, current = [], []
+    i, n = 0, len(sql)
+    while i < n:
+        c = sql[i]
+        if sql.startswith('--', i):
+            end = sql.find('\n', i)
+            i = n if end == -1 else end + 1
+            continue
+        if c == "'":
+            end = sql.find("'", i + 1)
+            while end != -1 and sql.startswith("''", end):
+                end = sql.find("'", end + 2)
+            end = n if end == -1 else end + 1
+            current.append(sql[i:end])
+            i = end
+            continue
+        if c == '$':
+            tag = re.match(r'\$\w*\$', sql[i:])
+            if tag:
+                end = sql.find(tag.group(0), i + len(tag.group(0)))
+                end = n if end == -1 else end + len(tag.group(0))
+                current.append(sql[i:end])
+                i = end
+                continue
+        if c == ';':
+            statement = ''.join(current).strip()
+            if statement:
+                statements.append(statement)
+            current = []
+        else:
+            current.append(c)
+        i += 1
+    statement = ''.join(current).strip()
+    if statement:
+        statements.append(statement)
+    return statements
+
+
+def applied_migrations(conn) -> dict:
+    conn.execute(VERSION_TABLE_QUERY)
+    rows = conn.execute('SELECT version, checksum FROM read.schema_migrations').fetchall()
+    return dict(rows)
+
+
+def pending_migrations(conn, migrations: List[Migration]) -> List[Migration]:
+    applied = applied_migrations(conn)
+    for migration in migrations:
+        checksum = applied.get(migration.version)
+        if checksum is not None and checksum.strip() != migration.checksum:
+            raise MigrationError(
+                f'Migration {migration.version}_{migration.name} was changed after it was applied'
+            )
+    return [m for m in migrations if m.version not in applied]
+
+
+def apply_migration(conn, migration: Migration) -> None:
+    record = """
+        INSERT INTO read.schema_migrations(version, name, checksum)
+        VALUES (%s, %s, %s);
+    """
+    params = (migration.version, migration.name, migration.checksum)
+    if migration.transactional:
+        with conn.transaction():
+            conn.execute(migration.sql)
+            conn.execute(record, params)
+    else:
+        for statement in split_statements(migration.sql):
+            conn.execute(statement)
+        conn.execute(record, params)
+
+
+def _print_notice(diagnostic) -> None:
+    # RAISE NOTICE of a migration, e.g. how many rows it had to move
+    print(f'  {diagnostic.message_primary}', file=sys.stderr)
+
+
+def migrate(target: Optional[int] = None, directory: Path = MIGRATIONS_DIR) -> List[Migration]:
+    # applies the pending migrations up to `target` (all by default) and
+    # returns them; safe to run from several processes at once
+    import psycopg as pg
+    from src.database import _conninfo
+
+    migrations = load_migrations(directory)
+    applied = []
+    with pg.connect(_conninfo(), autocommit=True) as conn:
+        conn.add_notice_handler(_print_notice)
+        conn.execute('SELECT pg_advisory_lock(%s)', (LOCK_ID,))
+        try:
+            for migration in pending_migrations(conn, migrations):
+                if target is not None and migration.version > target:
+                    break
+                print(f'applying {migration.version}_{migration.name}', file=sys.stderr)
+                apply_migration(conn, migration)
+                applied.append(migration)
+        finally:
+            conn.execute('SELECT pg_advisory_unlock(%s)', (LOCK_ID,))
+    return applied
+
+
+def status(directory: Path = MIGRATIONS_DIR) -> List[Migration]:
+    # migrations not applied yet
+    import psycopg as pg
+    from src.database import _conninfo
+
+    with pg.connect(_conninfo(), autocommit=True) as conn:
+        return pending_migrations(conn, load_migrations(directory))
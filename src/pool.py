@@ -0,0 +1,227 @@
+import itertools
+import time
+from contextlib import AsyncExitStack, ExitStack, contextmanager, asynccontextmanager
+from typing import AsyncIterator, Callable, Iterator, List, Optional
+import psycopg as pg
+from psycopg_pool import AsyncConnectionPool, ConnectionPool, PoolTimeout
+from src.instrument import record_pool_wait
+
+
+# POOLED CONNECTION LAYER
+class Pool(object):
+    def __init__(
+        self,
+        conninfo: str,
+        min_size: int = 1,
+        max_size: int = 10,
+        max_idle: float = 600.0,
+        timeout: float = 30.0,
+        configure: Optional[Callable] = None,
+    ) -> None:
+        # configure: called with every new connection (e.g. instrumentation)
+        self._pool = ConnectionPool(
+            conninfo,
+            min_size=min_size,
+            max_size=max_size,
+            # connections idle for longer than this are closed (down to min_size)
+            max_idle=max_idle,
+            # how long a caller waits for a free connection before failing
+            timeout=timeout,
+            # run a cheap query on checkout so a dropped connection is
+            # replaced instead of being handed to the caller
+            check=ConnectionPool.check_connection,
+            configure=configure,
+            open=True,
+        )
+
+    @property
+    def closed(self) -> bool:
+        return self._pool.closed
+
+    @contextmanager
+    def connection(self) -> Iterator[pg.Connection]:
+        # borrow a connection, it goes back to the pool at the end of the block
+        # (committed on success, rolled back if the block raised)
+        start = time.perf_counter()
+        with self._pool.connection() as conn:
+            record_pool_wait(time.perf_counter() - start)
+            yield conn
+
+    @contextmanager
+    def cursor(self, **kwargs) -> Iterator[pg.Cursor]:
+        # kwargs go to conn.cursor(), e.g. row_factory
+        with self.connection() as conn:
+            with conn.cursor(**kwargs) as cursor:
+                yield cursor
+
+    def stats(self) -> dict:
+        return self._pool.get_stats()
+
+    def close(self) -> None:
+        self._pool.close()
+
+
+# ASYNCIO COUNTERPART, same settings and behaviour as Pool
+class AsyncPool(object):
+    def __init__(
+        self,
+        conninfo: str,
+        min_size: int = 1,
+        max_size: int = 10,
+        max_idle: float = 600.0,
+        timeout: float = 30.0,
+        configure: Optional[Callable] = None,
+    ) -> None:
+        # an async pool can only be opened from a running event loop, so
+        # it is opened on first use (see connection())
+        self._pool = AsyncConnectionPool(
+            conninfo,
+            min_size=min_size,
+            max_size=max_size,
+            max_idle=max_idle,
+            timeout=timeout,
+            check=AsyncConnectionPool.check_connection,
+            configure=configure,
+            open=False,
+        )
+        self._opened = False
+
+    @property
+    def closed(self) -> bool:
+        return self._opened and self._pool.closed
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[pg.AsyncConnection]:
+        if not self._opened:
+            await self._pool.open()
+            self._opened = True
+        start = time.perf_counter()
+        async with self._pool.connection() as conn:
+            record_pool_wait(time.perf_counter() - start)
+            yield conn
+
+    @asynccontextmanager
+    async def cursor(self, **kwargs) -> AsyncIterator[pg.AsyncCursor]:
+        async with self.connection() as conn:
+            async with conn.cursor(**kwargs) as cursor:
+                yield cursor
+
+    def stats(self) -> dict:
+        return self._pool.get_stats()
+
+    async def close(self) -> None:
+        await self._pool.close()
+
+
+# READ-ONLY REPLICAS
+# Each checkout starts at the next replica (round-robin). A replica that
+# cannot hand out a connection is skipped for retry_interval seconds and
+# the next one is tried; reads fall back to the primary when none is left.
+# Only the checkout fails over: an error once the block runs is raised
+# (benching the replica if it broke the connection).
+class _Replicas(object):
+    def __init__(self, replicas: list, primary, retry_interval: float = 30.0) -> None:
+        self.replicas = replicas
+        self.primary = primary
+        self.retry_interval = retry_interval
+        self._next = itertools.count()
+        # replica index -> time.monotonic() until which it is skipped
+        self._down_until = [0.0] * len(replicas)
+
+    @property
+    def closed(self) -> bool:
+        return self.primary.closed
+
+    def _candidates(self) -> List[int]:
+        now = time.monotonic()
+        start = next(self._next)
+        n = len(self.replicas)
+        return [
+            i for i in ((start + k) % n for k in range(n)) if self._down_until[i] <= now
+        ]
+
+    def _failed(self, index: int) -> None:
+        self._down_until[index] = time.monotonic() + self.retry_interval
+
+    def healthy(self) -> List[bool]:
+        now = time.monotonic()
+        return [until <= now for until in self._down_until]
+
+    def stats(self) -> dict:
+        return {
+            "replicas": [
+                dict(pool.stats(), healthy=healthy)
+                for pool, healthy in zip(self.replicas, self.healthy())
+            ]
+        }
+
+
+class ReplicaPool(_Replicas):
+    # Pool interface over a list of Pools to replicas of primary
+
+    @contextmanager
+    def connection(self) -> Iterator[pg.Connection]:
+        with ExitStack() as stack:
+            conn = replica = None
+            for index in self._candidates():
+                try:
+                    conn = stack.enter_context(self.replicas[index].connection())
+                    replica = index
+                    break
+                except (pg.OperationalError, PoolTimeout):
+                    self._failed(index)
+            if conn is None:
+                conn = stack.enter_context(self.primary.connection())
+            try:
+                yield conn
+            except Exception:
+                # the replica went away mid-query
+                if replica is not None and conn.broken:
+                    self._failed(replica)
+                raise
+
+    @contextmanager
+    def cursor(self, **kwargs) -> Iterator[pg.Cursor]:
+        with self.connection() as conn:
+            with conn.cursor(**kwargs) as cursor:
+                yield cursor
+
+    def close(self) -> None:
+        # the primary is closed by its owner
+        for pool in self.replicas:
+            pool.close()
+
+
+class AsyncReplicaPool(_Replicas):
+    # ReplicaPool over AsyncPools
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[pg.AsyncConnection]:
+        async with AsyncExitStack() as stack:
+            conn = replica = None
+            for index in self._candidates():
+                try:
+                    conn = await stack.enter_async_context(self.replicas[index].connection())
+                    replica = index
+                    break
+                except (pg.OperationalError, PoolTimeout):
+                    self._failed(index)
+            if conn is None:
+                conn = await stack.enter_async_context(self.primary.connection())
+            try:
+                yield conn
+            except Exception:
+                # the replica went away mid-query
+                if replica is not None and conn.broken:
+                    self._failed(replica)
+                raise
+
+    @asynccontextmanager
+    async def cursor(self, **kwargs) -> AsyncIterator[pg.AsyncCursor]:
+        async with self.connection() as conn:
+            async with conn.cursor(**kwargs) as cursor:
+                yield cursor
+
+    async def close(self) -> None:
+        for pool in self.replicas:
+            await pool.close()
@@ -0,0 +1,611 @@
+import re
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+from src.schema import (
+    UPDATABLE_COLUMNS,
+    ReadingStats,
+    StatusEnum,
+    TitleSearchPage,
+    check_column,
+    parse_date,
+)
+
+# SQL shared by the sync (src.database) and async (src.async_database) APIs,
+# plus the helpers that build their parameters and shape their results
+
+INSERT_QUERY = """
+        INSERT INTO read.bookclub(
+            username,
+            title,
+            description,
+            status,
+            pct_read,
+            start_read_date,
+            end_read_date               
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id;           
+"""
+
+# COPY cannot return ids, so bulk inserts reserve them from the sequence up front
+RESERVE_IDS_QUERY = """
+    SELECT nextval(pg_get_serial_sequence('read.bookclub', 'id'))
+    FROM generate_series(1, %s);
+"""
+
+COPY_BOOKS_QUERY = """
+    COPY read.bookclub(
+        id,
+        username,
+        title,
+        description,
+        status,
+        pct_read,
+        start_read_date,
+        end_read_date
+    ) FROM STDIN
+"""
+
+INSERT_WITH_ID_QUERY = """
+    INSERT INTO read.bookclub(
+        id,
+        username,
+        title,
+        description,
+        status,
+        pct_read,
+        start_read_date,
+        end_read_date
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s);
+"""
+
+# idempotent import (migration 0010): books are matched on (username,
+# title). The update only runs when a value differs, so an unchanged book
+# is not written at all and keeps its modified_at. Inserted rows have no
+# previous version (xmax = 0). Books already archived are left alone and
+# come back as a (NULL, NULL) row each.
+UPSERT_MANY_QUERY = """
+    WITH v AS (
+        SELECT *
+        FROM unnest(
+            %s::varchar[], %s::varchar[], %s::text[], %s::read.state[],
+            %s::smallint[], %s::date[], %s::date[]
+        ) AS v(username, title, description, status, pct_read, start_read_date, end_read_date)
+    ), archived AS (
+        SELECT username, title FROM v
+        WHERE EXISTS (
+            SELECT 1 FROM read.bookclub_archive AS a
+            WHERE a.username = v.username AND a.title = v.title
+        )
+    ), upserted AS (
+        INSERT INTO read.bookclub AS b (
+            username,
+            title,
+            description,
+            status,
+            pct_read,
+            start_read_date,
+            end_read_date
+        )
+        SELECT v.* FROM v
+        WHERE (v.username, v.title) NOT IN (SELECT username, title FROM archived)
+        ON CONFLICT (username, title) DO UPDATE SET
+            description = EXCLUDED.description,
+            status = EXCLUDED.status,
+            pct_read = EXCLUDED.pct_read,
+            start_read_date = EXCLUDED.start_read_date,
+            end_read_date = EXCLUDED.end_read_date,
+            modified_at = CURRENT_TIMESTAMP
+        WHERE (b.description, b.status, b.pct_read, b.start_read_date, b.end_read_date)
+            IS DISTINCT FROM
+            (EXCLUDED.description, EXCLUDED.status, EXCLUDED.pct_read,
+             EXCLUDED.start_read_date, EXCLUDED.end_read_date)
+        RETURNING b.id, xmax = 0 AS inserted
+    )
+    SELECT id, inserted FROM upserted
+    UNION ALL
+    SELECT NULL, NULL FROM archived;
+"""
+
+UPDATE_QUERY = """
+    UPDATE read.bookclub
+    SET {column}=%s, modified_at=CURRENT_TIMESTAMP
+    WHERE id=%s {user} RETURNING id;
+"""
+
+# one statement for many rows: every column travels as one array parameter
+# and unnest() zips them back into rows, so the SQL text and the number of
+# parameters do not grow with the number of rows
+UPDATE_MANY_QUERY = """
+    UPDATE read.bookclub AS b
+    SET {assignments}, modified_at = CURRENT_TIMESTAMP
+    FROM unnest(%s::integer[], {arrays}) AS v(id, {columns})
+    WHERE b.id = v.id {user}
+    RETURNING b.id;
+"""
+
+DELETE_MANY_QUERY = """
+    DELETE FROM read.bookclub
+    WHERE id = ANY(%s) {user}
+    RETURNING id;
+"""
+
+DELETE_QUERY = """
+    DELETE FROM read.bookclub
+    WHERE id=%s {user}
+    RETURNING id; 
+"""
+
+TRUNCATE_QUERY = """
+    TRUNCATE TABLE read.bookclub RESTART IDENTITY;   
+"""
+
+# truncate_table for one user: only their partition is scanned
+DELETE_USER_BOOKS_QUERY = """
+    DELETE FROM read.bookclub
+    WHERE username = %s;
+"""
+
+# truncate_table once migration 0009 added the archive
+TRUNCATE_WITH_ARCHIVE_QUERY = """
+    TRUNCATE TABLE read.bookclub, read.bookclub_archive RESTART IDENTITY;
+"""
+
+DELETE_USER_ARCHIVE_QUERY = """
+    DELETE FROM read.bookclub_archive
+    WHERE username = %s;
+"""
+
+# every column except search_vector, which is only useful to postgres
+BOOK_COLUMNS = """
+    id,
+    username,
+    title,
+    description,
+    status,
+    pct_read,
+    start_read_date,
+    end_read_date,
+    created_at,
+    modified_at
+"""
+
+BOOK_COLUMN_NAMES = [c.strip() for c in BOOK_COLUMNS.split(",")]
+
+FETCH_BY_ID_QUERY = f"""
+    SELECT {BOOK_COLUMNS}
+    FROM read.bookclub
+    WHERE id=%s {{user}};
+"""
+
+# exports send status as text, so no reader needs to know the enum type
+EXPORT_COLUMNS = """
+    id,
+    username,
+    title,
+    description,
+    status::text AS status,
+    pct_read,
+    start_read_date,
+    end_read_date,
+    created_at,
+    modified_at
+"""
+
+# postgres types of EXPORT_COLUMNS, for reading a binary COPY
+EXPORT_COPY_TYPES = [
+    "int4", "text", "text", "text", "text",
+    "int2", "date", "date", "timestamp", "timestamp",
+]
+
+# the columns the analytics work on, in the order of ANALYTICS_COPY_TYPES
+ANALYTICS_COLUMNS = """
+    username,
+    status::text AS status,
+    pct_read,
+    start_read_date,
+    end_read_date
+"""
+
+ANALYTICS_COPY_TYPES = ["text", "text", "int2", "date", "date"]
+
+# CSV is written by postgres as-is, header included
+COPY_CSV_QUERY = "COPY ({select}) TO STDOUT WITH (FORMAT csv, HEADER true)"
+
+# one JSON document per row; control characters never appear unescaped in
+# JSON, so with them as quote and delimiter csv mode writes the text verbatim
+COPY_JSONL_QUERY = """
+    COPY (SELECT row_to_json(b) FROM ({select}) b) TO STDOUT
+    WITH (FORMAT csv, QUOTE e'\\x01', DELIMITER e'\\x02')
+"""
+
+COPY_BINARY_QUERY = "COPY ({select}) TO STDOUT WITH (FORMAT binary)"
+
+
+# queries shared by the streaming listings
+VIEW_TABLE_QUERY = f"""
+    SELECT {BOOK_COLUMNS} FROM read.bookclub
+    WHERE TRUE {{user}}
+"""
+
+COMPLETED_BOOKS_QUERY = f"""
+    SELECT {BOOK_COLUMNS} FROM read.bookclub
+    WHERE status = 'complete'
+    AND start_read_date >= %s
+    AND end_read_date <= %s {{user}};
+"""
+
+PENDING_BOOKS_QUERY = f"""
+    SELECT {BOOK_COLUMNS} FROM read.bookclub
+    WHERE status = 'pending' {{user}};
+"""
+
+TITLE_SEARCH_QUERY = f"""
+    SELECT {BOOK_COLUMNS} FROM read.bookclub
+    WHERE title ILIKE %s {{user}};
+"""
+
+COUNT_COMPLETED_QUERY = """
+    SELECT COUNT(*)
+    FROM read.bookclub 
+    WHERE status = 'complete' 
+    AND start_read_date >= %s 
+    AND end_read_date <= %s {user};
+"""
+
+COUNT_PENDING_QUERY = """
+    SELECT COUNT(*) FROM read.bookclub 
+    WHERE status = 'pending' {user};
+"""
+
+# answered from the trigger-maintained summary tables (migration 0007)
+SUMMARY_TABLES_QUERY = """
+    SELECT to_regclass('read.bookclub_stats') IS NOT NULL
+    AND to_regclass('read.bookclub_completion_stats') IS NOT NULL;
+"""
+
+COUNT_PENDING_SUMMARY_QUERY = """
+    SELECT COALESCE(SUM(books), 0)::bigint
+    FROM read.bookclub_stats
+    WHERE status = 'pending' {user};
+"""
+
+COUNT_COMPLETED_SUMMARY_QUERY = """
+    SELECT COALESCE(SUM(books), 0)::bigint
+    FROM read.bookclub_completion_stats
+    WHERE start_month >= %s
+    AND end_month <= %s {user};
+"""
+
+# a book falls in the range by its reading dates, or by when it was added
+# for books that have none yet. All three figures come back in one
+# round-trip; the scoped CTE is materialized once and scanned once.
+READING_STATS_QUERY = """
+    WITH scoped AS (
+        SELECT status, pct_read, end_read_date
+        FROM read.bookclub
+        WHERE username = %(username)s
+        AND (
+            %(start_date)s::date IS NULL
+            OR COALESCE(start_read_date, end_read_date, created_at::date) >= %(start_date)s
+        )
+        AND (
+            %(end_date)s::date IS NULL
+            OR COALESCE(end_read_date, start_read_date, created_at::date) <= %(end_date)s
+        )
+    )
+    SELECT
+        (
+            SELECT COALESCE(json_object_agg(status, n), '{}')
+            FROM (SELECT status, COUNT(*) AS n FROM scoped GROUP BY status) AS s
+        ),
+        (
+            SELECT COALESCE(json_agg(json_build_array(month, n) ORDER BY month), '[]')
+            FROM (
+                SELECT to_char(end_read_date, 'YYYY-MM') AS month, COUNT(*) AS n
+                FROM scoped
+                WHERE status = 'complete' AND end_read_date IS NOT NULL
+                GROUP BY month
+            ) AS m
+        ),
+        (SELECT AVG(pct_read)::float FROM scoped);
+"""
+
+# ARCHIVE (migration 0009)
+ARCHIVE_TABLE_QUERY = """
+    SELECT to_regclass('read.bookclub_archive') IS NOT NULL;
+"""
+
+# the newest end_read_date that was archived, NULL while the archive is empty
+ARCHIVE_HORIZON_QUERY = """
+    SELECT max(end_read_date) FROM read.bookclub_archive;
+"""
+
+# one archive batch in one statement: the rows are locked, deleted from
+# the live table and inserted into the archive. SKIP LOCKED passes over
+# rows a user is changing right now, they go with a later batch.
+ARCHIVE_BATCH_QUERY = f"""
+    WITH batch AS (
+        SELECT id, username
+        FROM read.bookclub
+        WHERE status = 'complete'
+        AND end_read_date < %(cutoff)s {{user}}
+        LIMIT %(batch_size)s
+        FOR UPDATE SKIP LOCKED
+    ), moved AS (
+        DELETE FROM read.bookclub AS b
+        USING batch
+        WHERE b.id = batch.id AND b.username = batch.username
+        RETURNING b.*
+    )
+    INSERT INTO read.bookclub_archive ({BOOK_COLUMNS})
+    SELECT {BOOK_COLUMNS} FROM moved
+    RETURNING id;
+"""
+
+# for each archive batch: rather roll a batch back (and retry it, see
+# src.archive.LOCK_ATTEMPTS) than queue behind an exclusive lock and have
+# every other query queue behind the batch
+ARCHIVE_LOCK_TIMEOUT_QUERY = "SET LOCAL lock_timeout = '5s';"
+
+# the live and the archived books as one relation; filters on it are
+# pushed down into both tables and use their indexes
+ALL_BOOKS = f"""(
+        SELECT {BOOK_COLUMNS}, search_vector FROM read.bookclub
+        UNION ALL
+        SELECT {BOOK_COLUMNS}, search_vector FROM read.bookclub_archive
+    ) AS bookclub"""
+
+_LIVE_TABLE = re.compile(r"\bFROM read\.bookclub\b")
+
+
+def with_archive(query: str, archived: bool = True) -> str:
+    # the query over live and archived books instead of the live ones only
+    return _LIVE_TABLE.sub(lambda _: f"FROM {ALL_BOOKS}", query) if archived else query
+
+
+def reaches_archive(horizon: Optional[date], start_date=None) -> bool:
+    # archived books ended reading on or before the horizon, so a range
+    # starting after it cannot contain any (nor can an empty archive)
+    if horizon is None:
+        return False
+    try:
+        start = parse_date(start_date)
+    except ValueError:
+        return True
+    return start is None or start <= horizon
+
+
+# ranked title search, served by the pg_trgm GIN index on title. Pages are
+# ordered by (score DESC, id) and the next page starts after the last
+# (score, id) seen (keyset pagination), so deep pages cost the same as the first.
+# word_similarity() is a real; the score is sent as float8 so the value the
+# client gets back compares equal to it, and ties at a page boundary are kept
+RANKED_TITLE_SEARCH_QUERY = """
+    SELECT
+        id,
+        title,
+        description,
+        status,
+        pct_read,
+        start_read_date,
+        end_read_date,
+        word_similarity(%(title)s, title)::float8 AS score
+    FROM read.bookclub
+    WHERE title ILIKE %(pattern)s {user}
+    {after}
+    ORDER BY score DESC, id
+    LIMIT %(limit)s;
+"""
+
+RANKED_TITLE_SEARCH_AFTER = """
+    AND (
+        word_similarity(%(title)s, title)::float8 < %(score)s::float8
+        OR word_similarity(%(title)s, title)::float8 = %(score)s::float8 AND id > %(id)s
+    )
+"""
+
+# websearch syntax: plain words, "quoted phrases", -excluded, OR.
+# Matching and ranking run on the GIN indexed search_vector; snippets
+# are only built for the rows of the requested page.
+FULL_TEXT_SEARCH_QUERY = """
+    SELECT
+        id,
+        title,
+        status,
+        rank,
+        ts_headline(
+            'english',
+            COALESCE(description, title),
+            tsquery,
+            'MaxFragments=2, MaxWords=20, MinWords=5'
+        ) AS snippet
+    FROM (
+        SELECT
+            id,
+            title,
+            description,
+            status,
+            ts_rank_cd(search_vector, tsquery) AS rank,
+            tsquery
+        FROM read.bookclub, websearch_to_tsquery('english', %(query)s) AS tsquery
+        WHERE search_vector @@ tsquery {user}
+        ORDER BY rank DESC, id
+        LIMIT %(limit)s OFFSET %(offset)s
+    ) AS hits
+    ORDER BY rank DESC, id;
+"""
+
+
+# per-user scoping: the queries end their WHERE clause with {user}, which
+# is left empty to reach every user's books, or becomes a username filter
+# that lets postgres skip the other partitions (migration 0008). The
+# username is the last positional parameter, %(username)s where named.
+USER_FILTER = "AND username = %s"
+NAMED_USER_FILTER = "AND username = %(username)s"
+
+
+def scoped(query: str, username: Optional[str], named: bool = False) -> str:
+    user_filter = ""
+    if username is not None:
+        user_filter = NAMED_USER_FILTER if named else USER_FILTER
+    return query.replace("{user}", user_filter)
+
+
+def scoped_params(params: Iterable, username: Optional[str]) -> list:
+    params = list(params)
+    if username is not None:
+        params.append(username)
+    return params
+
+
+def update_query(column: str, username: Optional[str] = None) -> str:
+    return scoped(UPDATE_QUERY, username).format(column=check_column(column))
+
+
+def update_many_statements(
+    updates: Iterable[Mapping[str, Any]], username: Optional[str] = None
+) -> List[Tuple[str, list]]:
+    # each update is {"id": ..., column: value, ...}. Updates of the same id
+    # are merged (later values win), then rows changing the same set of
+    # columns share one statement.
+    merged: Dict[int, Dict[str, Any]] = {}
+    for update in updates:
+        update = dict(update)
+        book_id = update.pop("id")
+        for column in update:
+            check_column(column)
+        if "status" in update and update["status"] is not None:
+            update["status"] = StatusEnum(update["status"]).value
+        merged.setdefault(book_id, {}).update(update)
+
+    groups: Dict[Tuple[str, ...], List[Tuple[int, Dict[str, Any]]]] = {}
+    for book_id, update in merged.items():
+        if update:
+            groups.setdefault(tuple(sorted(update)), []).append((book_id, update))
+
+    statements = []
+    for columns, rows in groups.items():
+        query = scoped(UPDATE_MANY_QUERY, username).format(
+            assignments=", ".join(f"{c} = v.{c}" for c in columns),
+            arrays=", ".join(f"%s::{UPDATABLE_COLUMNS[c]}[]" for c in columns),
+            columns=", ".join(columns),
+        )
+        params = [[book_id for book_id, _ in rows]]
+        params += [[update[c] for _, update in rows] for c in columns]
+        statements.append((query, scoped_params(params, username)))
+    return statements
+
+
+def month_buckets(start_date, end_date) -> Optional[Tuple[date, date]]:
+    # the completion summary counts books per start and end month, so it
+    # can only answer ranges from the first day of a month to the last day
+    # of a month; returns the (start month, end month) to query, else None
+    try:
+        start, end = parse_date(start_date), parse_date(end_date)
+    except ValueError:
+        return None
+    if start is None or end is None or start.day != 1:
+        return None
+    if (end + timedelta(days=1)).day != 1:
+        return None
+    return start, end.replace(day=1)
+
+
+def export_select(
+    username: Optional[str] = None,
+    status: Optional[str] = None,
+    start_date=None,
+    end_date=None,
+    columns: str = EXPORT_COLUMNS,
+    ordered: bool = True,
+    archived: bool = False,
+) -> Tuple[str, list]:
+    # the date bounds filter like the completed listing: reading started on
+    # or after start_date and ended on or before end_date
+    conditions, params = [], []
+    for condition, value in (
+        ("username = %s", username),
+        ("status = %s", status),
+        ("start_read_date >= %s", start_date),
+        ("end_read_date <= %s", end_date),
+    ):
+        if value is not None:
+            conditions.append(condition)
+            params.append(value)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    order = "ORDER BY id" if ordered else ""
+    query = f"SELECT {columns} FROM read.bookclub {where} {order}"
+    return with_archive(query, archived), params
+
+
+def like_pattern(keyword: str) -> str:
+    # match the keyword literally anywhere in the value
+    escaped = keyword.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def insert_params(data) -> tuple:
+    # column order of INSERT_QUERY, whatever the key order of the dict
+    return (
+        data["username"],
+        data["title"],
+        data["description"],
+        StatusEnum(data["status"]).value,
+        data["pct_read"],
+        data["start_read_date"],
+        data["end_read_date"],
+    )
+
+
+def upsert_params(records: Iterable) -> list:
+    # one array per column of UPSERT_MANY_QUERY. A statement cannot change
+    # a row twice, so records with the same (username, title) are merged
+    # first and the last one wins.
+    rows = {}
+    for data in records:
+        params = insert_params(data)
+        rows[params[:2]] = params
+    return [list(column) for column in zip(*rows.values())] or [[] for _ in range(7)]
+
+
+def copy_row(book_id: int, data) -> tuple:
+    # column order of COPY_BOOKS_QUERY / INSERT_WITH_ID_QUERY
+    return (book_id,) + insert_params(data)
+
+
+def title_search(
+    title: str,
+    limit: int,
+    after: Optional[Tuple[float, int]] = None,
+    username: Optional[str] = None,
+    archived: bool = False,
+) -> Tuple[str, dict]:
+    params = {
+        "title": title,
+        "pattern": like_pattern(title),
+        "limit": limit,
+        "username": username,
+    }
+    keyset = ""
+    if after is not None:
+        params["score"], params["id"] = after
+        keyset = RANKED_TITLE_SEARCH_AFTER
+    query = scoped(with_archive(RANKED_TITLE_SEARCH_QUERY, archived), username, named=True)
+    return query.format(after=keyset), params
+
+
+def title_search_page(
+    column_names: List[str], rows: List[tuple], limit: int
+) -> TitleSearchPage:
+    next_key = (rows[-1][-1], rows[-1][0]) if len(rows) == limit else None
+    return TitleSearchPage(column_names, rows, next_key)
+
+
+def reading_stats_result(row: tuple) -> ReadingStats:
+    status_counts, per_month, avg_pct_read = row
+    return {
+        "status_counts": {
+            status.value: status_counts.get(status.value, 0) for status in StatusEnum
+        },
+        "completions_per_month": [(month, n) for month, n in per_month],
+        "avg_pct_read": avg_pct_read,
+    }
@@ -1,5 +1,5 @@
-from typing import TypedDict, Optional, Tuple
-from datetime import date
+from typing import TypedDict, Optional, Tuple, List, NamedTuple, Mapping, Dict
+from datetime import date, datetime
 from enum import Enum
 
 
@@ -8,6 +8,10 @@ class StatusEnum(Enum):
     pending='pending'
     complete='complete'
 
+    # tables and f-strings show the label, as postgres does
+    def __str__(self) -> str:
+        return self.value
+
 
 class CreateDataType(TypedDict):
     username: str
@@ -19,4 +23,173 @@ class CreateDataType(TypedDict):
     end_read_date: Optional[date]
 
 
-FetchByIdDataType = Tuple[str, str, StatusEnum, int, Optional[date], Optional[date]]
\ No newline at end of file
+class Book(NamedTuple):
+    # one row of read.bookclub (every column but search_vector). A tuple
+    # underneath: no per-row __dict__, fields are read by name, and it
+    # still iterates in column order for tabulate and csv
+    id: int
+    username: str
+    title: str
+    description: Optional[str]
+    status: StatusEnum
+    pct_read: int
+    start_read_date: Optional[date]
+    end_read_date: Optional[date]
+    created_at: Optional[datetime]
+    modified_at: Optional[datetime]
+
+
+def book_row(cursor):
+    # psycopg row factory for queries selecting BOOK_COLUMNS: the values
+    # come in field order, so each row is a single tuple construction
+    return Book._make
+
+
+def json_default(value):
+    # json.dumps default for the values of a Book: dates as ISO strings,
+    # statuses as their label
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    return str(value)
+
+
+# columns callers may update, with the postgres type their values are cast to
+UPDATABLE_COLUMNS: Dict[str, str] = {
+    "title": "varchar",
+    "description": "text",
+    "status": "read.state",
+    "pct_read": "smallint",
+    "start_read_date": "date",
+    "end_read_date": "date",
+}
+
+
+def check_column(column: str) -> str:
+    # column names end up in the SQL text, only known ones are let through
+    if column not in UPDATABLE_COLUMNS:
+        raise ValueError(f"Column {column!r} cannot be updated")
+    return column
+
+
+class ReadingStats(TypedDict):
+    status_counts: Dict[str, int]  # one entry per StatusEnum value
+    completions_per_month: List[Tuple[str, int]]  # ("YYYY-MM", count), oldest first
+    avg_pct_read: Optional[float]  # None when no book is in range
+
+class TitleSearchPage(NamedTuple):
+    column_names: List[str]
+    rows: List[tuple]
+    # (score, id) of the last row, pass it as `after` to get the next page;
+    # None once there are no more matches
+    next_key: Optional[Tuple[float, int]]
+
+
+class SearchHit(NamedTuple):
+    id: int
+    title: str
+    status: StatusEnum
+    rank: float
+    snippet: str  # matched words are wrapped in <b>...</b>
+
+
+class RowError(NamedTuple):
+    row: int  # 1-based position of the record in the input
+    error: str
+
+
+class ImportReport(NamedTuple):
+    inserted_ids: List[int]
+    errors: List[RowError]
+
+
+class SyncReport(NamedTuple):
+    inserted_ids: List[int]
+    updated_ids: List[int]
+    unchanged: int  # valid records that matched a book as it already was
+    duplicates: int  # records overridden by a later one for the same book
+    archived: int  # records of archived books, left alone
+    errors: List[RowError]
+
+
+class DuplicateBookError(ValueError):
+    # the user has a book with this title already (migration 0010)
+    def __init__(self, username: str, title: str) -> None:
+        super().__init__(f"book already exists: {title!r} of {username!r}")
+        self.username = username
+        self.title = title
+
+
+def parse_date(value) -> Optional[date]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value))
+
+
+def parse_pct_read(value) -> int:
+    # a whole number: 99.9 must not become 99, nor True become 1
+    if value is None or value == "":
+        return 0
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    number = None
+    if isinstance(value, float):
+        number = value
+    elif isinstance(value, str):
+        try:
+            number = float(value)
+        except ValueError:
+            pass
+    if number is None or not number.is_integer():
+        raise ValueError(f"pct_read must be a whole number, not {value!r}")
+    return int(number)
+
+
+def validate_record(raw) -> CreateDataType:
+    # readers hand over the parse error instead of a record for broken input
+    if isinstance(raw, ValueError):
+        raise raw
+    if not isinstance(raw, Mapping):
+        raise ValueError("record is not an object")
+
+    username = raw.get("username")
+    if not isinstance(username, str) or not username or len(username) > 50:
+        raise ValueError("username is required (text, max 50 characters)")
+    title = raw.get("title")
+    if not isinstance(title, str) or not title or len(title) > 300:
+        raise ValueError("title is required (text, max 300 characters)")
+    description = raw.get("description") or None
+    if description is not None and not isinstance(description, str):
+        raise ValueError("description must be text")
+
+    status = raw.get("status") or StatusEnum.pending
+    pct_read = raw.get("pct_read")
+    try:
+        status = StatusEnum(status)
+        pct_read = parse_pct_read(pct_read)
+        start_read_date = parse_date(raw.get("start_read_date"))
+        end_read_date = parse_date(raw.get("end_read_date"))
+    except (TypeError, ValueError) as e:
+        raise ValueError(str(e)) from None
+
+    # same rule as the CHECK constraint on read.bookclub
+    if not (
+        pct_read == 100 and status is StatusEnum.complete
+        or 0 <= pct_read <= 99 and status is not StatusEnum.complete
+    ):
+        raise ValueError(
+            "pct_read must be 100 when status is complete, otherwise between 0 and 99"
+        )
+
+    return {
+        "username": username,
+        "title": title,
+        "description": description,
+        "status": status,
+        "pct_read": pct_read,
+        "start_read_date": start_read_date,
+        "end_read_date": end_read_date,
+    }
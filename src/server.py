@@ -0,0 +1,355 @@
+import hashlib
+import itertools
+import json
+import re
+import sys
+import traceback
+from datetime import date
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterable, Iterator, Optional
+from urllib.parse import parse_qs, unquote, urlsplit
+import psycopg as pg
+from psycopg_pool import PoolTimeout
+from src import database as db
+from src.schema import Book, DuplicateBookError, json_default, validate_record
+
+# HTTP/JSON API
+# A thread per connection in front of the pooled src.database functions,
+# so as many requests run at once as the pool has connections:
+#
+#   GET    /books[?status=pending|title=..|start=..&end=..][&format=jsonl]
+#   GET    /books/<id>                  ETag, answers If-None-Match with 304
+#   POST   /books                       JSON body, as for the insert command
+#   PATCH  /books/<id>                  JSON body of the columns to change
+#   DELETE /books/<id>
+#   GET    /search?q=..[&full_text=1][&limit=..][&offset=..]
+#   GET    /stats/<username>[?start=..&end=..]
+#   GET    /counts/pending, /counts/completed?start=..&end=..
+#   GET    /metrics                     Prometheus text of src.instrument
+#
+# ?username=.. scopes any of them to one user's books: it is the owner of
+# a created book, and other users' stats are not found
+#
+# python -m src.cli serve --port 8000
+
+# listings are sent in chunks of about this many bytes
+CHUNK_SIZE = 64 * 1024
+
+ROUTES = [
+    ("GET", re.compile(r"/books"), "list_books"),
+    ("POST", re.compile(r"/books"), "create_book"),
+    ("GET", re.compile(r"/books/(\d+)"), "get_book"),
+    ("PATCH", re.compile(r"/books/(\d+)"), "update_book"),
+    ("DELETE", re.compile(r"/books/(\d+)"), "delete_book"),
+    ("GET", re.compile(r"/search"), "search"),
+    ("GET", re.compile(r"/stats/([^/]+)"), "stats"),
+    ("GET", re.compile(r"/counts/(pending|completed)"), "count"),
+    ("GET", re.compile(r"/metrics"), "metrics"),
+]
+
+
+class HTTPError(Exception):
+    def __init__(self, status: HTTPStatus, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+def _dumps(value) -> bytes:
+    return json.dumps(value, default=json_default, separators=(",", ":")).encode()
+
+
+def _book(book: Book) -> dict:
+    return book._asdict()
+
+
+def _date(params: dict, name: str) -> Optional[date]:
+    value = params.get(name)
+    return date.fromisoformat(value) if value else None
+
+
+def _dates(params: dict):
+    # completed-book ranges need both ends
+    start, end = _date(params, "start"), _date(params, "end")
+    if start is None or end is None:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "start and end are required")
+    return start, end
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    # If-None-Match: "*" or a list of entity tags, compared weakly
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+def _int(params: dict, name: str, default: Optional[int] = None) -> Optional[int]:
+    value = params.get(name)
+    return int(value) if value else default
+
+
+class BookClubHandler(BaseHTTPRequestHandler):
+    # keep-alive connections, and chunked transfer for the listings
+    protocol_version = "HTTP/1.1"
+    server_version = "readapp"
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PATCH(self):
+        self._dispatch("PATCH")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def log_message(self, format, *args):
+        # one line per request costs more than the request itself
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def log_error(self, format, *args):
+        # errors are always logged
+        super().log_message(format, *args)
+
+    def _dispatch(self, method: str) -> None:
+        url = urlsplit(self.path)
+        self.params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        self.username = self.params.get("username") or None
+        self.body_read = False
+        allowed = []
+        for route_method, pattern, name in ROUTES:
+            match = pattern.fullmatch(url.path.rstrip("/") or "/")
+            if match is None:
+                continue
+            if route_method != method:
+                allowed.append(route_method)
+                continue
+            try:
+                getattr(self, name)(*match.groups())
+            except HTTPError as e:
+                self._error(e.status, str(e))
+            except DuplicateBookError as e:
+                self._error(HTTPStatus.CONFLICT, str(e))
+            except (ValueError, pg.DataError, pg.IntegrityError) as e:
+                self._error(HTTPStatus.BAD_REQUEST, str(e).strip())
+            except (PoolTimeout, pg.OperationalError):
+                self._error(HTTPStatus.SERVICE_UNAVAILABLE, "no database connection available")
+            except (BrokenPipeError, ConnectionResetError):
+                # the client went away mid-response
+                self.close_connection = True
+            except Exception:
+                self.log_error("%s %s failed:\n%s", method, self.path, traceback.format_exc())
+                self._error(HTTPStatus.INTERNAL_SERVER_ERROR, "internal server error")
+            return
+        if allowed:
+            self._error(HTTPStatus.METHOD_NOT_ALLOWED, f"use {', '.join(allowed)}")
+        else:
+            self._error(HTTPStatus.NOT_FOUND, f"no route for {url.path}")
+
+    def _body(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        self.body_read = True
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError as e:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"invalid JSON: {e.msg}") from None
+        if not isinstance(body, dict):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "body must be a JSON object")
+        return body
+
+
+    def _send(
+        self,
+        status: HTTPStatus,
+        body: bytes = b"",
+        content_type: str = "application/json",
+        headers: Optional[dict] = None,
+    ) -> None:
+        self.send_response(status)
+        if body or status not in (HTTPStatus.NO_CONTENT, HTTPStatus.NOT_MODIFIED):
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def _json(self, value, status: HTTPStatus = HTTPStatus.OK, headers=None) -> None:
+        self._send(status, _dumps(value), headers=headers)
+
+    def _error(self, status: HTTPStatus, message: str) -> None:
+        # an unread request body would be taken for the next request on
+        # this keep-alive connection
+        headers = None
+        if not self.body_read and (
+            self.headers.get("Content-Length", "0") != "0" or "Transfer-Encoding" in self.headers
+        ):
+            self.close_connection = True
+            headers = {"Connection": "close"}
+        self._json({"error": message}, status, headers)
+
+    def _stream(self, pieces: Iterable[bytes], content_type: str) -> None:
+        # chunked transfer: the listing is never held in memory as a whole,
+        # pieces are grouped into CHUNK_SIZE writes
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        buffer = bytearray()
+        try:
+            for piece in pieces:
+                buffer += piece
+                if len(buffer) >= CHUNK_SIZE:
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(buffer), buffer))
+                    buffer.clear()
+            if buffer:
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(buffer), buffer))
+            self.wfile.write(b"0\r\n\r\n")
+        except Exception as e:
+            # the status line is sent, so no error response can follow: the
+            # stream is cut without its last chunk and the client sees an
+            # incomplete response
+            self.log_error("listing of %s aborted: %r", self.path, e)
+            self.close_connection = True
+
+    # ROUTES
+
+    def list_books(self) -> None:
+        params, username = self.params, self.username
+        if params.get("title"):
+            books = db.iter_books_by_title(params["title"], username=username)
+        elif params.get("status") == "pending":
+            books = db.iter_pending_books(username=username)
+        elif params.get("start") or params.get("end"):
+            start, end = _dates(params)
+            books = db.iter_completed_books(start, end, username=username)
+        elif params.get("status"):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "status filter only supports pending")
+        else:
+            books = db.iter_table(username=username)
+        try:
+            # the query runs with the first row, while an error can still be
+            # answered with a status of its own
+            first = next(books, None)
+            rows = books if first is None else itertools.chain([first], books)
+            if params.get("format") == "jsonl":
+                self._stream(
+                    (_dumps(_book(b)) + b"\n" for b in rows), "application/x-ndjson"
+                )
+            else:
+                self._stream(_json_array(rows), "application/json")
+        finally:
+            # releases the server-side cursor if the client went away
+            books.close()
+
+    def get_book(self, book_id: str) -> None:
+        book = db.fetch_by_id(int(book_id), self.username)
+        if book is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"book {book_id} not found")
+        body = _dumps(_book(book))
+        etag = f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+        if _etag_matches(self.headers.get("If-None-Match", ""), etag):
+            self._send(HTTPStatus.NOT_MODIFIED, headers={"ETag": etag})
+        else:
+            self._send(HTTPStatus.OK, body, headers={"ETag": etag})
+
+    def create_book(self) -> None:
+        body = self._body()
+        if self.username:
+            owner = body.get("username")
+            if owner and owner != self.username:
+                raise HTTPError(
+                    HTTPStatus.BAD_REQUEST, f"username {owner} is not ?username={self.username}"
+                )
+            body["username"] = self.username
+        book_id = db.insert_data(validate_record(body))
+        self._json({"id": book_id}, HTTPStatus.CREATED, {"Location": f"/books/{book_id}"})
+
+    def update_book(self, book_id: str) -> None:
+        update = self._body()
+        update["id"] = int(book_id)
+        if len(update) == 1:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "nothing to update")
+        if not db.update_many([update], self.username):
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"book {book_id} not found")
+        self._json({"id": int(book_id)})
+
+    def delete_book(self, book_id: str) -> None:
+        if not db.delete_many([int(book_id)], self.username):
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"book {book_id} not found")
+        self._send(HTTPStatus.NO_CONTENT)
+
+    def search(self) -> None:
+        query = self.params.get("q")
+        if not query:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "q is required")
+        limit = _int(self.params, "limit")
+        if self.params.get("full_text"):
+            hits = db.search_books(
+                query, limit=limit, offset=_int(self.params, "offset", 0), username=self.username
+            )
+            self._json([hit._asdict() for hit in hits])
+        else:
+            page = db.search_books_by_title(query, limit=limit, username=self.username)
+            self._json([dict(zip(page.column_names, row)) for row in page.rows])
+
+    def stats(self, username: str) -> None:
+        username = unquote(username)
+        if self.username and username != self.username:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"no stats for {username}")
+        self._json(db.reading_stats(
+            username, _date(self.params, "start"), _date(self.params, "end")
+        ))
+
+    def count(self, which: str) -> None:
+        if which == "pending":
+            count = db.count_pending_books(username=self.username)
+        else:
+            count = db.count_completed_books(*_dates(self.params), username=self.username)
+        self._json({"count": count})
+
+    def metrics(self) -> None:
+        from src import instrument
+
+        self._send(
+            HTTPStatus.OK,
+            instrument.prometheus_text().encode(),
+            content_type="text/plain; version=0.0.4",
+        )
+
+
+def _json_array(books: Iterator[Book]) -> Iterator[bytes]:
+    yield b"["
+    for i, book in enumerate(books):
+        yield (b"," if i else b"") + _dumps(_book(book))
+    yield b"]"
+
+
+class BookClubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # backlog of connections waiting to be accepted
+    request_queue_size = 128
+
+    def __init__(self, address, verbose: bool = False) -> None:
+        self.verbose = verbose
+        super().__init__(address, BookClubHandler)
+
+
+def serve(host: str = "127.0.0.1", port: int = 8000, verbose: bool = False) -> None:
+    server = BookClubServer((host, port), verbose)
+    # open the pool up front rather than on the first request
+    db.Database()
+    # writes of other processes drop the cached rows, counts and ETags
+    db.start_listener()
+    print(f"serving on http://{host}:{server.server_address[1]}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        db.stop_listener()
+        db.Database().close()
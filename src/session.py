@@ -0,0 +1,196 @@
+from typing import Any, Callable, List, NamedTuple, Optional, Union
+from datetime import date
+from src.schema import Book, CreateDataType
+from src.queries import (
+    DELETE_MANY_QUERY,
+    DELETE_QUERY,
+    FETCH_BY_ID_QUERY,
+    INSERT_QUERY,
+    insert_params,
+    scoped,
+    scoped_params,
+    update_many_statements,
+    update_query,
+)
+from src.database import Database, _wrote
+
+
+class Ref(NamedTuple):
+    # stands for the result of an earlier operation of the same unit of
+    # work, e.g. the id returned by an insert
+    index: int
+
+
+class OperationResult(NamedTuple):
+    name: str
+    result: Any
+
+
+class _Operation(NamedTuple):
+    name: str
+    query: str
+    params: list
+    # turns the executed cursor into the operation result
+    shape: Callable
+    # ids of the books the operation changed, from its result (None for reads)
+    changes: Optional[Callable[[Any], tuple]]
+
+
+def _one_value(cursor):
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _one_book(cursor):
+    row = cursor.fetchone()
+    return Book._make(row) if row else None
+
+
+def _all_values(cursor):
+    return [r[0] for r in cursor.fetchall()]
+
+
+# UNIT OF WORK
+class UnitOfWork(object):
+    """
+    Queue operations and run them in one transaction, sent to the server
+    with pipeline mode so they do not wait for each other's round-trip:
+
+        with UnitOfWork() as uow:
+            book_id = uow.insert(data)
+            uow.update(book_id, "status", "reading")
+            uow.fetch(book_id)
+        uow.results  # [OperationResult("insert", 42), ...]
+
+    Each method returns a Ref to its result that later operations can take
+    in place of a value. Everything is rolled back if any operation fails.
+    With a username, fetches, updates and deletes only reach that user's books.
+    """
+
+    def __init__(self, username: Optional[str] = None) -> None:
+        self.username = username
+        self._operations: List[_Operation] = []
+        self.results: List[OperationResult] = []
+
+    def __enter__(self) -> "UnitOfWork":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.run()
+
+    def _queue(self, operation: _Operation) -> Ref:
+        self._operations.append(operation)
+        return Ref(len(self._operations) - 1)
+
+    def insert(self, data: CreateDataType) -> Ref:
+        return self._queue(
+            _Operation("insert", INSERT_QUERY, list(insert_params(data)), _one_value, lambda _: ())
+        )
+
+    def fetch(self, book_id: Union[int, Ref]) -> Ref:
+        # read inside the transaction, so it sees the queued writes
+        return self._queue(
+            _Operation(
+                "fetch",
+                scoped(FETCH_BY_ID_QUERY, self.username),
+                scoped_params([book_id], self.username),
+                _one_book,
+                None,
+            )
+        )
+
+    def update(
+        self, book_id: Union[int, Ref], column: str, data: Union[str, date, int, Ref]
+    ) -> Ref:
+        return self._queue(
+            _Operation(
+                "update",
+                update_query(column, self.username),
+                scoped_params([data, book_id], self.username),
+                _one_value,
+                lambda r: (r,),
+            )
+        )
+
+    def delete(self, book_id: Union[int, Ref]) -> Ref:
+        return self._queue(
+            _Operation(
+                "delete",
+                scoped(DELETE_QUERY, self.username),
+                scoped_params([book_id], self.username),
+                _one_value,
+                lambda r: (r,),
+            )
+        )
+
+    def update_many(self, updates) -> List[Ref]:
+        return [
+            self._queue(_Operation("update_many", query, params, _all_values, tuple))
+            for query, params in update_many_statements(updates, self.username)
+        ]
+
+    def delete_many(self, book_ids) -> Ref:
+        return self._queue(
+            _Operation(
+                "delete_many",
+                scoped(DELETE_MANY_QUERY, self.username),
+                scoped_params(
+                    [book_ids if isinstance(book_ids, Ref) else list(book_ids)], self.username
+                ),
+                _all_values,
+                tuple,
+            )
+        )
+
+    def run(self) -> List[OperationResult]:
+        operations, self._operations = self._operations, []
+        cursors: list = []
+        results: dict = {}
+
+        def result(index: int) -> Any:
+            # fetching a result inside the pipeline waits for it, so a Ref
+            # only costs a round-trip where a later operation needs it
+            if index not in results:
+                results[index] = operations[index].shape(cursors[index])
+            return results[index]
+
+        def resolve(value: Any) -> Any:
+            # Refs may also sit in the id and value arrays of the batch operations
+            if isinstance(value, Ref):
+                return result(value.index)
+            if isinstance(value, list):
+                return [resolve(v) for v in value]
+            return value
+
+        with Database().connection() as conn:
+            try:
+                with conn.pipeline():
+                    for operation in operations:
+                        params = [resolve(p) for p in operation.params]
+                        cursor = conn.cursor()
+                        cursor.execute(operation.query, params)
+                        cursors.append(cursor)
+                    for index in range(len(operations)):
+                        result(index)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                for cursor in cursors:
+                    cursor.close()
+
+        changed: list = []
+        for index, operation in enumerate(operations):
+            if operation.changes is None:
+                continue
+            if results[index] is not None:
+                changed.extend(operation.changes(results[index]))
+        _wrote(changed)
+
+        self.results = [
+            OperationResult(operation.name, results[index])
+            for index, operation in enumerate(operations)
+        ]
+        return self.results
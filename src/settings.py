@@ -0,0 +1,27 @@
+from functools import lru_cache
+from src.util import ROOT_DIR
+
+# SETTINGS FROM THE .env FILE
+# Read on first use rather than at import time, so commands that never
+# touch the database do not pay for it.
+
+
+@lru_cache(maxsize=None)
+def env():
+    import environ
+
+    env = environ.Env()
+    # /home/..../myreadapp/.env
+    # Set .env from the root dir to be read
+    environ.Env.read_env(str(ROOT_DIR / '.env'))
+    return env
+
+
+def fetch_size() -> int:
+    # rows pulled per round-trip by the streaming (server-side cursor) listings
+    return env().int('db_fetch_size', default=1000)
+
+
+def search_limit() -> int:
+    # default page size of the title and full-text searches
+    return env().int('db_search_limit', default=20)
@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+
+try:
+    from src import analytics
+except ImportError:  # numpy is not installed
+    analytics = None
+
+
+@unittest.skipIf(analytics is None, "needs numpy")
+class TestAnalytics(unittest.TestCase):
+    def setUp(self):
+        self.books = analytics.from_rows([
+            ("ann", "complete", 100, date(2024, 1, 1), date(2024, 1, 11)),
+            ("ann", "complete", 100, date(2024, 1, 20), date(2024, 2, 5)),
+            # CSV rows carry strings, empty for no date
+            ("ann", "complete", "100", "2024-03-01", "2024-03-30"),
+            ("bob", "complete", 100, date(2024, 5, 1), date(2024, 6, 15)),
+            ("bob", "reading", 50, date(2024, 6, 1), None),
+            ("cat", "pending", 0, "", ""),
+        ], chunk_size=2)
+        self.today = date(2024, 6, 20)
+
+    def test_time_to_complete(self):
+        result = analytics.time_to_complete(self.books)
+        self.assertEqual(result["books"], 4)
+        self.assertEqual(result["max_days"], 45)
+        self.assertEqual(dict(result["distribution"])["<30d"], 2)
+
+    # a missed month ends a streak, only recent runs are current
+    def test_streaks(self):
+        self.assertEqual(
+            analytics.streaks(self.books, self.today), [("ann", 3, 0), ("bob", 1, 1)]
+        )
+
+    # half read in 19 days, so done 19 days from today
+    def test_forecast(self):
+        self.assertEqual(
+            analytics.completion_forecast(self.books, self.today), [("2024-07", 1)]
+        )
+        self.assertEqual(analytics.completion_forecast(self.books, self.today, 7), [])
+
+    def test_empty(self):
+        result = analytics.summary(analytics.from_rows([]), self.today)
+        self.assertEqual(result["books"], 0)
+        self.assertEqual(result["velocity"], [])
+
+    def load(self, suffix, text):
+        with tempfile.NamedTemporaryFile("w", suffix=suffix, delete=False) as f:
+            f.write(text)
+        self.addCleanup(os.remove, f.name)
+        return analytics.load_file(f.name)
+
+    def test_load_file(self):
+        books = self.load(
+            ".csv",
+            "username,status,pct_read,start_read_date,end_read_date\n"
+            "ann,complete,100,2024-01-01,2024-01-11\nbob,pending,0,,\n",
+        )
+        self.assertEqual(len(books), 2)
+        self.assertEqual(list(books.usernames), ["ann", "bob"])
+
+    # bad records are errors naming their line, not a KeyError
+    def test_load_file_errors(self):
+        header = "username,status,pct_read,start_read_date,end_read_date\n"
+        with self.assertRaisesRegex(ValueError, "line 3: unknown status 'lost'"):
+            self.load(".csv", header + "ann,pending,0,,\nann,lost,0,,\n")
+        with self.assertRaisesRegex(ValueError, "line 2: start_read_date, end_read_date missing"):
+            self.load(".csv", "username,status,pct_read\nann,pending,0\n")
+        line = '{"username": "ann", "status": "pending", "pct_read": 0'
+        with self.assertRaisesRegex(ValueError, "line 3: status missing"):
+            self.load(".jsonl", line + ', "start_read_date": null, "end_read_date": null}\n\n'
+                      '{"username": "ann", "pct_read": 0, "start_read_date": null, '
+                      '"end_read_date": null}\n')
+        with self.assertRaisesRegex(ValueError, "line 1: invalid JSON"):
+            self.load(".jsonl", line + "\n")
+
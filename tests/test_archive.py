@@ -0,0 +1,68 @@
+import unittest
+from unittest import mock
+import psycopg as pg
+from src.archive import LOCK_ATTEMPTS, archive_books
+
+
+class FakeConnection:
+    def __init__(self, batches):
+        # per archive batch: the archived ids, or an exception to raise
+        self.batches = list(batches)
+        self.commits = self.rollbacks = 0
+
+    def cursor(self):
+        cursor = mock.MagicMock()
+        cursor.__enter__.return_value = cursor
+
+        def execute(query, params=None):
+            if params is not None:
+                batch = self.batches.pop(0)
+                if isinstance(batch, Exception):
+                    raise batch
+                cursor.fetchall.return_value = [(i,) for i in batch]
+
+        cursor.execute.side_effect = execute
+        return cursor
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def archive(conn, **kwargs):
+    pool = mock.MagicMock()
+    pool.connection.return_value.__enter__.return_value = conn
+    with mock.patch("src.archive.Database", return_value=pool), \
+            mock.patch("src.archive._has_archive", return_value=True), \
+            mock.patch("src.archive._wrote"):
+        return archive_books(30, batch_size=2, **kwargs)
+
+
+def lock_timeout():
+    return pg.errors.LockNotAvailable("canceling statement due to lock timeout")
+
+
+class TestArchive(unittest.TestCase):
+    def test_batches(self):
+        progress = mock.Mock()
+        self.assertEqual(archive(FakeConnection([[1, 2], [3]]), progress=progress), 3)
+        self.assertEqual([c.args[0] for c in progress.call_args_list], [2, 3])
+
+    # a batch that hits the lock timeout is rolled back and tried again
+    def test_lock_timeout_retried(self):
+        conn = FakeConnection([[1, 2], lock_timeout(), [3, 4], [5]])
+        self.assertEqual(archive(conn), 5)
+        self.assertEqual(conn.rollbacks, 1)
+
+    # and after LOCK_ATTEMPTS the job stops with what it archived so far
+    def test_lock_timeout_stops(self):
+        conn = FakeConnection([[1, 2]] + [lock_timeout() for _ in range(LOCK_ATTEMPTS)])
+        with self.assertLogs("src.archive", "WARNING"):
+            self.assertEqual(archive(conn), 2)
+        self.assertEqual(conn.rollbacks, LOCK_ATTEMPTS)
+
+
+if __name__ == "__main__":
+    unittest.main()
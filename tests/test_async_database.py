@@ -0,0 +1,205 @@
+import asyncio
+import unittest
+from contextlib import asynccontextmanager
+from datetime import date
+from unittest import mock
+from src import async_database as adb, database
+from src.cache import MISSING
+from src.database import aggregate_cache, book_cache
+from src.schema import Book, SearchHit, StatusEnum
+
+
+def book(book_id, username="Sophie"):
+    return Book(book_id, username, f"Book {book_id}", None, StatusEnum.pending, 0,
+                None, None, None, None)
+
+
+class FakeCursor:
+    def __init__(self, pool, **kwargs):
+        self.pool = pool
+        self.kwargs = kwargs
+        self.rows = []
+        self.description = [("id",), ("score",)]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, query, params=None):
+        self.pool.executed.append((query, params, self.kwargs))
+        self.rows = list(self.pool.results.pop(0))
+
+    async def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    async def fetchall(self):
+        return self.rows
+
+    async def fetchmany(self, size):
+        self.pool.fetches.append(size)
+        page, self.rows = self.rows[:size], self.rows[size:]
+        return page
+
+
+class FakeConnection:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def cursor(self, **kwargs):
+        return FakeCursor(self.pool, **kwargs)
+
+    async def commit(self):
+        self.pool.commits += 1
+
+    async def rollback(self):
+        pass
+
+
+class FakePool:
+    closed = False
+
+    def __init__(self, *results):
+        # the rows each executed statement returns, in order
+        self.results = list(results)
+        self.executed = []
+        self.fetches = []
+        self.commits = 0
+
+    @asynccontextmanager
+    async def connection(self):
+        yield FakeConnection(self)
+
+    def cursor(self, **kwargs):
+        return FakeCursor(self, **kwargs)
+
+    async def close(self):
+        self.closed = True
+
+
+class TestAsyncDatabase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        book_cache.clear()
+        aggregate_cache.clear()
+        self.primary = FakePool()
+        self.use(self.primary)
+        # no archive unless a test says otherwise
+        for name, value in (
+            ("_summary", None), ("_archive", False), ("_last_process_write", float("-inf"))
+        ):
+            patcher = mock.patch.object(database, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # the default settings, without reading the environment
+        settings = mock.Mock()
+        settings.bool.side_effect = lambda name, default: default
+        settings.float.side_effect = lambda name, default: default
+        patcher = mock.patch("src.database.env", return_value=settings)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def use(self, primary, replicas=None):
+        instance = mock.Mock(_pool=primary, _replicas=replicas)
+        patcher = mock.patch.object(adb.AsyncDatabase, "_instance", instance)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_fetch_by_id(self):
+        self.primary.results = [[book(1)]]
+        self.assertEqual(await adb.fetch_by_id(1), book(1))
+        # then from the cache, and only for its owner
+        self.assertEqual(await adb.fetch_by_id(1, "Sophie"), book(1))
+        self.assertIsNone(await adb.fetch_by_id(1, "Max"))
+        self.assertEqual(len(self.primary.executed), 1)
+
+    async def test_fetch_missing(self):
+        self.primary.results = [[], []]
+        self.assertIsNone(await adb.fetch_by_id(2, "Sophie"))
+        query, params, _ = self.primary.executed[0]
+        self.assertIn("AND username = %s", query)
+        self.assertEqual(list(params), [2, "Sophie"])
+        self.assertIs(book_cache.get(2), MISSING)
+
+    # no matching row is None, not an error
+    async def test_update_and_delete_missing(self):
+        self.primary.results = [[], [(3,)]]
+        self.assertIsNone(await adb.update_data(3, "pct_read", 10, "Max"))
+        self.assertEqual(await adb.delete_row(3), 3)
+        self.assertEqual(self.primary.commits, 2)
+
+    async def test_count_pending_from_summary(self):
+        self.primary.results = [[(True,)], [(5,)]]
+        self.assertEqual(await adb.count_pending_books("Sophie"), 5)
+        self.assertIn("read.bookclub_stats", self.primary.executed[1][0])
+        # the check is shared with src.database
+        self.assertTrue(database._summary)
+        self.assertEqual(await adb.count_pending_books("Sophie"), 5)
+        self.assertEqual(len(self.primary.executed), 2)
+
+    # a range that is not whole months counts the live table
+    async def test_count_completed(self):
+        self.primary.results = [[(2,)]]
+        count = await adb.count_completed_books(date(2024, 1, 5), date(2024, 2, 10))
+        self.assertEqual(count, 2)
+        query, params, _ = self.primary.executed[0]
+        self.assertIn("FROM read.bookclub", query)
+        self.assertNotIn("read.bookclub_archive", query)
+        self.assertEqual(list(params), [date(2024, 1, 5), date(2024, 2, 10)])
+
+    async def test_archived(self):
+        database._archive = None
+        self.primary.results = [[(True,)], [(date(2023, 6, 30),)]]
+        self.assertFalse(await adb._archived(date(2024, 1, 1)))
+        self.assertTrue(await adb._archived())
+        self.assertTrue(database._archive)
+        self.assertEqual(len(self.primary.executed), 2)
+
+    async def test_search(self):
+        hit = (1, "Dune", StatusEnum.complete, 0.5, "<b>Dune</b>")
+        self.primary.results = [[hit], [(1, 0.9)]]
+        self.assertEqual(await adb.search_books("dune", limit=5), [SearchHit(*hit)])
+        self.assertEqual(self.primary.executed[0][1]["limit"], 5)
+        page = await adb.search_books_by_title("dune", limit=1)
+        self.assertEqual(page.rows, [(1, 0.9)])
+        self.assertEqual(page.next_key, (0.9, 1))
+
+    async def test_stream_pages(self):
+        rows = [book(i) for i in range(5)]
+        self.primary.results = [rows]
+        self.assertEqual([b async for b in adb.iter_table(fetch_size=2)], rows)
+        self.assertEqual(self.primary.executed[0][2]["name"], "bookclub_stream")
+        self.assertEqual(self.primary.fetches, [2, 2, 2, 2])
+
+    # reads go to a replica, except right after a write of the same task
+    async def test_replica_routing(self):
+        database._summary = False
+        replica = FakePool([(4,)])
+        self.use(self.primary, replica)
+        self.assertEqual(await adb.count_pending_books(), 4)
+        self.primary.results = [[(1,)], [(6,)]]
+        await adb.delete_row(1)
+        self.assertEqual(await adb.count_pending_books(), 6)
+        self.assertEqual(len(replica.executed), 1)
+        self.assertEqual(len(self.primary.executed), 2)
+
+    # the replicas of a closed database are closed by a task that is kept
+    async def test_replaced_replicas_closed(self):
+        replicas = FakePool()
+        old = mock.Mock(_pool=mock.Mock(closed=True), _replicas=replicas)
+
+        def build(instance):
+            instance._pool = FakePool()
+            instance._replicas = None
+
+        with mock.patch.object(adb.AsyncDatabase, "_instance", old), \
+                mock.patch.object(adb.AsyncDatabase, "__init__", build):
+            adb.AsyncDatabase()
+            self.assertEqual(len(adb._closing), 1)
+            await asyncio.gather(*adb._closing)
+        self.assertTrue(replicas.closed)
+        self.assertEqual(adb._closing, set())
+
+
+if __name__ == "__main__":
+    unittest.main()
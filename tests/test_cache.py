@@ -0,0 +1,44 @@
+import unittest
+from unittest import mock
+from src.cache import LRUCache, MISSING
+
+
+class TestLRUCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = LRUCache(maxsize=2, ttl=60)
+
+    # hit/miss counters
+    def test_hit_and_miss(self):
+        self.assertIs(self.cache.get(1), MISSING)
+        self.cache.set(1, "book")
+        self.assertEqual(self.cache.get(1), "book")
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    # least recently used entry goes first
+    def test_eviction(self):
+        self.cache.set(1, "a")
+        self.cache.set(2, "b")
+        self.cache.get(1)
+        self.cache.set(3, "c")
+        self.assertIs(self.cache.get(2), MISSING)
+        self.assertEqual(self.cache.get(1), "a")
+        self.assertEqual(len(self.cache), 2)
+
+    def test_ttl(self):
+        with mock.patch("src.cache.time.monotonic", return_value=100.0):
+            self.cache.set(1, "a")
+        with mock.patch("src.cache.time.monotonic", return_value=161.0):
+            self.assertIs(self.cache.get(1), MISSING)
+
+    # a value loaded before an invalidation must not be stored
+    def test_stale_set_is_dropped(self):
+        token = self.cache.token()
+        self.cache.invalidate(1)
+        self.cache.set(1, "old", token)
+        self.assertIs(self.cache.get(1), MISSING)
+
+    def test_clear(self):
+        self.cache.set(1, "a")
+        self.cache.clear()
+        self.assertIs(self.cache.get(1), MISSING)
@@ -0,0 +1,85 @@
+import io
+import unittest
+from contextlib import redirect_stderr
+from unittest import mock
+from src.cli import main
+from src.ingest import for_user
+from src.schema import DuplicateBookError, TitleSearchPage
+
+
+class TestCli(unittest.TestCase):
+    # a second book with the same title is an error message, not a traceback
+    def test_insert_duplicate(self):
+        stderr = io.StringIO()
+        with mock.patch(
+            "src.database.insert_data", side_effect=DuplicateBookError("Sophie", "Dune")
+        ), redirect_stderr(stderr):
+            code = main(["insert", "--username", "Sophie", "--title", "Dune"])
+        self.assertEqual(code, 2)
+        self.assertIn("book already exists", stderr.getvalue())
+
+    def test_insert_defaults_to_user(self):
+        with mock.patch("src.database.insert_data", return_value=1) as insert_data, \
+                redirect_stderr(io.StringIO()), mock.patch("sys.stdout", io.StringIO()):
+            code = main(["--user", "Sophie", "insert", "--title", "Dune"])
+        self.assertEqual(code, 0)
+        self.assertEqual(insert_data.call_args.args[0]["username"], "Sophie")
+
+    # --username cannot reach past --user
+    def test_username_other_than_user(self):
+        for argv in (
+            ["--user", "Sophie", "insert", "--username", "Max", "--title", "Dune"],
+            ["--user", "Sophie", "stats", "Max"],
+            ["--user", "Sophie", "analytics", "--username", "Max"],
+            ["--user", "Sophie", "export", "--username", "Max"],
+        ):
+            stderr = io.StringIO()
+            with redirect_stderr(stderr):
+                code = main(argv)
+            self.assertEqual(code, 2, argv)
+            self.assertIn("is not --user Sophie", stderr.getvalue())
+
+    def test_import_scoped_to_user(self):
+        with mock.patch("src.ingest.import_file") as import_file, \
+                redirect_stderr(io.StringIO()), mock.patch("sys.stdout", io.StringIO()):
+            import_file.return_value.errors = []
+            main(["--user", "Sophie", "import", "books.jsonl"])
+        self.assertEqual(import_file.call_args.kwargs["username"], "Sophie")
+
+    # the next title search page starts after the key printed for the last one
+    def test_search_pages(self):
+        page = TitleSearchPage(["id", "title", "score"], [(7, "Dune", 0.5833333)], (0.5833333, 7))
+        stderr = io.StringIO()
+        with mock.patch("src.database.search_books_by_title", return_value=page) as search, \
+                redirect_stderr(stderr), mock.patch("sys.stdout", io.StringIO()):
+            main(["search", "dune", "--limit", "1"])
+            self.assertIn("--after 0.5833333,7", stderr.getvalue())
+            main(["search", "dune", "--limit", "1", "--after", "0.5833333,7"])
+        self.assertIsNone(search.call_args_list[0].kwargs["after"])
+        self.assertEqual(search.call_args_list[1].kwargs["after"], (0.5833333, 7))
+
+    def test_search_after_needs_a_key(self):
+        with redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+            main(["search", "dune", "--after", "7"])
+        stderr = io.StringIO()
+        with redirect_stderr(stderr):
+            code = main(["search", "dune", "--full-text", "--after", "0.5,7"])
+        self.assertEqual(code, 2)
+
+    def test_for_user(self):
+        records = [
+            {"username": "Sophie", "title": "Dune"},
+            {"title": "Emma"},
+            {"username": "Max", "title": "Kim"},
+            ValueError("invalid JSON"),
+        ]
+        scoped = list(for_user(records, "Sophie"))
+        self.assertEqual(scoped[0], records[0])
+        self.assertEqual(scoped[1], {"username": "Sophie", "title": "Emma"})
+        self.assertIsInstance(scoped[2], ValueError)
+        self.assertIn("belongs to Max", str(scoped[2]))
+        self.assertIs(scoped[3], records[3])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,20 @@
 import unittest
 import re
-from src.database import Database
+import time
+import psycopg as pg
+from src.database import (
+    Database,
+    _conninfo,
+    book_cache,
+    delete_row,
+    fetch_by_id,
+    insert_data,
+    search_books_by_title,
+    start_listener,
+    stop_listener,
+)
+from src.cache import MISSING
+from src.schema import StatusEnum
 
 
 # we want to test for singleton
@@ -23,8 +37,73 @@ class TestDatabase(unittest.TestCase):
             cursor.execute('SELECT version();') # execute sql statement
             db_version = cursor.fetchone()[0] # get one row, [0] gets first object in tuple(row)
             self.assertRegex(db_version, r'^(PostgreSQL 15.3)')
+    
+    # pool test, borrowed connections are returned for reuse
+    def test_pool_borrow_return(self):
+        with self.conn.connection() as first:
+            # a nested borrow must not hand out the connection already in use
+            with self.conn.connection() as second:
+                self.assertNotEqual(first.info.backend_pid, second.info.backend_pid)
+        
+        stats = self.conn.stats()
+        self.assertGreaterEqual(stats['pool_available'], 2)
             
                
+    # a write from another process (own connection, no local invalidation)
+    # must reach this process through LISTEN/NOTIFY
+    def test_listener_invalidates_cache(self):
+        book_id = insert_data({
+            "username": "test",
+            "title": "Listener test",
+            "description": None,
+            "status": StatusEnum.pending,
+            "pct_read": 0,
+            "start_read_date": None,
+            "end_read_date": None,
+        })
+        start_listener()
+        try:
+            fetch_by_id(book_id)
+            with pg.connect(_conninfo()) as other:
+                other.execute(
+                    "UPDATE read.bookclub SET title = 'Changed' WHERE id = %s", (book_id,)
+                )
+            for _ in range(50):
+                if book_cache.get(book_id) is MISSING:
+                    break
+                time.sleep(0.1)
+            self.assertEqual(fetch_by_id(book_id).title, 'Changed')
+        finally:
+            stop_listener()
+            delete_row(book_id)
+
+    # titles scoring the same must all come back across pages
+    def test_title_search_pages_across_tied_scores(self):
+        ids = [
+            insert_data({
+                "username": "test",
+                "title": f"Tied keyset {n}",
+                "description": None,
+                "status": StatusEnum.pending,
+                "pct_read": 0,
+                "start_read_date": None,
+                "end_read_date": None,
+            })
+            for n in range(5)
+        ]
+        try:
+            found, after = [], None
+            while True:
+                page = search_books_by_title("Tied keyset", limit=2, after=after, username="test")
+                found += [row[0] for row in page.rows]
+                if page.next_key is None:
+                    break
+                after = page.next_key
+            self.assertEqual(sorted(found), sorted(ids))
+        finally:
+            for book_id in ids:
+                delete_row(book_id)
+
     def tearDown(self) -> None:
         self.conn.close()
         
\ No newline at end of file
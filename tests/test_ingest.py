@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+from src.ingest import read_jsonl
+from src.schema import StatusEnum, validate_record
+
+
+class TestValidateRecord(unittest.TestCase):
+    def test_valid_record(self):
+        data = validate_record({
+            "username": "Sophie",
+            "title": "Dune",
+            "description": "",
+            "status": "complete",
+            "pct_read": "100",
+            "start_read_date": "2024-01-02",
+            "end_read_date": date(2024, 2, 3),
+        })
+        self.assertEqual(data["status"], StatusEnum.complete)
+        self.assertEqual(data["pct_read"], 100)
+        self.assertIsNone(data["description"])
+        self.assertEqual(data["start_read_date"], date(2024, 1, 2))
+        self.assertEqual(data["end_read_date"], date(2024, 2, 3))
+
+    def test_defaults(self):
+        data = validate_record({"username": "Sophie", "title": "Dune"})
+        self.assertEqual(data["status"], StatusEnum.pending)
+        self.assertEqual(data["pct_read"], 0)
+
+    # JSON can hold any type, only text is a username or a title
+    def test_rejects_non_text(self):
+        for record in (
+            {"username": 42, "title": "Dune"},
+            {"username": ["Sophie"], "title": "Dune"},
+            {"username": "Sophie", "title": 1984},
+            {"username": "Sophie", "title": {"name": "Dune"}},
+            {"username": "Sophie", "title": "Dune", "description": ["a", "b"]},
+        ):
+            with self.assertRaises(ValueError, msg=record):
+                validate_record(record)
+
+    def test_rejects_invalid(self):
+        for record in (
+            [],
+            {"title": "Dune"},
+            {"username": "x" * 51, "title": "Dune"},
+            {"username": "Sophie", "title": ""},
+            {"username": "Sophie", "title": "Dune", "status": "lost"},
+            {"username": "Sophie", "title": "Dune", "pct_read": "many"},
+            {"username": "Sophie", "title": "Dune", "start_read_date": "02/01/2024"},
+            {"username": "Sophie", "title": "Dune", "status": "complete", "pct_read": 50},
+            {"username": "Sophie", "title": "Dune", "pct_read": 100},
+        ):
+            with self.assertRaises(ValueError, msg=record):
+                validate_record(record)
+
+    # pct_read is a whole number, never rounded
+    def test_pct_read(self):
+        for value, expected in ((40, 40), ("40", 40), (40.0, 40), (" 7 ", 7), (None, 0), ("", 0)):
+            record = {"username": "Sophie", "title": "Dune", "pct_read": value}
+            self.assertEqual(validate_record(record)["pct_read"], expected, value)
+        for value in (99.9, "99.9", True, False, "nan", "inf", [50]):
+            record = {"username": "Sophie", "title": "Dune", "pct_read": value}
+            with self.assertRaises(ValueError, msg=value):
+                validate_record(record)
+
+    # a reader's parse error is the record's error
+    def test_raises_parse_error(self):
+        with self.assertRaisesRegex(ValueError, "invalid JSON"):
+            validate_record(ValueError("invalid JSON: Expecting value"))
+
+
+class TestReadJsonl(unittest.TestCase):
+    def read(self, text):
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as f:
+            f.write(text)
+        self.addCleanup(os.remove, f.name)
+        return list(read_jsonl(f.name))
+
+    def test_records_and_errors(self):
+        records = self.read('{"username": "Sophie", "title": "Dune"}\n\n{broken\n[1]\n')
+        self.assertEqual(records[0], {"username": "Sophie", "title": "Dune"})
+        self.assertIsInstance(records[1], ValueError)
+        self.assertIn("invalid JSON", str(records[1]))
+        self.assertEqual(records[2], [1])
+        self.assertEqual(len(records), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
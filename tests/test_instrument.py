@@ -0,0 +1,88 @@
+import unittest
+from unittest import mock
+from src import instrument
+from src.instrument import Histogram
+
+
+class TestHistogram(unittest.TestCase):
+    # bucketed percentiles stay within a few percent of the real values
+    def test_percentiles(self):
+        histogram = Histogram()
+        for ms in range(1, 1001):
+            histogram.record(ms / 1000)
+        self.assertEqual(histogram.count, 1000)
+        self.assertAlmostEqual(histogram.percentile(50), 0.5, delta=0.5 * 0.04)
+        self.assertAlmostEqual(histogram.percentile(99), 0.99, delta=0.99 * 0.04)
+        self.assertEqual(histogram.percentile(100), 1.0)
+
+    def test_cumulative(self):
+        histogram = Histogram()
+        for seconds in (0.0002, 0.002, 0.02):
+            histogram.record(seconds)
+        self.assertEqual(histogram.cumulative(0.001), 1)
+        self.assertEqual(histogram.cumulative(0.025), 3)
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        instrument.reset()
+
+    def test_snapshot_and_prometheus(self):
+        instrument.record_query("src.database.fetch_by_id", 0.003, 1)
+        instrument.record_query("src.database.fetch_by_id", 0.004, 1)
+        snapshot = instrument.snapshot()
+        self.assertEqual(snapshot["src.database.fetch_by_id"]["rows"], 2)
+        self.assertEqual(snapshot["src.database.fetch_by_id"]["latency"]["count"], 2)
+
+        text = instrument.prometheus_text()
+        self.assertIn(
+            'readapp_query_duration_seconds_count{function="src.database.fetch_by_id"} 2',
+            text,
+        )
+        self.assertIn(
+            'readapp_query_duration_seconds_bucket{function="src.database.fetch_by_id",le="0.005"} 2',
+            text,
+        )
+
+    def tearDown(self):
+        instrument.reset()
+
+
+def _helper():
+    return instrument.caller()
+
+
+def listing():
+    return instrument.attributed(_helper(), (instrument.caller() for _ in range(2)))
+
+
+class TestCaller(unittest.TestCase):
+    # private helpers of src.database count for the public function
+    # (these functions pass for src.database ones while __name__ is patched)
+    def test_skips_private_helpers(self):
+        with mock.patch.dict(globals(), {"__name__": "src.database"}):
+            self.assertEqual(_helper(), "src.database.test_skips_private_helpers")
+
+    # the rows of a listing are fetched by its consumer, but counted for
+    # the function that returned it
+    def test_attributed(self):
+        with mock.patch.dict(globals(), {"__name__": "src.database"}):
+            rows = listing()
+        self.assertEqual(list(rows), ["src.database.listing"] * 2)
+        self.assertEqual(instrument.caller(), f"{__name__}.test_attributed")
+
+    def test_server_cursor_counts_fetched_rows(self):
+        import psycopg as pg
+
+        instrument.reset()
+        self.addCleanup(instrument.reset)
+        server_cursor = instrument.cursor_classes()[1]
+        cursor = server_cursor.__new__(server_cursor)
+        cursor._closed = True
+        cursor.function = "src.database.iter_table"
+        with mock.patch.object(pg.ServerCursor, "fetchmany", return_value=[(1,), (2,)]), \
+                mock.patch.object(pg.ServerCursor, "fetchone", return_value=(3,)):
+            cursor.fetchmany(2)
+            cursor.fetchone()
+        self.assertEqual(instrument.snapshot()["src.database.iter_table"]["rows"], 3)
+
@@ -0,0 +1,57 @@
+import tempfile
+import unittest
+from pathlib import Path
+from src.migrate import MigrationError, load_migrations, split_statements
+
+
+class TestMigrations(unittest.TestCase):
+    # shipped migrations load in order and are well formed
+    def test_shipped_migrations(self):
+        migrations = load_migrations()
+        versions = [m.version for m in migrations]
+        self.assertEqual(versions, sorted(versions))
+        for migration in migrations:
+            # CONCURRENTLY is rejected by postgres inside a transaction
+            if "CONCURRENTLY" in migration.sql:
+                self.assertFalse(migration.transactional, migration.name)
+
+    def test_duplicate_versions(self):
+        with tempfile.TemporaryDirectory() as directory:
+            Path(directory, "0001_a.sql").write_text("SELECT 1;")
+            Path(directory, "1_b.sql").write_text("SELECT 2;")
+            with self.assertRaises(MigrationError):
+                load_migrations(Path(directory))
+
+    def test_checksum_follows_content(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory, "0001_a.sql")
+            path.write_text("SELECT 1;")
+            before = load_migrations(Path(directory))[0].checksum
+            path.write_text("SELECT 2;")
+            self.assertNotEqual(load_migrations(Path(directory))[0].checksum, before)
+
+    # semicolons in strings, comments and function bodies do not split
+    def test_split_statements(self):
+        sql = """
+            -- a comment; with a semicolon
+            SELECT 'a;b';
+            CREATE FUNCTION f() RETURNS INT LANGUAGE plpgsql AS $$
+            BEGIN RETURN 1; END;
+            $$;
+            SELECT 2
+        """
+        statements = split_statements(sql)
+        self.assertEqual(len(statements), 3)
+        self.assertEqual(statements[0], "SELECT 'a;b'")
+        self.assertIn("RETURN 1; END;", statements[1])
+
+    # duplicates are kept aside and counted before the unique index
+    def test_natural_key_keeps_duplicates(self):
+        [migration] = [m for m in load_migrations() if m.version == 10]
+        statements = split_statements(migration.sql)
+        moved = next(i for i, s in enumerate(statements) if "DELETE FROM read.bookclub" in s)
+        index = next(i for i, s in enumerate(statements) if "UNIQUE INDEX" in s)
+        self.assertLess(moved, index)
+        self.assertIn("INSERT INTO read.bookclub_duplicates", statements[moved])
+        self.assertIn("RAISE NOTICE", statements[moved])
+
@@ -0,0 +1,115 @@
+import threading
+import unittest
+from contextlib import contextmanager
+from unittest import mock
+from psycopg_pool import PoolTimeout
+from src.database import Database
+from src.pool import ReplicaPool
+from src.schema import StatusEnum
+
+
+class FakeConnection:
+    broken = False
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+
+class FakePool:
+    closed = False
+
+    def __init__(self, name: str, up: bool = True) -> None:
+        self.name = name
+        self.up = up
+
+    @contextmanager
+    def connection(self):
+        if not self.up:
+            raise PoolTimeout("couldn't get a connection")
+        yield FakeConnection(self.name)
+
+
+def served_by(pool: ReplicaPool) -> str:
+    with pool.connection() as conn:
+        return conn.name
+
+
+class TestReplicaPool(unittest.TestCase):
+    # checkouts take turns over the replicas
+    def test_round_robin(self):
+        pool = ReplicaPool([FakePool("a"), FakePool("b")], FakePool("primary"))
+        self.assertEqual([served_by(pool) for _ in range(4)], ["a", "b", "a", "b"])
+
+    # a replica that fails is skipped until retry_interval has passed, and
+    # the primary serves the reads once no replica is left
+    def test_failover(self):
+        a, b = FakePool("a"), FakePool("b", up=False)
+        pool = ReplicaPool([a, b], FakePool("primary"), retry_interval=60.0)
+        self.assertEqual([served_by(pool) for _ in range(3)], ["a", "a", "a"])
+        self.assertEqual(pool.healthy(), [True, False])
+        a.up = False
+        self.assertEqual(served_by(pool), "primary")
+        self.assertEqual(pool.healthy(), [False, False])
+
+
+
+class TestDatabase(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(Database, "_instance", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    # a pool that failed to build is not shared, the next call tries again
+    def test_failed_build_not_published(self):
+        def build(instance):
+            instance._pool = FakePool("primary")
+            instance._replicas = None
+
+        with mock.patch.object(Database, "__init__", side_effect=OSError("down")):
+            with self.assertRaises(OSError):
+                Database()
+        self.assertIsNone(Database._instance)
+        with mock.patch.object(Database, "__init__", build):
+            self.assertEqual(Database().name, "primary")
+
+    # threads starting together share one pool
+    def test_built_once(self):
+        built = []
+
+        def build(instance):
+            built.append(instance)
+            instance._pool = FakePool("primary")
+            instance._replicas = None
+
+        with mock.patch.object(Database, "__init__", build):
+            pools = []
+            threads = [threading.Thread(target=lambda: pools.append(Database())) for _ in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        self.assertEqual(len(built), 1)
+        self.assertEqual(len({id(p) for p in pools}), 1)
+
+
+    # every connection loads read.state as StatusEnum; the type is looked
+    # up on the first one only
+    def test_configure_connection_registers_status(self):
+        from src import database
+
+        info = mock.Mock()
+        with mock.patch.object(database, "_status_info", None), \
+                mock.patch("psycopg.types.enum.EnumInfo.fetch", return_value=info) as fetch, \
+                mock.patch("psycopg.types.enum.register_enum") as register_enum:
+            first, second = mock.Mock(), mock.Mock()
+            database._configure_connection(first, instrumented=False)
+            database._configure_connection(second, instrumented=False)
+        fetch.assert_called_once_with(first, "read.state")
+        self.assertEqual(
+            register_enum.call_args_list,
+            [mock.call(info, first, StatusEnum), mock.call(info, second, StatusEnum)],
+        )
+        first.commit.assert_called_once_with()
+
+if __name__ == "__main__":
+    unittest.main()
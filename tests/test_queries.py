@@ -0,0 +1,209 @@
+import unittest
+from datetime import date
+from unittest import mock
+from src.database import aggregate_cache, reading_stats, search_books
+from src.queries import (
+    COUNT_COMPLETED_QUERY,
+    DELETE_QUERY,
+    FULL_TEXT_SEARCH_QUERY,
+    SUMMARY_TABLES_QUERY,
+    export_select,
+    like_pattern,
+    month_buckets,
+    reading_stats_result,
+    reaches_archive,
+    scoped,
+    scoped_params,
+    title_search,
+    title_search_page,
+    update_many_statements,
+    upsert_params,
+    with_archive,
+)
+
+
+class TestQueries(unittest.TestCase):
+    # rows changing the same columns share one statement
+    def test_update_many_groups_by_columns(self):
+        statements = update_many_statements([
+            {"id": 1, "status": "complete", "pct_read": 100},
+            {"id": 2, "title": "New title"},
+            {"id": 3, "pct_read": 100, "status": "complete"},
+        ])
+        self.assertEqual(len(statements), 2)
+        query, params = statements[0]
+        self.assertIn("unnest(%s::integer[], %s::smallint[], %s::read.state[])", query)
+        self.assertEqual(params, [[1, 3], [100, 100], ["complete", "complete"]])
+
+    # later updates of the same id win
+    def test_update_many_merges_ids(self):
+        statements = update_many_statements([
+            {"id": 1, "title": "First"},
+            {"id": 1, "title": "Second"},
+        ])
+        self.assertEqual(statements[0][1], [[1], ["Second"]])
+
+    # column names go into the SQL text, unknown ones are rejected
+    def test_update_many_rejects_unknown_column(self):
+        with self.assertRaises(ValueError):
+            update_many_statements([{"id": 1, "id = 1; DROP TABLE read.bookclub; --": 1}])
+
+    def test_like_pattern_escapes_wildcards(self):
+        self.assertEqual(like_pattern("100%_a\\b"), "%100\\%\\_a\\\\b%")
+
+    # only whole months can be answered from the completion summary
+    def test_month_buckets(self):
+        self.assertEqual(
+            month_buckets("2024-01-01", "2024-02-29"),
+            (date(2024, 1, 1), date(2024, 2, 1)),
+        )
+        self.assertIsNone(month_buckets("2024-01-02", "2024-02-29"))
+        self.assertIsNone(month_buckets("2024-01-01", "2024-02-28"))
+        self.assertIsNone(month_buckets("not a date", "2024-02-29"))
+
+    # only the given filters end up in the WHERE clause, in order
+    def test_export_select_filters(self):
+        query, params = export_select(username="Sophie", end_date="2024-01-31")
+        self.assertIn("WHERE username = %s AND end_read_date <= %s", query)
+        self.assertEqual(params, ["Sophie", "2024-01-31"])
+        query, params = export_select()
+        self.assertNotIn("WHERE", query)
+        self.assertEqual(params, [])
+
+    # a username adds the partition key to the WHERE clause, none leaves it out
+    def test_scoped_to_user(self):
+        self.assertIn("AND username = %s", scoped(DELETE_QUERY, "Sophie"))
+        self.assertNotIn("{user}", scoped(DELETE_QUERY, None))
+        self.assertNotIn("username", scoped(DELETE_QUERY, None))
+        self.assertEqual(scoped_params([1], "Sophie"), [1, "Sophie"])
+        self.assertEqual(scoped_params([1], None), [1])
+        query, params = update_many_statements([{"id": 1, "title": "A"}], "Sophie")[0]
+        self.assertIn("AND username = %s", query)
+        self.assertEqual(params[-1], "Sophie")
+
+    # only FROM read.bookclub is widened, other read.bookclub_* tables stay
+    def test_with_archive(self):
+        query = with_archive(COUNT_COMPLETED_QUERY)
+        self.assertIn("FROM read.bookclub_archive", query)
+        self.assertIn("UNION ALL", query)
+        self.assertEqual(with_archive(COUNT_COMPLETED_QUERY, False), COUNT_COMPLETED_QUERY)
+        self.assertEqual(with_archive(SUMMARY_TABLES_QUERY), SUMMARY_TABLES_QUERY)
+
+    # ranges starting after the newest archived end date skip the archive
+    def test_reaches_archive(self):
+        horizon = date(2023, 6, 30)
+        self.assertTrue(reaches_archive(horizon))
+        self.assertTrue(reaches_archive(horizon, "2023-06-30"))
+        self.assertFalse(reaches_archive(horizon, date(2023, 7, 1)))
+        self.assertFalse(reaches_archive(None, "2020-01-01"))
+
+    # one array per column, later records of the same book win
+    def test_upsert_params_merges_books(self):
+        book = {
+            "username": "Sophie",
+            "title": "Dune",
+            "description": None,
+            "status": "pending",
+            "pct_read": 0,
+            "start_read_date": None,
+            "end_read_date": None,
+        }
+        params = upsert_params([
+            book,
+            dict(book, title="Emma"),
+            dict(book, pct_read=50, status="reading"),
+        ])
+        self.assertEqual(len(params), 7)
+        self.assertEqual(params[1], ["Dune", "Emma"])
+        self.assertEqual(params[3], ["reading", "pending"])
+        self.assertEqual(params[4], [50, 0])
+        self.assertEqual(upsert_params([]), [[]] * 7)
+
+    # the keyset of a page is its last (score, id); with every title scoring
+    # the same, paging has to go on by id instead of dropping the ties
+    def test_title_search_pages_across_tied_scores(self):
+        query, params = title_search("dune", limit=2, after=(0.5833333, 7))
+        self.assertIn("word_similarity(%(title)s, title)::float8 AS score", query)
+        self.assertIn("::float8 = %(score)s::float8 AND id > %(id)s", query)
+        self.assertEqual((params["score"], params["id"]), (0.5833333, 7))
+
+        books = [(book_id, 0.5833333) for book_id in (3, 7, 9, 12, 15)]
+        seen, after = [], None
+        while True:
+            rows = [
+                (book_id, score)
+                for book_id, score in books
+                if after is None or score < after[0] or score == after[0] and book_id > after[1]
+            ][:2]
+            page = title_search_page(["id", "score"], rows, 2)
+            seen += [row[0] for row in page.rows]
+            if page.next_key is None:
+                break
+            after = page.next_key
+        self.assertEqual(seen, [3, 7, 9, 12, 15])
+
+    # matching and ranking use the indexed search_vector; snippets are only
+    # built outside the paged subquery, for the rows of the page
+    def test_full_text_search_query(self):
+        inner = FULL_TEXT_SEARCH_QUERY[FULL_TEXT_SEARCH_QUERY.index("FROM ("):]
+        self.assertIn("websearch_to_tsquery('english', %(query)s)", inner)
+        self.assertIn("search_vector @@ tsquery", inner)
+        self.assertIn("ts_rank_cd(search_vector, tsquery) AS rank", inner)
+        self.assertNotIn("ts_headline", inner)
+        self.assertIn("ORDER BY rank DESC, id\n        LIMIT %(limit)s OFFSET %(offset)s", inner)
+
+        query = scoped(FULL_TEXT_SEARCH_QUERY, "Sophie", named=True)
+        self.assertIn("WHERE search_vector @@ tsquery AND username = %(username)s", query)
+        self.assertIn("FROM read.bookclub_archive", with_archive(FULL_TEXT_SEARCH_QUERY))
+
+    def test_search_books_params(self):
+        cursor = mock.MagicMock()
+        cursor.fetchall.return_value = [(1, "Dune", "complete", 0.5, "<b>Dune</b>")]
+        pool = mock.MagicMock()
+        pool.cursor.return_value.__enter__.return_value = cursor
+        with mock.patch("src.database.read_pool", return_value=pool), \
+                mock.patch("src.database._archived", return_value=False):
+            hits = search_books('"desert planet" -sequel', limit=5, offset=10, username="Sophie")
+        query, params = cursor.execute.call_args.args
+        self.assertIn("AND username = %(username)s", query)
+        self.assertNotIn("read.bookclub_archive", query)
+        self.assertEqual(
+            params,
+            {"query": '"desert planet" -sequel', "limit": 5, "offset": 10, "username": "Sophie"},
+        )
+        self.assertEqual(hits[0].snippet, "<b>Dune</b>")
+
+    # every status is reported, with 0 for those without books
+    def test_reading_stats_result(self):
+        stats = reading_stats_result(({"complete": 2, "reading": 1}, [["2024-03", 2]], 70.5))
+        self.assertEqual(stats["status_counts"], {"reading": 1, "pending": 0, "complete": 2})
+        self.assertEqual(stats["completions_per_month"], [("2024-03", 2)])
+        self.assertEqual(stats["avg_pct_read"], 70.5)
+
+    def test_reading_stats_result_empty_range(self):
+        stats = reading_stats_result(({}, [], None))
+        self.assertEqual(stats["status_counts"], {"reading": 0, "pending": 0, "complete": 0})
+        self.assertEqual(stats["completions_per_month"], [])
+        self.assertIsNone(stats["avg_pct_read"])
+
+    def test_reading_stats(self):
+        aggregate_cache.clear()
+        self.addCleanup(aggregate_cache.clear)
+        cursor = mock.MagicMock()
+        cursor.fetchone.return_value = ({"pending": 3}, [], 0.0)
+        pool = mock.MagicMock()
+        pool.cursor.return_value.__enter__.return_value = cursor
+        with mock.patch("src.database.read_pool", return_value=pool), \
+                mock.patch("src.database._archived", return_value=True), \
+                mock.patch("src.database._cacheable", return_value=True):
+            stats = reading_stats("Sophie", date(2024, 1, 1))
+            self.assertEqual(reading_stats("Sophie", date(2024, 1, 1)), stats)
+        self.assertEqual(stats["status_counts"]["pending"], 3)
+        query, params = cursor.execute.call_args.args
+        self.assertIn("read.bookclub_archive", query)
+        self.assertEqual(
+            params, {"username": "Sophie", "start_date": date(2024, 1, 1), "end_date": None}
+        )
+        # the second call came from the cache
+        self.assertEqual(cursor.execute.call_count, 1)
+
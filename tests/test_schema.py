@@ -0,0 +1,22 @@
+import unittest
+from datetime import date
+from src.schema import Book, StatusEnum, book_row, json_default
+
+
+class TestSchema(unittest.TestCase):
+    # rows come in column order, with the status already a StatusEnum
+    def test_book_row(self):
+        make_row = book_row(None)
+        book = make_row((1, "Sophie", "Dune", None, StatusEnum.reading, 40,
+                         date(2024, 1, 2), None, None, None))
+        self.assertIsInstance(book, Book)
+        self.assertIs(book.status, StatusEnum.reading)
+        self.assertEqual((book.id, book.title, book.pct_read), (1, "Dune", 40))
+
+    def test_json_default(self):
+        self.assertEqual(json_default(date(2024, 1, 2)), "2024-01-02")
+        self.assertEqual(json_default(StatusEnum.complete), "complete")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import http.client
+import json
+import threading
+import unittest
+from unittest import mock
+
+try:
+    import psycopg as pg
+    from src.server import BookClubServer, _etag_matches
+except ImportError:  # psycopg is not installed
+    BookClubServer = None
+
+
+# requests that are answered before any query runs
+@unittest.skipIf(BookClubServer is None, "needs psycopg")
+class TestServer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = BookClubServer(("127.0.0.1", 0))
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def request(self, method, path, body=None):
+        conn = http.client.HTTPConnection(*self.server.server_address)
+        conn.request(method, path, body=body)
+        response = conn.getresponse()
+        data = json.loads(response.read() or b"null")
+        conn.close()
+        return response.status, data
+
+    def test_unknown_route(self):
+        self.assertEqual(self.request("GET", "/nope")[0], 404)
+
+    def test_wrong_method(self):
+        self.assertEqual(self.request("POST", "/books/1")[0], 405)
+
+    def test_invalid_book(self):
+        status, body = self.request("POST", "/books", b'{"title": "No owner"}')
+        self.assertEqual(status, 400)
+        self.assertIn("username", body["error"])
+        self.assertEqual(self.request("POST", "/books", b"not json")[0], 400)
+
+    def test_completed_range_needs_both_ends(self):
+        self.assertEqual(self.request("GET", "/counts/completed?start=2024-01-01")[0], 400)
+
+    # an error before the first row still gets a status of its own
+    def test_listing_error_before_first_row(self):
+        def books():
+            raise pg.OperationalError("server closed the connection")
+            yield
+
+        with mock.patch("src.server.db.iter_table", return_value=books()):
+            status, body = self.request("GET", "/books")
+        self.assertEqual(status, 503)
+        self.assertIn("error", body)
+
+    # once rows went out the stream is cut short, not followed by an error
+    def test_listing_error_mid_stream(self):
+        from src.schema import Book
+
+        def books():
+            yield Book(1, "a", "t", None, "pending", 0, None, None, None, None)
+            raise pg.OperationalError("server closed the connection")
+
+        conn = http.client.HTTPConnection(*self.server.server_address)
+        with mock.patch("src.server.db.iter_table", return_value=books()):
+            conn.request("GET", "/books")
+            response = conn.getresponse()
+            self.assertEqual(response.status, 200)
+            with self.assertRaises(http.client.IncompleteRead):
+                response.read()
+        conn.close()
+
+    # ?username= decides the owner of a created book
+    def test_create_scoped_to_user(self):
+        status, body = self.request(
+            "POST", "/books?username=Sophie", b'{"username": "Max", "title": "Dune"}'
+        )
+        self.assertEqual(status, 400)
+        with mock.patch("src.server.db.insert_data", return_value=7) as insert_data:
+            status, body = self.request("POST", "/books?username=Sophie", b'{"title": "Dune"}')
+        self.assertEqual((status, body), (201, {"id": 7}))
+        self.assertEqual(insert_data.call_args.args[0]["username"], "Sophie")
+
+    def test_stats_scoped_to_user(self):
+        with mock.patch("src.server.db.reading_stats") as reading_stats:
+            status, _ = self.request("GET", "/stats/Max?username=Sophie")
+        self.assertEqual(status, 404)
+        reading_stats.assert_not_called()
+
+    def test_unexpected_error(self):
+        with mock.patch("src.server.db.count_pending_books", side_effect=KeyError("id")), \
+                mock.patch.object(self.server.RequestHandlerClass, "log_error"):
+            status, body = self.request("GET", "/counts/pending")
+        self.assertEqual((status, body), (500, {"error": "internal server error"}))
+
+    # the unread body of a rejected request must not be read as the next one
+    def test_unread_body_closes_connection(self):
+        conn = http.client.HTTPConnection(*self.server.server_address)
+        conn.request("PATCH", "/nope", body=b'{"title": "GET /metrics HTTP/1.1"}')
+        response = conn.getresponse()
+        response.read()
+        self.assertEqual(response.status, 404)
+        self.assertEqual(response.getheader("Connection"), "close")
+        conn.request("GET", "/nope")
+        response = conn.getresponse()
+        response.read()
+        self.assertEqual(response.status, 404)
+        conn.close()
+
+    # entity tags are compared whole, not as substrings
+    def test_etag_matches(self):
+        etag = '"abc"'
+        self.assertTrue(_etag_matches('"abc"', etag))
+        self.assertTrue(_etag_matches('"x", W/"abc"', etag))
+        self.assertTrue(_etag_matches("*", etag))
+        self.assertFalse(_etag_matches('"abcd"', etag))
+        self.assertFalse(_etag_matches('"xabc", "abc"x', etag))
+        self.assertFalse(_etag_matches("", etag))
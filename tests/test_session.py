@@ -0,0 +1,116 @@
+import unittest
+from contextlib import contextmanager
+from unittest import mock
+from src.schema import validate_record
+from src.session import OperationResult, UnitOfWork
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = []
+
+    def execute(self, query, params):
+        if len(self.conn.executed) == self.conn.fail_at:
+            raise RuntimeError("statement failed")
+        self.rows = self.conn.returns[len(self.conn.executed)]
+        self.conn.executed.append((query, params))
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, returns, fail_at=None):
+        # rows returned by each statement, in order
+        self.returns = returns
+        self.fail_at = fail_at
+        self.executed = []
+        self.committed = self.rolled_back = False
+
+    @contextmanager
+    def pipeline(self):
+        yield
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        self.rolled_back = True
+
+
+def run(uow, conn):
+    pool = mock.MagicMock()
+    pool.connection.return_value.__enter__.return_value = conn
+    with mock.patch("src.session.Database", return_value=pool), \
+            mock.patch("src.session._wrote") as wrote:
+        uow.run()
+    return wrote
+
+
+BOOK = validate_record({"username": "Sophie", "title": "Dune"})
+
+
+class TestUnitOfWork(unittest.TestCase):
+    # statements go out in the order they were queued
+    def test_order(self):
+        conn = FakeConnection([[(7,)], [(7,)], [(8,)]])
+        uow = UnitOfWork()
+        uow.insert(BOOK)
+        uow.update(7, "status", "reading")
+        uow.delete(8)
+        run(uow, conn)
+        self.assertEqual(
+            [query.split()[0] for query, _ in conn.executed], ["INSERT", "UPDATE", "DELETE"]
+        )
+        self.assertEqual([r.name for r in uow.results], ["insert", "update", "delete"])
+        self.assertTrue(conn.committed)
+
+    # a Ref is replaced by the result it stands for, also inside the
+    # id arrays of update_many and delete_many
+    def test_refs(self):
+        conn = FakeConnection([[(7,)], [(7,)], [(7,)], [(7,)]])
+        uow = UnitOfWork()
+        book_id = uow.insert(BOOK)
+        uow.update(book_id, "pct_read", 10)
+        uow.update_many([{"id": book_id, "pct_read": 20}])
+        uow.delete_many([book_id])
+        wrote = run(uow, conn)
+        self.assertEqual(conn.executed[1][1], [10, 7])
+        self.assertEqual(conn.executed[2][1], [[7], [20]])
+        self.assertEqual(conn.executed[3][1], [[7]])
+        self.assertEqual(uow.results[2], OperationResult("update_many", [7]))
+        self.assertEqual(list(wrote.call_args.args[0]), [7, 7, 7])
+
+    # a Ref to a batch result stands for all of its ids
+    def test_ref_to_batch(self):
+        conn = FakeConnection([[(7,), (8,)], [(7,), (8,)]])
+        uow = UnitOfWork()
+        [updated] = uow.update_many([{"id": 7, "pct_read": 20}, {"id": 8, "pct_read": 20}])
+        uow.delete_many(updated)
+        run(uow, conn)
+        self.assertEqual(conn.executed[1][1], [[7, 8]])
+
+    def test_rollback_on_failure(self):
+        conn = FakeConnection([[(7,)], [(7,)]], fail_at=1)
+        uow = UnitOfWork()
+        uow.insert(BOOK)
+        uow.delete(7)
+        with self.assertRaises(RuntimeError):
+            run(uow, conn)
+        self.assertTrue(conn.rolled_back)
+        self.assertFalse(conn.committed)
+        self.assertEqual(uow.results, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+import unittest
+from src.util import ROOT_DIR
+
+# cold start budget for importing the entry points, in milliseconds
+BUDGET_MS = float(os.environ.get("READAPP_IMPORT_BUDGET_MS", 150))
+# only loaded once a command actually needs them
+HEAVY_MODULES = ("psycopg", "psycopg_pool", "environ", "tabulate", "tqdm")
+
+
+def run_python(*args: str) -> subprocess.CompletedProcess:
+    # fresh interpreter each time, so nothing is already imported
+    return subprocess.run(
+        [sys.executable, *args], cwd=ROOT_DIR, capture_output=True, text=True, check=True
+    )
+
+
+def import_time_ms(module: str) -> float:
+    # -X importtime lines: "import time: self [us] | cumulative | module"
+    result = run_python("-X", "importtime", "-c", f"import {module}")
+    for line in result.stderr.splitlines():
+        parts = [p.strip() for p in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1]) / 1000
+    raise AssertionError(f"{module} missing from -X importtime output")
+
+
+class TestStartup(unittest.TestCase):
+    def test_cli_import_budget(self):
+        self.assertLess(import_time_ms("src.cli"), BUDGET_MS)
+
+    def test_app_import_budget(self):
+        self.assertLess(import_time_ms("src.app"), BUDGET_MS)
+
+    # heavy dependencies and .env parsing stay out of the import path
+    def test_no_heavy_imports(self):
+        code = (
+            "import sys, src.app, src.cli, src.database;"
+            f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+        )
+        self.assertEqual(run_python("-c", code).stdout.strip(), "")
@@ -0,0 +1,70 @@
+import unittest
+from unittest import mock
+from src.database import iter_table
+from src.queries import BOOK_COLUMN_NAMES
+from src.schema import book_row
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.fetches = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params):
+        self.query, self.params = query, params
+        self.description = [(name,) for name in BOOK_COLUMN_NAMES]
+
+    def fetchmany(self, size):
+        self.fetches.append(size)
+        page, self.rows = self.rows[:size], self.rows[size:]
+        return page
+
+
+def stream(rows, **kwargs):
+    cursor = FakeCursor(rows)
+    conn = mock.MagicMock()
+    conn.cursor.return_value = cursor
+    pool = mock.MagicMock()
+    pool.connection.return_value.__enter__.return_value = conn
+    with mock.patch("src.database.read_pool", return_value=pool):
+        books = list(iter_table(**kwargs))
+    return books, conn, cursor
+
+
+def row(book_id):
+    return (book_id, "Sophie", f"Book {book_id}", None, "pending", 0, None, None, None, None)
+
+
+class TestStreamPages(unittest.TestCase):
+    # a named cursor makes it server-side, pulled in pages of fetch_size
+    def test_named_cursor_in_pages(self):
+        rows = [row(i) for i in range(5)]
+        books, conn, cursor = stream(rows, fetch_size=2)
+        self.assertEqual(books, rows)
+        self.assertEqual(conn.cursor.call_args.kwargs["name"], "bookclub_stream")
+        self.assertIs(conn.cursor.call_args.kwargs["row_factory"], book_row)
+        self.assertEqual(cursor.itersize, 2)
+        # three pages, then the empty fetch that ends the stream
+        self.assertEqual(cursor.fetches, [2, 2, 2, 2])
+
+    def test_scoped_to_user(self):
+        _, _, cursor = stream([], fetch_size=10, username="Sophie")
+        self.assertIn("AND username = %s", cursor.query)
+        self.assertEqual(list(cursor.params), ["Sophie"])
+        self.assertEqual(cursor.fetches, [10])
+
+    # without fetch_size the db_fetch_size setting applies
+    def test_default_fetch_size(self):
+        with mock.patch("src.database.default_fetch_size", return_value=3):
+            _, _, cursor = stream([row(1)])
+        self.assertEqual(cursor.itersize, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+from unittest import mock
+from src.database import sync_many
+
+
+def book(title, pct_read=0):
+    return {"username": "Sophie", "title": title, "status": "reading", "pct_read": pct_read}
+
+
+class TestSync(unittest.TestCase):
+    def sync(self, records, returned):
+        conn = mock.MagicMock()
+        conn.cursor.return_value.__enter__.return_value.fetchall.return_value = returned
+        pool = mock.MagicMock()
+        pool.connection.return_value.__enter__.return_value = conn
+        with mock.patch("src.database.Database", return_value=pool), mock.patch(
+            "src.database._wrote"
+        ):
+            return sync_many(records)
+
+    # a merged duplicate or an archived book is not "unchanged"
+    def test_counts_duplicates_and_archived(self):
+        records = [book("Dune"), book("Dune", 40), book("Emma"), book("Ulysses"), book("Kim")]
+        report = self.sync(records, [(1, True), (2, False), (None, None)])
+        self.assertEqual(report.inserted_ids, [1])
+        self.assertEqual(report.updated_ids, [2])
+        self.assertEqual(report.duplicates, 1)
+        self.assertEqual(report.archived, 1)
+        self.assertEqual(report.unchanged, 1)
+        self.assertEqual(report.errors, [])
+
+    def test_invalid_record_is_a_row_error(self):
+        report = self.sync([book("Dune"), {"username": "Sophie"}], [(1, True)])
+        self.assertEqual([e.row for e in report.errors], [2])
+        self.assertEqual(report.unchanged, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()